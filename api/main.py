@@ -1,5 +1,8 @@
 import os
+import json
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'  # Fix OpenMP conflict 
+import threading
+from contextlib import asynccontextmanager
 from typing import List, Optional, Any, Dict
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.responses import JSONResponse, HTMLResponse
@@ -17,6 +20,11 @@ from src.document_analyzer.data_analysis import DocumentAnalyzer
 from src.document_compare.document_comparator import DocumentComparatorLLM
 from src.document_chat.retrieval import ConversationalRAG
 from utils.document_ops import FastAPIFileAdapter,read_pdf_via_handler
+from utils.ocr_content_extractor import warm_up_ocr
+from utils.ocr_cache import ocr_cache_stats
+from src.document_chat.answer_cache import answer_cache_stats
+from src.document_chat.retrieval_cache import retrieval_cache_stats
+from utils.metadata_index import validate_filter
 from logger import GLOBAL_LOGGER as log
 
 from langchain_community.cache import SQLiteCache
@@ -34,8 +42,16 @@ set_llm_cache(SQLiteCache(database_path=str(CACHE_DB_PATH)))
 FAISS_BASE = os.getenv("FAISS_BASE", "faiss_index")
 UPLOAD_BASE = os.getenv("UPLOAD_BASE", "data")
 FAISS_INDEX_NAME = os.getenv("FAISS_INDEX_NAME", "index")  # <--- keep consistent with save_local()
+OCR_WARMUP = os.getenv("OCR_WARMUP", "false").lower() == "true"  # preload EasyOCR models at startup
 
-app = FastAPI(title="Document Portal API", version="0.1")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if OCR_WARMUP:
+        # background thread: startup and /health stay fast, first OCR request waits on the reader lock
+        threading.Thread(target=warm_up_ocr, name="ocr-warmup", daemon=True).start()
+    yield
+
+app = FastAPI(title="Document Portal API", version="0.1", lifespan=lifespan)
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
@@ -61,6 +77,11 @@ def health() -> Dict[str, str]:
     log.info("Health check passed.")
     return {"status": "ok", "service": "document-portal"}
 
+@app.get("/metrics") # in-process cache counters (hit rates) for dashboards / debugging
+def metrics() -> Dict[str, Any]:
+    return {"ocr_cache": ocr_cache_stats(), "answer_cache": answer_cache_stats(),
+            "retrieval_cache": retrieval_cache_stats()}
+
 # ---------- ANALYZE ----------
 @app.post("/analyze")
 async def analyze_document(file: UploadFile = File(...)) -> Any:
@@ -71,7 +92,7 @@ async def analyze_document(file: UploadFile = File(...)) -> Any:
         saved_path = dh.save_pdf(FastAPIFileAdapter(file))
         text = read_pdf_via_handler(dh, saved_path)
         analyzer = DocumentAnalyzer()
-        result = analyzer.analyze_document(text)
+        result = await analyzer.aanalyze_document(text)
         log.info("Document analysis complete.")
         return JSONResponse(content=result)
     except HTTPException:
@@ -92,7 +113,7 @@ async def compare_documents(reference: UploadFile = File(...), actual: UploadFil
         # _ = ref_path, act_path
         combined_text = dc.combine_documents()
         comp = DocumentComparatorLLM()
-        df = comp.compare_documents(combined_text)
+        df = await comp.acompare_documents(combined_text)
         log.info("Document comparison completed.")
         return {"rows": df.to_dict(orient="records"), "session_id": dc.session_id}
     except HTTPException:
@@ -164,19 +185,30 @@ async def chat_query(
     session_id: Optional[str] = Form(None),
     use_session_dirs: bool = Form(True),
     k: int = Form(5),
+    # JSON metadata filter applied before the vector search, e.g. {"type": "tables"} or
+    # {"file": "report.pdf", "page": {"gte": 10, "lte": 20}}
+    filters: Optional[str] = Form(None),
 ) -> Any:
     try:
         log.info(f"Received chat query: '{question}' | session: {session_id}")
         if use_session_dirs and not session_id:
             raise HTTPException(status_code=400, detail="session_id is required when use_session_dirs=True")
+        search_kwargs: Dict[str, Any] = {"k": k}
+        if filters:
+            try:
+                metadata_filter = validate_filter(json.loads(filters))
+            except ValueError as e:  # also json.JSONDecodeError
+                raise HTTPException(status_code=400, detail=f"Invalid filters: {e}")
+            search_kwargs["metadata_filter"] = metadata_filter
 
         index_dir = os.path.join(FAISS_BASE, session_id) if use_session_dirs else FAISS_BASE  # type: ignore
         if not os.path.isdir(index_dir):
             raise HTTPException(status_code=404, detail=f"FAISS index not found at: {index_dir}")
 
         rag = ConversationalRAG(session_id=session_id)
-        rag.load_retriever_from_faiss(index_dir, k=k, index_name=FAISS_INDEX_NAME)  # build retriever + chain
-        response = rag.invoke(question, chat_history=[])
+        await rag.aload_retriever_from_faiss(index_dir, k=k, index_name=FAISS_INDEX_NAME,
+                                             search_kwargs=search_kwargs)  # build retriever + chain
+        response = await rag.ainvoke(question, chat_history=[])
         log.info("Chat query handled successfully.")
 
         return {
@@ -191,6 +223,38 @@ async def chat_query(
         log.exception("Chat query failed")
         raise HTTPException(status_code=500, detail=f"Query failed: {e}")
 
+# ---------- CHAT: QUERY ACROSS SESSIONS ----------
+@app.post("/chat/query_multi") # one question over several session indexes, one merged answer
+async def chat_query_multi(
+    question: str = Form(...),
+    session_ids: List[str] = Form(...),
+    k: int = Form(5),
+) -> Any:
+    try:
+        log.info(f"Received multi-index chat query: '{question}' | sessions: {session_ids}")
+        index_dirs = [os.path.join(FAISS_BASE, sid) for sid in session_ids]
+        missing = [d for d in index_dirs if not os.path.isdir(d)]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"FAISS index not found at: {missing}")
+
+        # the answer cache is keyed by the session set, so it is only reused for the same combination
+        rag = ConversationalRAG(session_id="+".join(sorted(set(session_ids))))
+        await rag.aload_retriever_from_faiss_indexes(index_dirs, k=k, index_name=FAISS_INDEX_NAME)
+        response = await rag.ainvoke(question, chat_history=[])
+        log.info("Multi-index chat query handled successfully.", sessions=len(session_ids))
+
+        return {
+            "answer": response,
+            "session_ids": session_ids,
+            "k": k,
+            "engine": "LCEL-RAG-multi"
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.exception("Multi-index chat query failed")
+        raise HTTPException(status_code=500, detail=f"Query failed: {e}")
+
 # command for executing the fast api
 # uvicorn api.main:app --port 8080 --reload    
 #uvicorn api.main:app --host 0.0.0.0 --port 8080 --reload
\ No newline at end of file
@@ -0,0 +1,77 @@
+"""
+Benchmark: single-pass DOCX extraction vs Docx2txtLoader + two python-docx passes.
+
+    python -m benchmarks.bench_docx_extraction path/to/big.docx [--repeat 3]
+    python -m benchmarks.bench_docx_extraction --synthetic-tables 300
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from docx import Document as DocxDocument
+from langchain_community.document_loaders import Docx2txtLoader
+from utils.docx_extractor import extract_docx
+
+
+def make_synthetic_docx(tables: int, out_path: Path, rows: int = 12, cols: int = 5) -> Path:
+    """Report-style DOCX: a heading, a few paragraphs and a table per section."""
+    doc = DocxDocument()
+    for t in range(tables):
+        doc.add_heading(f"Section {t + 1}", level=2)
+        for j in range(3):
+            doc.add_paragraph(f"Paragraph {j} of section {t + 1}: lorem ipsum dolor sit amet, consectetur adipiscing.")
+        table = doc.add_table(rows=rows, cols=cols)
+        for r, row in enumerate(table.rows):
+            for c, cell in enumerate(row.cells):
+                cell.text = f"s{t}r{r}c{c}"
+    doc.save(out_path)
+    return out_path
+
+
+def legacy_passes(docx_path: str) -> tuple:
+    """What load_documents used to do: text loader, image walk, table walk (three parses)."""
+    text_docs = Docx2txtLoader(docx_path).load()
+    images = [rel.target_part.blob for rel in DocxDocument(docx_path).part.rels.values() if "image" in rel.target_ref]
+    tables = [[[cell.text.strip() for cell in row.cells] for row in table.rows]
+              for table in DocxDocument(docx_path).tables]
+    return text_docs, images, tables
+
+
+def _time(fn, repeat: int) -> tuple:
+    runs, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs), result
+
+
+def run(docx_path: Path, repeat: int) -> None:
+    legacy_s, (_, _, legacy_tables) = _time(lambda: legacy_passes(str(docx_path)), repeat)
+    single_s, extraction = _time(lambda: extract_docx(str(docx_path)), repeat)
+    size_mb = docx_path.stat().st_size / 1e6
+    print(f"file: {docx_path} ({size_mb:.1f} MB, median of {repeat})")
+    print(f"  Docx2txtLoader + 2x python-docx : {legacy_s:8.3f}s  tables={len(legacy_tables)}")
+    print(f"  extract_docx (single parse)     : {single_s:8.3f}s  tables={len(extraction.tables)} "
+          f"paragraphs={len(extraction.paragraphs)} images={len(extraction.images)}")
+    print(f"  speedup: {legacy_s / single_s:.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("docx", nargs="*", type=Path)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--synthetic-tables", type=int, default=0, help="generate a synthetic DOCX with N tables")
+    args = parser.parse_args()
+
+    files = list(args.docx)
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.synthetic_tables or not files:
+            files.append(make_synthetic_docx(args.synthetic_tables or 200, Path(tmp) / "synthetic.docx"))
+        for path in files:
+            run(path, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark: OCR image hand-off via temp PNG files vs in-memory pixel arrays.
+
+Times what happens between rendering a page and the OCR model seeing pixels:
+  old: pixmap -> PNG encode -> temp file write -> read + decode (as EasyOCR does for paths) -> unlink
+  new: pixmap samples -> NumPy array
+Use --with-ocr to include EasyOCR inference itself (downloads models on first use).
+
+    python -m benchmarks.bench_ocr_inmemory path/to/scan.pdf --pages 50
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+import cv2
+import fitz  # PyMuPDF
+from utils.ocr_content_extractor import EmbeddedContentExtractor
+
+DEFAULT_PDF = Path(__file__).resolve().parents[1] / "deepeval_evaluation" / "sample.pdf"
+
+
+def via_temp_file(pix: "fitz.Pixmap", reader=None):
+    tmp = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
+    try:
+        tmp.write(pix.tobytes("png"))
+        tmp.close()
+        if reader is not None:
+            return reader.readtext(tmp.name, detail=0)
+        return cv2.imread(tmp.name, cv2.IMREAD_COLOR)
+    finally:
+        os.unlink(tmp.name)
+
+
+def in_memory(pix: "fitz.Pixmap", reader=None):
+    arr = EmbeddedContentExtractor._pixmap_to_array(pix)
+    if reader is not None:
+        return reader.readtext(arr, detail=0)
+    return arr
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", nargs="?", type=Path, default=DEFAULT_PDF)
+    parser.add_argument("--pages", type=int, default=0, help="limit number of pages (0 = all)")
+    parser.add_argument("--zoom", type=float, default=2.0)
+    parser.add_argument("--with-ocr", action="store_true", help="run EasyOCR on both paths")
+    args = parser.parse_args()
+
+    reader = None
+    if args.with_ocr:
+        import easyocr
+        reader = easyocr.Reader(["en"], gpu=False)
+
+    with fitz.open(args.pdf) as doc:
+        pixmaps = [page.get_pixmap(matrix=fitz.Matrix(args.zoom, args.zoom))
+                   for i, page in enumerate(doc) if not args.pages or i < args.pages]
+
+    results = {}
+    for name, fn in (("temp PNG file", via_temp_file), ("in-memory array", in_memory)):
+        start = time.perf_counter()
+        for pix in pixmaps:
+            fn(pix, reader)
+        results[name] = (time.perf_counter() - start) / len(pixmaps)
+
+    print(f"file: {args.pdf} ({len(pixmaps)} pages at {args.zoom}x, OCR {'on' if reader else 'off'})")
+    for name, per_page in results.items():
+        print(f"  {name:16s}: {per_page * 1000:8.2f} ms/page")
+    old, new = results["temp PNG file"], results["in-memory array"]
+    print(f"  saving: {(old - new) * 1000:.2f} ms/page ({old / new:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark: PDF table engines (camelot, PyMuPDF find_tables, PyMuPDF with camelot fallback).
+
+    python -m benchmarks.bench_table_engines path/to/a.pdf path/to/b.pdf [--repeat 3]
+    python -m benchmarks.bench_table_engines --synthetic-pages 100
+
+Recall is measured per page: against the known table pages for the synthetic corpus,
+otherwise against the union of pages any engine found a table on.
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+import fitz  # PyMuPDF
+from utils.ocr_content_extractor import EmbeddedContentExtractor, TABLE_BACKEND_CAMELOT, TABLE_BACKEND_PYMUPDF
+from utils.pdf_extractor import extract_pdf
+
+DEFAULT_PDF = Path(__file__).resolve().parents[1] / "deepeval_evaluation" / "sample.pdf"
+
+ENGINES = {
+    "camelot": {"backend": TABLE_BACKEND_CAMELOT},
+    "pymupdf": {"backend": TABLE_BACKEND_PYMUPDF, "camelot_fallback": False},
+    "pymupdf+camelot": {"backend": TABLE_BACKEND_PYMUPDF, "camelot_fallback": True},
+}
+
+
+def make_synthetic_pdf(pages: int, out_path: Path) -> Set[int]:
+    """Prose pages with a bordered table every 5th page and a borderless one every 7th; returns table pages."""
+    doc = fitz.open()
+    table_pages = set()
+    for i in range(pages):
+        page = doc.new_page()
+        body = "\n".join(f"Line {j} of page {i + 1}: lorem ipsum dolor sit amet, consectetur adipiscing elit."
+                         for j in range(30))
+        page.insert_text((50, 60), body, fontsize=9)
+        if i % 5 == 1:
+            for r in range(6):
+                for c in range(4):
+                    rect = fitz.Rect(50 + c * 120, 500 + r * 20, 170 + c * 120, 520 + r * 20)
+                    page.draw_rect(rect, width=0.5)
+                    page.insert_text((rect.x0 + 4, rect.y0 + 14), f"r{r}c{c}", fontsize=8)
+            table_pages.add(i + 1)
+        elif i % 7 == 3:
+            for r in range(6):
+                for c in range(4):
+                    page.insert_text((50 + c * 120, 500 + r * 16), f"item{r}-{c}", fontsize=9)
+            table_pages.add(i + 1)
+    doc.save(out_path)
+    doc.close()
+    return table_pages
+
+
+def _run_engine(pdf_path: Path, settings: dict, repeat: int) -> tuple:
+    extractor = EmbeddedContentExtractor()
+    extractor.tables_config.update(settings)
+    runs, docs = [], []
+    for _ in range(repeat):
+        extraction = extract_pdf(str(pdf_path))  # shared pre-screen, not timed
+        start = time.perf_counter()
+        docs = extractor.extract_tables_from_pdf(str(pdf_path), extraction=extraction)
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs), docs
+
+
+def run(pdf_path: Path, repeat: int, truth: Optional[Set[int]] = None) -> None:
+    results: Dict[str, tuple] = {name: _run_engine(pdf_path, settings, repeat) for name, settings in ENGINES.items()}
+    found: Dict[str, Set[int]] = {name: {d.metadata["page"] for d in docs} for name, (_, docs) in results.items()}
+    reference = truth if truth is not None else set().union(*found.values())
+
+    print(f"file: {pdf_path} (median of {repeat}, {len(reference)} table pages "
+          f"{'known' if truth is not None else 'found by any engine'})")
+    baseline_s = results["camelot"][0]
+    for name, (seconds, docs) in results.items():
+        recall = len(found[name] & reference) / len(reference) if reference else 1.0
+        engines: List[str] = sorted({d.metadata["engine"] for d in docs})
+        print(f"  {name:<16}: {seconds:8.3f}s  tables={len(docs):4d}  page_recall={recall:6.1%}  "
+              f"speedup={baseline_s / seconds if seconds else float('inf'):5.1f}x  engines={','.join(engines) or '-'}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*", type=Path)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--synthetic-pages", type=int, default=0, help="generate a synthetic PDF with N pages")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.synthetic_pages:
+            synthetic = Path(tmp) / "synthetic.pdf"
+            run(synthetic, args.repeat, truth=make_synthetic_pdf(args.synthetic_pages, synthetic))
+        for pdf in args.pdfs or ([] if args.synthetic_pages else [DEFAULT_PDF]):
+            run(pdf, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
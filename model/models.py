@@ -26,6 +26,8 @@ class SummaryResponse(RootModel[list[ChangeFormat]]):
 class PromptType(str, Enum): 
     DOCUMENT_ANALYSIS = "document_analysis"
     DOCUMENT_COMPARISON = "document_comparison"
+    DOCUMENT_MAP = "document_map"
+    DOCUMENT_REDUCE = "document_reduce"
     CONTEXTUALIZE_QUESTION = "contextualize_question"
     CONTEXT_QA = "context_qa"
     # use case: PROMPT_REGISTRY[PromptType.CONTEXTUALIZE_QUESTION.value]
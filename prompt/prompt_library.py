@@ -13,6 +13,33 @@ Analyze this document:
 # format instruction is coming from the parser and combined docs is prepared by us in data_ingestion
 # (PDF texts are extracted and concatenated)
 
+# Map-reduce analysis of large documents: each page group is condensed into notes (map),
+# then the notes are merged into the analysis schema (reduce)
+document_map_prompt = ChatPromptTemplate.from_template("""
+You are analyzing one part ({page_range}) of a larger document.
+Write concise notes on this part:
+- the main points, as short bullet points
+- any title, author, publisher, creation or modification date you can see
+- the language and overall tone
+
+Do not guess about the rest of the document.
+
+Document part:
+{document_text}
+""")
+
+document_reduce_prompt = ChatPromptTemplate.from_template("""
+You are a highly capable assistant trained to analyze and summarize documents.
+Below are notes taken on consecutive parts of one document ({page_count} pages in total).
+Combine them into a single analysis of the whole document.
+Return ONLY valid JSON matching the exact schema below.
+
+{format_instructions}
+
+Notes:
+{section_notes}
+""")
+
 # Prompt for document comparison
 document_comparison_prompt = ChatPromptTemplate.from_template("""
 You will be provided with content from two PDFs. Your tasks are as follows:
@@ -57,6 +84,8 @@ context_qa_prompt = ChatPromptTemplate.from_messages([
 PROMPT_REGISTRY = {
     "document_analysis": document_analysis_prompt,
     "document_comparison": document_comparison_prompt,
+    "document_map": document_map_prompt,
+    "document_reduce": document_reduce_prompt,
     "contextualize_question": contextualize_question_prompt,
     "context_qa": context_qa_prompt,
 }
@@ -1,13 +1,68 @@
 import os
+import re
 import sys
+from functools import cached_property
+from typing import List, Optional, Tuple
 from utils.model_loader import ModelLoader
+from utils.config_loader import load_config
+from utils.embedding_scheduler import estimate_tokens
 from logger import GLOBAL_LOGGER as log
 from exception.custom_exception import DocumentPortalException
 from model.models import *
-from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 from langchain.output_parsers import OutputFixingParser
 from prompt.prompt_library import PROMPT_REGISTRY # type: ignore
 
+DEFAULT_ANALYSIS = {
+    "map_reduce_threshold_tokens": 12000,
+    "pages_per_group": 10,
+    "max_group_tokens": 6000,
+    "max_concurrency": 4,
+    "max_reduce_tokens": 8000,
+}
+
+_PAGE_MARKER = re.compile(r"---\s*Page\s+(\d+)\s*---")
+
+
+def split_page_groups(document_text: str, pages_per_group: int, max_group_tokens: int) -> List[Tuple[str, str]]:
+    """
+    Split text carrying "--- Page N ---" markers (DocHandler.read_pdf) into groups of
+    consecutive pages: at most `pages_per_group` pages, closed early at `max_group_tokens`.
+    Returns (label, text) pairs, e.g. ("pages 1-10", ...). Text without markers is cut into
+    equal character windows.
+    """
+    parts = _PAGE_MARKER.split(document_text)
+    if len(parts) < 3:
+        window = max_group_tokens * 4
+        chunks = [document_text[i:i + window] for i in range(0, len(document_text), window)] or [""]
+        return [(f"part {i + 1} of {len(chunks)}", chunk) for i, chunk in enumerate(chunks)]
+
+    pages = [(int(number), f"--- Page {number} ---\n{text.strip()}") for number, text in zip(parts[1::2], parts[2::2])]
+    groups: List[Tuple[str, str]] = []
+    current: List[Tuple[int, str]] = []
+    tokens = 0
+    for number, text in pages:
+        page_tokens = estimate_tokens(text)
+        if current and (len(current) >= pages_per_group or tokens + page_tokens > max_group_tokens):
+            groups.append((current[0][0], current[-1][0], "\n\n".join(t for _, t in current)))
+            current, tokens = [], 0
+        current.append((number, text))
+        tokens += page_tokens
+    if current:
+        groups.append((current[0][0], current[-1][0], "\n\n".join(t for _, t in current)))
+    return [(f"page {first}" if first == last else f"pages {first}-{last}", text) for first, last, text in groups]
+
+
+def _span_label(labels: List[str]) -> str:
+    """Label covering consecutive groups, e.g. "pages 1-10" + "pages 11-20" -> "pages 1-20"."""
+    if len(labels) == 1:
+        return labels[0]
+    first, last = re.findall(r"\d+", labels[0]), re.findall(r"\d+", labels[-1])
+    if labels[0].startswith("page") and first and last:
+        return f"pages {first[0]}-{last[-1]}"
+    return f"{labels[0]} to {labels[-1]}"
+
+
 class DocumentAnalyzer:
     """
     Analyzes documents using a pre-trained model.
@@ -23,6 +78,9 @@ class DocumentAnalyzer:
             self.fixing_parser = OutputFixingParser.from_llm(parser=self.parser, llm=self.llm)
             
             self.prompt = PROMPT_REGISTRY["document_analysis"]
+            self.map_prompt = PROMPT_REGISTRY[PromptType.DOCUMENT_MAP.value]
+            self.reduce_prompt = PROMPT_REGISTRY[PromptType.DOCUMENT_REDUCE.value]
+            self.settings = {**DEFAULT_ANALYSIS, **(load_config().get("analysis") or {})}
             
             log.info("DocumentAnalyzer initialized successfully")
             
@@ -33,26 +91,116 @@ class DocumentAnalyzer:
         
         
     
+    # Chains are composed on first use and shared by the sync and async paths
+    @cached_property
+    def chain(self):
+        return self.prompt | self.llm | self.fixing_parser
+
+    @cached_property
+    def map_chain(self):
+        return self.map_prompt | self.llm | StrOutputParser()
+
+    @cached_property
+    def reduce_chain(self):
+        return self.reduce_prompt | self.llm | self.fixing_parser
+
+    def _needs_map_reduce(self, document_text: str) -> bool:
+        return estimate_tokens(document_text) > self.settings["map_reduce_threshold_tokens"]
+
+    def _map_inputs(self, document_text: str) -> List[dict]:
+        groups = split_page_groups(document_text, self.settings["pages_per_group"], self.settings["max_group_tokens"])
+        log.info("Map-reduce analysis", groups=len(groups), tokens=estimate_tokens(document_text),
+                 max_concurrency=self.settings["max_concurrency"])
+        return [{"page_range": label, "document_text": text} for label, text in groups]
+
+    def _map_config(self) -> dict:
+        return {"max_concurrency": self.settings["max_concurrency"]}
+
+    @staticmethod
+    def _format_notes(map_inputs: List[dict], notes: List[str]) -> List[str]:
+        return [f"[{i['page_range']}]\n{n.strip()}" for i, n in zip(map_inputs, notes)]
+
+    def _collapse_inputs(self, map_inputs: List[dict], notes: List[str]) -> Optional[List[dict]]:
+        """
+        Inputs for another condensing round over the notes, or None once they fit one reduce
+        call (`max_reduce_tokens`). Consecutive notes are grouped up to the budget, at least
+        two per group, so every round shrinks the set.
+        """
+        budget = self.settings["max_reduce_tokens"]
+        formatted = self._format_notes(map_inputs, notes)
+        if len(formatted) <= 1 or estimate_tokens("\n\n".join(formatted)) <= budget:
+            return None
+        groups: List[List[int]] = []
+        tokens = 0
+        for i, note in enumerate(formatted):
+            note_tokens = estimate_tokens(note)
+            if groups and (len(groups[-1]) < 2 or tokens + note_tokens <= budget):
+                groups[-1].append(i)
+                tokens += note_tokens
+            else:
+                groups.append([i])
+                tokens = note_tokens
+        if len(groups) > 1 and len(groups[-1]) == 1:  # a lone trailing note joins the previous group
+            groups[-2].extend(groups.pop())
+        log.info("Map-reduce notes over budget, condensing again", notes=len(formatted), groups=len(groups),
+                 max_reduce_tokens=budget)
+        return [{"page_range": _span_label([map_inputs[i]["page_range"] for i in group]),
+                 "document_text": "\n\n".join(formatted[i] for i in group)} for group in groups]
+
+    def _reduce_inputs(self, document_text: str, map_inputs: List[dict], notes: List[str]) -> dict:
+        pages = _PAGE_MARKER.findall(document_text)
+        return {
+            "format_instructions": self.parser.get_format_instructions(),
+            "page_count": len(pages) if pages else "unknown",
+            "section_notes": "\n\n".join(self._format_notes(map_inputs, notes)),
+        }
+
+    def _analysis_inputs(self, document_text: str) -> dict:
+        return {"format_instructions": self.parser.get_format_instructions(), "document_text": document_text}
+
     def analyze_document(self, document_text:str)-> dict:
         """
         Analyze a document's text and extract structured metadata & summary.
+        Large documents are analyzed map-reduce style (see analysis settings in config).
         """
         try:
-            chain = self.prompt | self.llm | self.fixing_parser
-            
-            log.info("Meta-data analysis chain initialized")
+            if not self._needs_map_reduce(document_text):
+                response = self.chain.invoke(self._analysis_inputs(document_text))
+                log.info("Metadata extraction successful", keys=list(response.keys()))
+                return response
 
-            response = chain.invoke({
-                "format_instructions": self.parser.get_format_instructions(),
-                "document_text": document_text
-            })
+            inputs = self._map_inputs(document_text)
+            notes = self.map_chain.batch(inputs, config=self._map_config())
+            while (collapsed := self._collapse_inputs(inputs, notes)) is not None:
+                inputs = collapsed
+                notes = self.map_chain.batch(inputs, config=self._map_config())
+            response = self.reduce_chain.invoke(self._reduce_inputs(document_text, inputs, notes))
+            log.info("Metadata extraction successful", keys=list(response.keys()), mode="map_reduce")
+            return response
 
-            log.info("Metadata extraction successful", keys=list(response.keys()))
-            
+        except Exception as e:
+            log.error("Metadata analysis failed", error=str(e))
+            raise DocumentPortalException("Metadata extraction failed",sys)
+
+    async def aanalyze_document(self, document_text:str)-> dict:
+        """
+        Async variant of analyze_document: awaits the LLM instead of blocking a thread on it.
+        """
+        try:
+            if not self._needs_map_reduce(document_text):
+                response = await self.chain.ainvoke(self._analysis_inputs(document_text))
+                log.info("Metadata extraction successful", keys=list(response.keys()))
+                return response
+
+            inputs = self._map_inputs(document_text)
+            notes = await self.map_chain.abatch(inputs, config=self._map_config())
+            while (collapsed := self._collapse_inputs(inputs, notes)) is not None:
+                inputs = collapsed
+                notes = await self.map_chain.abatch(inputs, config=self._map_config())
+            response = await self.reduce_chain.ainvoke(self._reduce_inputs(document_text, inputs, notes))
+            log.info("Metadata extraction successful", keys=list(response.keys()), mode="map_reduce")
             return response
 
         except Exception as e:
             log.error("Metadata analysis failed", error=str(e))
             raise DocumentPortalException("Metadata extraction failed",sys)
-        
-    
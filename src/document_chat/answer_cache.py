@@ -0,0 +1,102 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence
+import numpy as np
+from logger import GLOBAL_LOGGER as log
+
+
+def index_version(index_path: str, index_name: str = "index") -> Optional[str]:
+    """Cheap fingerprint of a saved FAISS index: changes whenever the index file is rewritten."""
+    try:
+        stat = os.stat(os.path.join(index_path, f"{index_name}.faiss"))
+    except OSError:
+        return None
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by question embedding. A lookup hits when a cached question has cosine
+    similarity >= `similarity_threshold` to the new one and was answered against the same
+    index version. Entries expire after `ttl_seconds`; beyond `max_entries` the least
+    recently used entry is evicted. Thread-safe.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, ttl_seconds: float = 3600, max_entries: int = 256):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()  # id -> (unit vector, answer, version, created)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else v
+
+    def _expire(self, now: float) -> None:
+        stale = [key for key, (_, _, _, created) in self._entries.items() if now - created > self.ttl_seconds]
+        for key in stale:
+            del self._entries[key]
+
+    def get(self, vector: Sequence[float], version: str) -> Optional[str]:
+        query = self._unit(vector)
+        with self._lock:
+            self._expire(time.monotonic())
+            keys = [key for key, entry in self._entries.items() if entry[2] == version]
+            if keys:
+                matrix = np.stack([self._entries[key][0] for key in keys])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    self.hits += 1
+                    self._entries.move_to_end(keys[best])
+                    return self._entries[keys[best]][1]
+            self.misses += 1
+            return None
+
+    def put(self, vector: Sequence[float], version: str, answer: str) -> None:
+        with self._lock:
+            self._entries[self._next_id] = (self._unit(vector), answer, version, time.monotonic())
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+# One cache per chat session per process; the least recently used sessions are dropped
+_MAX_SESSIONS = 1024
+_CACHES: "OrderedDict[str, SemanticAnswerCache]" = OrderedDict()
+_CACHES_LOCK = threading.Lock()
+
+
+def get_answer_cache(session_id: str, **settings) -> SemanticAnswerCache:
+    with _CACHES_LOCK:
+        if session_id not in _CACHES:
+            _CACHES[session_id] = SemanticAnswerCache(**settings)
+            log.info("Answer cache created", session_id=session_id, **settings)
+            while len(_CACHES) > _MAX_SESSIONS:
+                _CACHES.popitem(last=False)
+        _CACHES.move_to_end(session_id)
+        return _CACHES[session_id]
+
+
+def answer_cache_stats() -> Dict[str, Dict[str, float]]:
+    """Hit/miss counters of every session's answer cache, keyed by session id."""
+    with _CACHES_LOCK:
+        return {session_id: cache.stats() for session_id, cache in _CACHES.items()}
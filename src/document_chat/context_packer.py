@@ -0,0 +1,131 @@
+from __future__ import annotations
+import re
+from typing import Any, Dict, List, Sequence, Set, Tuple
+from langchain_core.documents import Document
+from utils.embedding_scheduler import estimate_tokens
+
+DEFAULT_CONTEXT_PACKING = {
+    "enabled": True,
+    "max_context_tokens": 3000,  # whole context handed to the QA prompt
+    "max_chunk_tokens": 600,     # per chunk; longer chunks are cut to their most relevant window
+    "min_chunk_tokens": 50,      # don't bother adding a chunk trimmed below this to fit the budget
+    "dedup_threshold": 0.8,      # shingle containment above which a lower-ranked chunk is a duplicate
+}
+
+_WORD = re.compile(r"\w+")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from has have how in is it its of on or "
+    "that the their this to was were what when where which who why with".split()
+)
+_SHINGLE = 5
+
+
+def query_terms(question: str) -> Set[str]:
+    return {w for w in _WORD.findall(question.casefold()) if w not in _STOPWORDS and len(w) > 1}
+
+
+def _shingles(text: str) -> Set[Tuple[str, ...]]:
+    words = _WORD.findall(text.casefold())
+    if len(words) <= _SHINGLE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + _SHINGLE]) for i in range(len(words) - _SHINGLE + 1)}
+
+
+def _is_table(doc: Document) -> bool:
+    return str(doc.metadata.get("type", "")).endswith("_table")
+
+
+def _units(doc: Document) -> List[str]:
+    """Trimming units: rows for table CSVs, sentences/lines for prose."""
+    if _is_table(doc):
+        return [line for line in doc.page_content.splitlines() if line.strip()]
+    return [s for s in _SENTENCE_BREAK.split(doc.page_content) if s.strip()]
+
+
+def best_window(units: Sequence[str], terms: Set[str], max_tokens: int, keep_first: bool = False) -> List[str]:
+    """
+    Contiguous run of units within `max_tokens` with the most query-term hits (earliest on
+    ties). With `keep_first` the first unit (a table header) is always kept and the window
+    is chosen from the rest.
+    """
+    head: List[str] = []
+    if keep_first and units:
+        head, units = [units[0]], units[1:]
+        max_tokens -= estimate_tokens(head[0])
+    costs = [estimate_tokens(u) for u in units]
+    scores = [len(terms & set(_WORD.findall(u.casefold()))) for u in units]
+    best: Tuple[int, int, int] = (-1, 0, 0)  # score, start, end
+    start, cost, score = 0, 0, 0
+    for end in range(len(units)):
+        cost += costs[end]
+        score += scores[end]
+        while cost > max_tokens and start <= end:
+            cost -= costs[start]
+            score -= scores[start]
+            start += 1
+        if start <= end and score > best[0]:
+            best = (score, start, end + 1)
+    if best[0] < 0:  # not even one unit fits: hard-cut the first one
+        first = units[0] if units else ""
+        return head + ([first[: max(0, max_tokens) * 4]] if first and max_tokens > 0 else [])
+    return head + list(units[best[1]:best[2]])
+
+
+def pack_context(
+    docs: Sequence[Document],
+    question: str,
+    max_context_tokens: int = 3000,
+    max_chunk_tokens: int = 600,
+    min_chunk_tokens: int = 50,
+    dedup_threshold: float = 0.8,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Pack retrieved chunks (already in score order) into a token-budgeted context:
+    drop chunks mostly contained in a higher-ranked one, cut long chunks to their most
+    relevant window, then fill `max_context_tokens` in rank order. Returns the context and
+    token accounting for the query.
+    """
+    terms = query_terms(question)
+    tokens_in = sum(estimate_tokens(d.page_content) for d in docs)
+    kept_shingles: List[Set[Tuple[str, ...]]] = []
+    parts: List[str] = []
+    duplicates = trimmed = dropped = 0
+    remaining = max_context_tokens
+
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        if not shingles:
+            continue
+        if any(len(shingles & seen) / min(len(shingles), len(seen)) >= dedup_threshold for seen in kept_shingles):
+            duplicates += 1
+            continue
+        limit = min(max_chunk_tokens, remaining)
+        if limit < min_chunk_tokens:
+            dropped += 1
+            continue
+        text = doc.page_content.strip()
+        if estimate_tokens(text) > limit:
+            separator = "\n" if _is_table(doc) else " "
+            text = separator.join(best_window(_units(doc), terms, limit, keep_first=_is_table(doc))).strip()
+            trimmed += 1
+            if not text:
+                dropped += 1
+                continue
+        kept_shingles.append(shingles)
+        parts.append(text)
+        remaining -= estimate_tokens(text)
+
+    context = "\n\n".join(parts)
+    tokens_out = estimate_tokens(context) if context else 0
+    stats = {
+        "chunks_in": len(docs),
+        "chunks_kept": len(parts),
+        "duplicates": duplicates,
+        "trimmed": trimmed,
+        "dropped": dropped,
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "tokens_saved": max(0, tokens_in - tokens_out),
+    }
+    return context, stats
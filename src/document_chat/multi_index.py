@@ -0,0 +1,54 @@
+from __future__ import annotations
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Tuple
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from logger import GLOBAL_LOGGER as log
+
+
+class MultiIndexRetriever(BaseRetriever):
+    """
+    Fans one question out to several FAISS indexes (e.g. one per chat session): the query
+    is embedded once, every index is searched concurrently, and the candidates are merged
+    by relevance score into a single top-k list. Each returned chunk carries the name of the
+    index it came from in metadata["index"].
+    """
+
+    vectorstores: List[Tuple[str, Any]]  # (index name, FAISS store)
+    embeddings: Embeddings
+    k: int = 5
+
+    def _search_one(self, name: str, store: Any, vector: List[float]) -> List[Tuple[Document, float]]:
+        # distances only compare within one metric, so map them to relevance in [0, 1] first
+        relevance = store._select_relevance_score_fn()
+        return [
+            (Document(page_content=doc.page_content, metadata={**doc.metadata, "index": name}, id=doc.id),
+             relevance(distance))
+            for doc, distance in store.similarity_search_with_score_by_vector(vector, k=self.k)
+        ]
+
+    def _merge(self, results: List[List[Tuple[Document, float]]]) -> List[Document]:
+        merged = sorted((hit for hits in results for hit in hits), key=lambda hit: hit[1], reverse=True)
+        log.info("Multi-index candidates merged", indexes=len(results),
+                 candidates=len(merged), k=self.k)
+        return [doc for doc, _ in merged[: self.k]]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector = self.embeddings.embed_query(query)
+        with ThreadPoolExecutor(max_workers=len(self.vectorstores) or 1) as pool:  # FAISS releases the GIL
+            results = list(pool.map(lambda item: self._search_one(item[0], item[1], vector), self.vectorstores))
+        return self._merge(results)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector = await self.embeddings.aembed_query(query)
+        results = await asyncio.gather(
+            *(asyncio.to_thread(self._search_one, name, store, vector) for name, store in self.vectorstores)
+        )
+        return self._merge(list(results))
@@ -0,0 +1,117 @@
+from __future__ import annotations
+import re
+import threading
+import weakref
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from src.document_chat.context_packer import query_terms
+
+DEFAULT_RERANK = {
+    "enabled": True,
+    "fetch_multiplier": 4,   # candidates pulled from FAISS per requested chunk
+    "min_fetch_k": 20,
+    "mmr_lambda": 0.7,       # 1.0 = pure relevance, lower = more diversity among the picked chunks
+    "lexical_weight": 0.2,   # share of query terms found in the chunk
+    # additive relevance bonus by chunk metadata["type"]; OCR output is noisier than native text
+    "type_priors": {
+        "pdf_table": 0.05,
+        "docx_table": 0.05,
+        "pptx_table": 0.05,
+        "pdf_embedded_content": -0.05,
+        "docx_embedded_image": -0.05,
+        "pptx_embedded_image": -0.05,
+        "image_file": -0.05,
+    },
+}
+
+_WORD = re.compile(r"\w+")
+
+# vectorstore -> (mapping id, mapping size, docstore id -> FAISS row); rebuilt when the mapping changes
+_ROW_MAPS: "weakref.WeakKeyDictionary[Any, Tuple[int, int, Dict[str, int]]]" = weakref.WeakKeyDictionary()
+_ROW_MAPS_LOCK = threading.Lock()
+
+
+def _docstore_rows(vectorstore: Any, mapping: Dict[int, str]) -> Dict[str, int]:
+    with _ROW_MAPS_LOCK:
+        cached = _ROW_MAPS.get(vectorstore)
+        if cached is not None and cached[0] == id(mapping) and cached[1] == len(mapping):
+            return cached[2]
+        rows = {doc_id: row for row, doc_id in mapping.items()}
+        _ROW_MAPS[vectorstore] = (id(mapping), len(mapping), rows)
+        return rows
+
+
+def stored_vectors(vectorstore: Any, docs: Sequence[Document]) -> Optional[np.ndarray]:
+    """
+    Embeddings of `docs` reconstructed from a FAISS index (no embedding calls), or None
+    when any doc can't be mapped back to its index row.
+    """
+    index = getattr(vectorstore, "index", None)
+    mapping = getattr(vectorstore, "index_to_docstore_id", None)
+    if index is None or not mapping or not all(d.id for d in docs):
+        return None
+    rows = _docstore_rows(vectorstore, mapping)
+    try:
+        return np.stack([index.reconstruct(int(rows[d.id])) for d in docs]).astype(np.float32)
+    except (KeyError, RuntimeError):  # unknown id / index type without reconstruct
+        return None
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+class LocalReranker:
+    """
+    Second retrieval stage: re-score an over-fetched FAISS candidate set with cosine
+    relevance, query-term overlap and chunk-type priors, then pick the final `k` by MMR so
+    near-duplicate chunks don't crowd out the rest. Pure NumPy, no model or network calls.
+    """
+
+    def __init__(self, fetch_multiplier: int = 4, min_fetch_k: int = 20, mmr_lambda: float = 0.7,
+                 lexical_weight: float = 0.2, type_priors: Optional[Dict[str, float]] = None):
+        self.fetch_multiplier = fetch_multiplier
+        self.min_fetch_k = min_fetch_k
+        self.mmr_lambda = mmr_lambda
+        self.lexical_weight = lexical_weight
+        self.type_priors = dict(type_priors or {})
+
+    def fetch_k(self, k: int) -> int:
+        return max(k * self.fetch_multiplier, self.min_fetch_k)
+
+    def scores(self, query: str, query_vector: Sequence[float], docs: Sequence[Document],
+               doc_vectors: np.ndarray) -> np.ndarray:
+        """Relevance of each candidate before diversity: cosine + lexical overlap + type prior."""
+        q = _unit_rows(np.asarray(query_vector, dtype=np.float32))
+        cosine = _unit_rows(doc_vectors) @ q
+        terms = query_terms(query)
+        lexical = np.array(
+            [len(terms & set(_WORD.findall(d.page_content.casefold()))) / len(terms) if terms else 0.0 for d in docs],
+            dtype=np.float32,
+        )
+        priors = np.array([self.type_priors.get(d.metadata.get("type"), 0.0) for d in docs], dtype=np.float32)
+        return cosine + self.lexical_weight * lexical + priors
+
+    def rerank(self, query: str, query_vector: Sequence[float], docs: Sequence[Document],
+               doc_vectors: np.ndarray, k: int) -> List[Document]:
+        if len(docs) <= 1:
+            return list(docs)[:k]
+        relevance = self.scores(query, query_vector, docs, doc_vectors)
+        unit = _unit_rows(doc_vectors)
+        similarity = unit @ unit.T
+
+        selected = [int(np.argmax(relevance))]
+        # highest cosine of each candidate to anything already picked
+        redundancy = similarity[selected[0]].copy()
+        available = np.ones(len(docs), dtype=bool)
+        available[selected[0]] = False
+        while len(selected) < min(k, len(docs)):
+            mmr = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * redundancy
+            mmr[~available] = -np.inf
+            best = int(np.argmax(mmr))
+            selected.append(best)
+            available[best] = False
+            np.maximum(redundancy, similarity[best], out=redundancy)
+        return [docs[i] for i in selected]
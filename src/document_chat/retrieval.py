@@ -1,19 +1,79 @@
 import sys
 import os
+import re
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from operator import itemgetter
-from typing import List, Optional, Dict, Any
+from typing import AsyncIterator, Callable, List, Optional, Dict, Any
 
+import numpy as np
+from langchain_core.documents import Document
 from langchain_core.messages import BaseMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableBranch, RunnableConfig, RunnableLambda, RunnableParallel, RunnablePassthrough
 from langchain_community.vectorstores import FAISS
 
 from utils.model_loader import ModelLoader
+from utils.config_loader import load_config
+from src.document_chat.answer_cache import SemanticAnswerCache, get_answer_cache, index_version
+from src.document_chat.context_packer import DEFAULT_CONTEXT_PACKING, pack_context
+from src.document_chat.multi_index import MultiIndexRetriever
+from src.document_chat.reranker import DEFAULT_RERANK, LocalReranker
+from src.document_chat.retrieval_cache import CachedQueryEmbeddings, CachedVectorStoreRetriever, get_lru_cache, normalize_query
+from utils.metadata_index import MetadataIndex
 from exception.custom_exception import DocumentPortalException
 from logger import GLOBAL_LOGGER as log
 from prompt.prompt_library import PROMPT_REGISTRY
 from model.models import PromptType
 
+# When to rewrite the question with chat history before retrieval (config: retriever.rewrite_policy)
+REWRITE_ALWAYS = "always"
+REWRITE_NEVER = "never"
+REWRITE_WHEN_HISTORY = "when_history"
+REWRITE_HEURISTIC = "heuristic"  # only follow-ups that lean on earlier turns
+REWRITE_POLICIES = (REWRITE_ALWAYS, REWRITE_NEVER, REWRITE_WHEN_HISTORY, REWRITE_HEURISTIC)
+
+DEFAULT_SPECULATIVE_RETRIEVAL = {
+    "enabled": True,
+    "similarity_threshold": 0.9,  # cosine between raw and rewritten question embeddings
+}
+
+# Pronouns / demonstratives pointing back at earlier turns, and follow-up openers ("what about ...")
+_ANAPHORA_RE = re.compile(
+    r"\b(it|its|they|them|their|theirs|this|that|these|those|he|him|his|she|her|hers|there|"
+    r"former|latter|above|same|previous|aforementioned)\b",
+    re.IGNORECASE,
+)
+_FOLLOW_UP_RE = re.compile(r"^\s*(and|or|but|also|so|then|what about|how about|why not|what else)\b", re.IGNORECASE)
+_ELLIPTICAL_MAX_WORDS = 3  # "and for 2023?", "why?" only make sense with context
+
+
+def needs_rewrite(question: str, chat_history: Optional[List[BaseMessage]], policy: str) -> bool:
+    """Decide whether the contextualize-question LLM call is worth its round trip."""
+    if policy == REWRITE_ALWAYS:
+        return True
+    if policy == REWRITE_NEVER or not chat_history:
+        return False  # nothing to resolve references against
+    if policy == REWRITE_WHEN_HISTORY:
+        return True
+    return bool(
+        _ANAPHORA_RE.search(question)
+        or _FOLLOW_UP_RE.search(question)
+        or len(question.split()) <= _ELLIPTICAL_MAX_WORDS
+    )
+
+
+def _inline(func: Callable) -> RunnableLambda:
+    """
+    RunnableLambda that `ainvoke` runs directly on the event loop. A plain sync lambda is
+    shipped to the default thread pool under async execution; our glue steps are too cheap
+    for that hop to pay off.
+    """
+    async def afunc(value):
+        return func(value)
+    return RunnableLambda(func, afunc=afunc)
+
 
 class ConversationalRAG:
     """
@@ -23,11 +83,36 @@ class ConversationalRAG:
         rag = ConversationalRAG(session_id="abc")
         rag.load_retriever_from_faiss(index_path="faiss_index/abc", k=5, index_name="index")
         answer = rag.invoke("What is ...?", chat_history=[])
+
+    Async (one event loop serves many in-flight questions):
+        await rag.aload_retriever_from_faiss(index_path="faiss_index/abc", k=5)
+        answer = await rag.ainvoke("What is ...?")
+        async for chunk in rag.astream("What is ...?"): ...
     """
 
-    def __init__(self, session_id: Optional[str], retriever=None):
+    def __init__(self, session_id: Optional[str], retriever=None, rewrite_policy: Optional[str] = None):
         try:
             self.session_id = session_id
+            retriever_cfg = load_config().get("retriever") or {}
+            self.rewrite_policy = rewrite_policy or retriever_cfg.get("rewrite_policy", REWRITE_HEURISTIC)
+            if self.rewrite_policy not in REWRITE_POLICIES:
+                raise ValueError(f"Unknown rewrite_policy {self.rewrite_policy!r}, expected one of {REWRITE_POLICIES}")
+
+            # Semantic answer cache (per session); active once an index version is known
+            self.embeddings = None
+            self.index_version: Optional[str] = None
+            self.answer_cache: Optional[SemanticAnswerCache] = None
+            cache_config = dict(retriever_cfg.get("answer_cache") or {})
+            if session_id and cache_config.pop("enabled", False):
+                self.answer_cache = get_answer_cache(session_id, **cache_config)
+
+            # Retrieval on the raw question runs alongside the rewrite LLM call; its results are kept
+            # when the rewrite barely changes the question
+            self.speculative = {**DEFAULT_SPECULATIVE_RETRIEVAL, **(retriever_cfg.get("speculative_retrieval") or {})}
+
+            # Token budget for the retrieved context handed to the QA prompt
+            self.packing = {**DEFAULT_CONTEXT_PACKING, **(retriever_cfg.get("context_packing") or {})}
+            self.last_packing_stats: Optional[Dict[str, Any]] = None
 
             # Load LLM and prompts once
             self.llm = self._load_llm()
@@ -61,25 +146,41 @@ class ConversationalRAG:
     ):
         """
         Load FAISS vectorstore from disk and build retriever + LCEL chain.
+        `search_kwargs` may carry a `metadata_filter` (see MetadataIndex), e.g.
+        {"type": "tables"} or {"file": "report.pdf", "page": {"gte": 10, "lte": 20}}.
         """
         try:
             if not os.path.isdir(index_path):
                 raise FileNotFoundError(f"FAISS index directory not found: {index_path}")
 
-            embeddings = ModelLoader().load_embeddings()
-            vectorstore = FAISS.load_local(
-                index_path,
-                embeddings,
-                index_name=index_name,
-                allow_dangerous_deserialization=True,  # ok if you trust the index
-            )
+            config = load_config()
+            cache_config = (config.get("retriever") or {}).get("cache") or {}
+            caching = cache_config.get("enabled", False)
+            embeddings = self._load_query_embeddings(config)
+            vectorstore = self._load_vectorstore(index_path, index_name, embeddings)
 
             if search_kwargs is None:
                 search_kwargs = {"k": k}
 
-            self.retriever = vectorstore.as_retriever(
-                search_type=search_type, search_kwargs=search_kwargs
+            version = index_version(index_path, index_name)
+            result_cache = None
+            if caching and version:
+                result_cache = get_lru_cache(f"retrieval:{os.path.abspath(index_path)}:{index_name}",
+                                             cache_config.get("results_max_entries", 1024))
+                result_cache.ensure_version(version)  # index rebuilt -> old rankings are void
+            rerank_config = {**DEFAULT_RERANK, **((config.get("retriever") or {}).get("rerank") or {})}
+            reranker = LocalReranker(**{key: value for key, value in rerank_config.items() if key != "enabled"}) \
+                if rerank_config["enabled"] else None
+            metadata_index = MetadataIndex.load_or_build(index_path, vectorstore) \
+                if search_kwargs.get("metadata_filter") else None
+            self.retriever = CachedVectorStoreRetriever(
+                vectorstore=vectorstore, search_type=search_type, search_kwargs=search_kwargs,
+                index_version=version, result_cache=result_cache, reranker=reranker,
+                metadata_index=metadata_index,
             )
+            self.embeddings = embeddings
+            # retrieval settings are part of the version: a different k can change the answer
+            self.index_version = f"{version}:{search_type}:{sorted(search_kwargs.items())}"
             self._build_lcel_chain()
 
             log.info(
@@ -95,34 +196,179 @@ class ConversationalRAG:
             log.error("Failed to load retriever from FAISS", error=str(e))
             raise DocumentPortalException("Loading error in ConversationalRAG", sys)
 
+    async def aload_retriever_from_faiss(
+        self,
+        index_path: str,
+        k: int = 5,
+        index_name: str = "index",
+        search_type: str = "similarity",
+        search_kwargs: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Async variant of `load_retriever_from_faiss`: reading and deserializing the index is
+        blocking disk work, so it runs in a worker thread once, off the event loop.
+        """
+        return await asyncio.to_thread(
+            self.load_retriever_from_faiss, index_path, k, index_name, search_type, search_kwargs
+        )
+
+    def load_retriever_from_faiss_indexes(self, index_paths: List[str], k: int = 5, index_name: str = "index"):
+        """
+        Load several FAISS indexes (e.g. one per session) concurrently and build a fan-out
+        retriever that merges their top candidates by score into one context for one answer.
+        """
+        try:
+            if not index_paths:
+                raise ValueError("At least one index path is required")
+            missing = [p for p in index_paths if not os.path.isdir(p)]
+            if missing:
+                raise FileNotFoundError(f"FAISS index directories not found: {missing}")
+
+            embeddings = self._load_query_embeddings(load_config())
+            with ThreadPoolExecutor(max_workers=len(index_paths)) as pool:
+                stores = list(pool.map(lambda p: self._load_vectorstore(p, index_name, embeddings), index_paths))
+
+            self.retriever = MultiIndexRetriever(
+                vectorstores=[(os.path.basename(os.path.normpath(p)), store) for p, store in zip(index_paths, stores)],
+                embeddings=embeddings,
+                k=k,
+            )
+            self.embeddings = embeddings
+            versions = sorted(f"{os.path.abspath(p)}@{index_version(p, index_name)}" for p in index_paths)
+            self.index_version = f"{'|'.join(versions)}:multi:{k}"
+            self._build_lcel_chain()
+
+            log.info("Multi-index retriever loaded", index_paths=index_paths, k=k, session_id=self.session_id)
+            return self.retriever
+        except Exception as e:
+            log.error("Failed to load multi-index retriever", error=str(e))
+            raise DocumentPortalException("Loading error in ConversationalRAG", sys)
+
+    async def aload_retriever_from_faiss_indexes(self, index_paths: List[str], k: int = 5, index_name: str = "index"):
+        """Async variant of `load_retriever_from_faiss_indexes` (index loading runs off the event loop)."""
+        return await asyncio.to_thread(self.load_retriever_from_faiss_indexes, index_paths, k, index_name)
+
     def invoke(self, user_input: str, chat_history: Optional[List[BaseMessage]] = None) -> str:
         """Invoke the LCEL pipeline."""
         try:
-            if self.chain is None:
-                raise DocumentPortalException(
-                    "RAG chain not initialized. Call load_retriever_from_faiss() before invoke().", sys
-                )
+            self._require_chain()
             chat_history = chat_history or []
-            payload = {"input": user_input, "chat_history": chat_history}
-            answer = self.chain.invoke(payload)
-            if not answer:
-                log.warning(
-                    "No answer generated", user_input=user_input, session_id=self.session_id
-                )
-                return "no answer generated."
-            log.info(
-                "Chain invoked successfully",
-                session_id=self.session_id,
-                user_input=user_input,
-                answer_preview=str(answer)[:150],
-            )
-            return answer
+
+            # Answers to follow-ups depend on the conversation, so only first-turn questions are cached
+            question_vector = None
+            if self._answer_cache_applies(chat_history):
+                question_vector = self.embeddings.embed_query(user_input)
+                cached = self._cached_answer(question_vector, user_input)
+                if cached is not None:
+                    return cached
+
+            answer = self.chain.invoke({"input": user_input, "chat_history": chat_history})
+            return self._finish(user_input, answer, question_vector)
+        except Exception as e:
+            log.error("Failed to invoke ConversationalRAG", error=str(e))
+            raise DocumentPortalException("Invocation error in ConversationalRAG", sys)
+
+    async def ainvoke(self, user_input: str, chat_history: Optional[List[BaseMessage]] = None) -> str:
+        """Invoke the LCEL pipeline on the event loop (async embeddings, retriever and LLM calls)."""
+        try:
+            self._require_chain()
+            chat_history = chat_history or []
+
+            question_vector = None
+            if self._answer_cache_applies(chat_history):
+                question_vector = await self.embeddings.aembed_query(user_input)
+                cached = self._cached_answer(question_vector, user_input)
+                if cached is not None:
+                    return cached
+
+            answer = await self.chain.ainvoke({"input": user_input, "chat_history": chat_history})
+            return self._finish(user_input, answer, question_vector)
         except Exception as e:
             log.error("Failed to invoke ConversationalRAG", error=str(e))
             raise DocumentPortalException("Invocation error in ConversationalRAG", sys)
 
+    async def astream(self, user_input: str, chat_history: Optional[List[BaseMessage]] = None) -> AsyncIterator[str]:
+        """Stream answer chunks as the LLM produces them; a cached answer arrives as one chunk."""
+        try:
+            self._require_chain()
+            chat_history = chat_history or []
+
+            question_vector = None
+            if self._answer_cache_applies(chat_history):
+                question_vector = await self.embeddings.aembed_query(user_input)
+                cached = self._cached_answer(question_vector, user_input)
+                if cached is not None:
+                    yield cached
+                    return
+
+            chunks: List[str] = []
+            async for chunk in self.chain.astream({"input": user_input, "chat_history": chat_history}):
+                chunks.append(chunk)
+                yield chunk
+            answer = self._finish(user_input, "".join(chunks), question_vector)
+            if not chunks:
+                yield answer
+        except Exception as e:
+            log.error("Failed to stream ConversationalRAG answer", error=str(e))
+            raise DocumentPortalException("Streaming error in ConversationalRAG", sys)
+
     # ---------- Internals ----------
 
+    @staticmethod
+    def _load_query_embeddings(config: Dict[str, Any]):
+        embeddings = ModelLoader().load_embeddings()
+        cache_config = (config.get("retriever") or {}).get("cache") or {}
+        if cache_config.get("enabled", False):
+            # query vectors depend only on the embedding model, so they are shared across indexes
+            model_name = (config.get("embedding_model") or {}).get("model_name", "default")
+            embeddings = CachedQueryEmbeddings(
+                embeddings,
+                get_lru_cache(f"query_embeddings:{model_name}", cache_config.get("query_embeddings_max_entries", 2048)),
+            )
+        return embeddings
+
+    @staticmethod
+    def _load_vectorstore(index_path: str, index_name: str, embeddings) -> FAISS:
+        return FAISS.load_local(
+            index_path,
+            embeddings,
+            index_name=index_name,
+            allow_dangerous_deserialization=True,  # ok if you trust the index
+        )
+
+    def _require_chain(self) -> None:
+        if self.chain is None:
+            raise DocumentPortalException(
+                "RAG chain not initialized. Call load_retriever_from_faiss() before invoke().", sys
+            )
+
+    def _answer_cache_applies(self, chat_history: List[BaseMessage]) -> bool:
+        return self.answer_cache is not None and bool(self.index_version) and self.embeddings is not None and not chat_history
+
+    def _cached_answer(self, question_vector: List[float], user_input: str) -> Optional[str]:
+        cached = self.answer_cache.get(question_vector, self.index_version)
+        if cached is not None:
+            log.info("Answer cache hit", session_id=self.session_id, user_input=user_input,
+                     **self.answer_cache.stats())
+        return cached
+
+    def _finish(self, user_input: str, answer: str, question_vector: Optional[List[float]]) -> str:
+        if not answer:
+            log.warning(
+                "No answer generated", user_input=user_input, session_id=self.session_id
+            )
+            return "no answer generated."
+        if question_vector is not None:
+            self.answer_cache.put(question_vector, self.index_version, answer)
+            log.info("Answer cache miss", session_id=self.session_id, **self.answer_cache.stats())
+        log.info(
+            "Chain invoked successfully",
+            session_id=self.session_id,
+            user_input=user_input,
+            answer_preview=str(answer)[:150],
+        )
+        return answer
+
     def _load_llm(self):
         try:
             llm = ModelLoader().load_llm()
@@ -134,39 +380,98 @@ class ConversationalRAG:
             log.error("Failed to load LLM", error=str(e))
             raise DocumentPortalException("LLM loading error in ConversationalRAG", sys)
 
-    @staticmethod
-    def _format_docs(docs) -> str:
-        return "\n\n".join(getattr(d, "page_content", str(d)) for d in docs)
+    def _speculation_holds(self, original: str, rewritten: str, vectors: Optional[List[List[float]]]) -> bool:
+        if normalize_query(original) == normalize_query(rewritten):
+            return True
+        if vectors is None:
+            return False
+        a, b = (np.asarray(v, dtype=np.float32) for v in vectors)
+        denominator = float(np.linalg.norm(a) * np.linalg.norm(b))
+        return bool(denominator) and float(a @ b) / denominator >= self.speculative["similarity_threshold"]
+
+    def _log_speculation(self, hit: bool, original: str, rewritten: str) -> None:
+        log.info("Speculative retrieval " + ("used" if hit else "discarded, retrieving again"),
+                 session_id=self.session_id, original=original, rewritten=rewritten)
+
+    def _reconcile_speculative(self, inputs: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+        original, rewritten = inputs["speculative"]["question"], inputs["rewritten"]
+        vectors = None
+        if self.embeddings is not None and normalize_query(original) != normalize_query(rewritten):
+            vectors = [self.embeddings.embed_query(original), self.embeddings.embed_query(rewritten)]
+        hit = self._speculation_holds(original, rewritten, vectors)
+        self._log_speculation(hit, original, rewritten)
+        if hit:
+            return {"question": rewritten, "docs": inputs["speculative"]["docs"]}
+        return {"question": rewritten, "docs": self.retriever.invoke(rewritten, config=config)}
+
+    async def _areconcile_speculative(self, inputs: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+        original, rewritten = inputs["speculative"]["question"], inputs["rewritten"]
+        vectors = None
+        if self.embeddings is not None and normalize_query(original) != normalize_query(rewritten):
+            # the original question's vector was just computed for the speculative search (cached)
+            vectors = list(await asyncio.gather(self.embeddings.aembed_query(original),
+                                                self.embeddings.aembed_query(rewritten)))
+        hit = self._speculation_holds(original, rewritten, vectors)
+        self._log_speculation(hit, original, rewritten)
+        if hit:
+            return {"question": rewritten, "docs": inputs["speculative"]["docs"]}
+        return {"question": rewritten, "docs": await self.retriever.ainvoke(rewritten, config=config)}
+
+    def _format_docs(self, inputs: Dict[str, Any]) -> str:
+        docs = inputs["docs"]
+        if not self.packing["enabled"] or not all(isinstance(d, Document) for d in docs):
+            return "\n\n".join(getattr(d, "page_content", str(d)) for d in docs)
+        settings = {k: v for k, v in self.packing.items() if k != "enabled"}
+        context, stats = pack_context(docs, inputs["question"], **settings)
+        self.last_packing_stats = stats
+        log.info("Context packed", session_id=self.session_id, **stats)
+        return context
 
     def _build_lcel_chain(self):
         try:
             if self.retriever is None:
                 raise DocumentPortalException("No retriever set before building chain", sys)
 
-            # 1) Rewrite user question with chat history context
+            # 1) Rewrite user question with chat history context - only when the policy says the
+            #    question depends on earlier turns; otherwise retrieve with the question as asked
             question_rewriter = (
-                {"input": itemgetter("input"), "chat_history": itemgetter("chat_history")}
+                {"input": _inline(itemgetter("input")), "chat_history": _inline(itemgetter("chat_history"))}
                 | self.contextualize_prompt
                 | self.llm
                 | StrOutputParser()
             )
-
-            # 2) Retrieve docs for rewritten question
-            retrieve_docs = question_rewriter | self.retriever | self._format_docs
+            # 2) Retrieve docs for the (possibly rewritten) question. With speculation on, retrieval
+            #    for the raw question starts together with the rewrite and is reused if it still fits
+            retrieve = RunnableParallel(question=RunnablePassthrough(), docs=self.retriever)
+            if self.speculative["enabled"]:
+                rewrite_and_retrieve = RunnableParallel(
+                    rewritten=question_rewriter,
+                    speculative=_inline(itemgetter("input")) | retrieve,
+                ) | RunnableLambda(self._reconcile_speculative, afunc=self._areconcile_speculative)
+            else:
+                rewrite_and_retrieve = question_rewriter | retrieve
+            retrieve_docs = (
+                RunnableBranch(
+                    (_inline(lambda x: needs_rewrite(x["input"], x["chat_history"], self.rewrite_policy)),
+                     rewrite_and_retrieve),
+                    _inline(itemgetter("input")) | retrieve,
+                )
+                | _inline(self._format_docs)
+            )
 
             # 3) Answer using retrieved context + original input + chat history
             self.chain = (
                 {
                     "context": retrieve_docs,
-                    "input": itemgetter("input"),
-                    "chat_history": itemgetter("chat_history"),
+                    "input": _inline(itemgetter("input")),
+                    "chat_history": _inline(itemgetter("chat_history")),
                 }
                 | self.qa_prompt
                 | self.llm
                 | StrOutputParser()
             )
 
-            log.info("LCEL graph built successfully", session_id=self.session_id)
+            log.info("LCEL graph built successfully", session_id=self.session_id, rewrite_policy=self.rewrite_policy)
         except Exception as e:
             log.error("Failed to build LCEL chain", error=str(e), session_id=self.session_id)
             raise DocumentPortalException("Failed to build LCEL chain", sys)
@@ -0,0 +1,219 @@
+from __future__ import annotations
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStoreRetriever
+from logger import GLOBAL_LOGGER as log
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from src.document_chat.reranker import LocalReranker, stored_vectors
+from utils.metadata_index import MetadataIndex, search_rows
+
+
+class LRUCache:
+    """Bounded, thread-safe LRU map with hit/miss counters and an optional version tag."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def ensure_version(self, version: Optional[str]) -> None:
+        """Drop every entry when the data they were computed from has changed."""
+        with self._lock:
+            if version != self.version:
+                if self._data:
+                    log.info("Cache invalidated", old_version=self.version, new_version=version, entries=len(self._data))
+                self._data.clear()
+                self.version = version
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self._data),
+        }
+
+
+# Named caches shared by every request in the process (each /chat/query builds a fresh ConversationalRAG)
+_CACHES: Dict[str, LRUCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_lru_cache(name: str, max_entries: int = 1024) -> LRUCache:
+    with _CACHES_LOCK:
+        if name not in _CACHES:
+            _CACHES[name] = LRUCache(max_entries=max_entries)
+        return _CACHES[name]
+
+
+def retrieval_cache_stats() -> Dict[str, Dict[str, float]]:
+    with _CACHES_LOCK:
+        return {name: cache.stats() for name, cache in _CACHES.items()}
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Embeddings wrapper that memoizes `embed_query` by normalized text; documents pass through."""
+
+    def __init__(self, embeddings: Embeddings, cache: LRUCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self.cache.put(key, vector)
+        return vector
+
+
+def _freeze(value: Any) -> Hashable:
+    """Hashable form of search kwargs (filters are nested dicts/lists)."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class CachedVectorStoreRetriever(VectorStoreRetriever):
+    """
+    VectorStoreRetriever that caches ranked docstore IDs per (index version, query vector
+    hash, search type, search kwargs incl. k and filters). A hit skips the vector search
+    and just resolves IDs in the docstore. With a `reranker`, similarity search over-fetches
+    candidates and the reranker picks the final k (the cached IDs are the reranked ones).
+    A `metadata_filter` search kwarg is resolved through `metadata_index` to FAISS row ids
+    that restrict the search up front.
+    """
+
+    index_version: Optional[str] = None
+    result_cache: Optional[LRUCache] = None
+    reranker: Optional[LocalReranker] = None
+    metadata_index: Optional[MetadataIndex] = None
+
+    def _search_by_vector(self, query: str, vector: List[float], search_kwargs: Dict[str, Any]) -> List[Document]:
+        metadata_filter = search_kwargs.get("metadata_filter")
+        search_kwargs = {key: value for key, value in search_kwargs.items() if key != "metadata_filter"}
+        rows = None
+        if metadata_filter:
+            if self.metadata_index is None:
+                raise ValueError("metadata_filter requires a metadata index")
+            rows = self.metadata_index.select(metadata_filter)
+            log.info("Metadata filter resolved", metadata_filter=metadata_filter, rows=int(rows.size))
+
+        k = search_kwargs.get("k", 4)
+        if self.search_type == "mmr":
+            if rows is None:
+                return self.vectorstore.max_marginal_relevance_search_by_vector(vector, **search_kwargs)
+            candidates = [doc for doc, _ in search_rows(self.vectorstore, vector, rows, search_kwargs.get("fetch_k", 20))]
+            doc_vectors = stored_vectors(self.vectorstore, candidates)
+            if doc_vectors is None or not candidates:
+                return candidates[:k]
+            picked = maximal_marginal_relevance(np.asarray(vector, dtype=np.float32), doc_vectors, k=k,
+                                                lambda_mult=search_kwargs.get("lambda_mult", 0.5))
+            return [candidates[i] for i in picked]
+
+        fetch = k if self.reranker is None else self.reranker.fetch_k(k)
+        if rows is not None:
+            candidates = [doc for doc, _ in search_rows(self.vectorstore, vector, rows, fetch)]
+        else:
+            fetch_kwargs = {**search_kwargs, "k": fetch}
+            if "filter" in search_kwargs:
+                fetch_kwargs["fetch_k"] = max(search_kwargs.get("fetch_k", 20), fetch * 2)
+            candidates = self.vectorstore.similarity_search_by_vector(vector, **fetch_kwargs)
+        if self.reranker is None:
+            return candidates
+        doc_vectors = stored_vectors(self.vectorstore, candidates)
+        if doc_vectors is None:
+            return candidates[:k]
+        docs = self.reranker.rerank(query, vector, candidates, doc_vectors, k)
+        log.info("Reranked retrieval candidates", candidates=len(candidates), k=k)
+        return docs
+
+    def _handles(self, search_kwargs: Dict[str, Any]) -> bool:
+        return (
+            (self._cacheable() or self.reranker is not None or "metadata_filter" in search_kwargs)
+            and self.search_type in ("similarity", "mmr")
+            and not callable(search_kwargs.get("filter"))
+        )
+
+    def _cacheable(self) -> bool:
+        return self.result_cache is not None and self.index_version is not None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun, **kwargs: Any
+    ) -> List[Document]:
+        search_kwargs = self.search_kwargs | kwargs
+        if not self._handles(search_kwargs):
+            return super()._get_relevant_documents(query, run_manager=run_manager, **kwargs)
+        vector = self.vectorstore.embeddings.embed_query(query)
+        return self._search_cached(query, vector, search_kwargs)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun, **kwargs: Any
+    ) -> List[Document]:
+        search_kwargs = self.search_kwargs | kwargs
+        if not self._handles(search_kwargs):
+            return await super()._aget_relevant_documents(query, run_manager=run_manager, **kwargs)
+        vector = await self.vectorstore.embeddings.aembed_query(query)
+        # The in-memory search over a session index is cheap CPU work: run it on the loop
+        # rather than paying for FAISS's run_in_executor hop
+        return self._search_cached(query, vector, search_kwargs)
+
+    def _search_cached(self, query: str, vector: List[float], search_kwargs: Dict[str, Any]) -> List[Document]:
+        if not self._cacheable():
+            return self._search_by_vector(query, vector, search_kwargs)
+        vector_hash = hashlib.blake2b(np.asarray(vector, dtype=np.float32).tobytes(), digest_size=16).hexdigest()
+        key = (self.index_version, vector_hash, self.search_type, _freeze(search_kwargs))
+
+        ids = self.result_cache.get(key)
+        if ids is not None:
+            docs = [self.vectorstore.docstore.search(i) for i in ids]
+            if all(isinstance(d, Document) for d in docs):
+                return docs
+
+        docs = self._search_by_vector(query, vector, search_kwargs)
+        if all(d.id for d in docs):
+            self.result_cache.put(key, [d.id for d in docs])
+        return docs
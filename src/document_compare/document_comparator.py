@@ -35,6 +35,22 @@ class DocumentComparatorLLM:
             log.error("Error in compare_documents", error=str(e))
             raise DocumentPortalException("Error comparing documents", sys)
 
+    async def acompare_documents(self, combined_docs: str) -> pd.DataFrame:
+        """Async variant of compare_documents: awaits the LLM instead of blocking a thread on it."""
+        try:
+            inputs = {
+                "combined_docs": combined_docs,
+                "format_instruction": self.parser.get_format_instructions()
+            }
+
+            log.info("Invoking document comparison LLM chain (async)")
+            response = await self.chain.ainvoke(inputs)
+            log.info("Chain invoked successfully", response_preview=str(response)[:200])
+            return self._format_response(response)
+        except Exception as e:
+            log.error("Error in acompare_documents", error=str(e))
+            raise DocumentPortalException("Error comparing documents", sys)
+
     def _format_response(self, response_parsed: list[dict]) -> pd.DataFrame: #type: ignore
         try:
             df = pd.DataFrame(response_parsed)
@@ -2,7 +2,6 @@ from __future__ import annotations
 import os
 import sys
 import json
-import uuid
 import hashlib
 import shutil
 from pathlib import Path
@@ -17,6 +16,7 @@ from exception.custom_exception import DocumentPortalException
 from utils.file_io import generate_session_id, save_uploaded_files
 from utils.document_ops import load_documents, concat_for_analysis, concat_for_comparison
 from utils.ocr_content_extractor import EmbeddedContentExtractor
+from utils.metadata_index import MetadataIndex, manifest_file_names
 from langchain_experimental.text_splitter import SemanticChunker
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
 
@@ -48,13 +48,39 @@ class FaissManager:
         src = md.get("source") or md.get("file_path")
         rid = md.get("row_id")
         if src is not None: # if data already exists
-            return f"{src}::{'' if rid is None else rid}"
+            # saved uploads are content-addressed, so source + chunk hash is stable across re-uploads
+            return f"{src}::{hashlib.sha256(text.encode('utf-8')).hexdigest() if rid is None else rid}"
         return hashlib.sha256(text.encode("utf-8")).hexdigest()
     
     def _save_meta(self):
         self.meta_path.write_text(json.dumps(self._meta, ensure_ascii=False, indent=2), encoding="utf-8")
         
+    def ingested_hashes(self, enable_ocr: bool = False) -> set:
+        """
+        SHA-256 of every uploaded file already fully embedded into this index with options
+        covering the current request (empty if no index yet). Files cut short by a time budget
+        (`partial`) or indexed without OCR when OCR is now requested are left out, so a
+        re-upload ingests the missing content.
+        """
+        if not self._exists():
+            return set()
+        return {digest for digest, info in self._meta.get("files", {}).items()
+                if not info.get("partial") and (info.get("enable_ocr") or not enable_ocr)}
+
+    def record_files(self, files: Dict[str, Dict[str, Any]]):
+        """Add sha256 -> file info entries (name, saved_as, enable_ocr, partial) to the ingestion manifest."""
+        self._meta.setdefault("files", {}).update(files)
+        self._save_meta()
+        
         
+    def save_metadata_index(self) -> MetadataIndex:
+        """Rebuild the per-field row-id sets used for pre-filtered search; call after the index changes."""
+        if self.vs is None:
+            raise RuntimeError("Call load_or_create() before save_metadata_index().")
+        index = MetadataIndex.build(self.vs, manifest_file_names(self.index_dir))
+        index.save(self.index_dir)
+        return index
+
     def add_documents(self,docs: List[Document]):
         
         if self.vs is None:
@@ -92,6 +118,10 @@ class FaissManager:
         # if doesn't exist, then we create one (first time execution)
         self.vs = FAISS.from_texts(texts=texts, embedding=self.emb, metadatas=metadatas or [])
         self.vs.save_local(str(self.index_dir))
+        # remember what went in, so a following add_documents() with the same chunks is a no-op
+        for text, md in zip(texts, metadatas or [{}] * len(texts)):
+            self._meta["rows"][self._fingerprint(text, md or {})] = True
+        self._save_meta()
         return self.vs
         
         
@@ -158,8 +188,18 @@ class ChatIngestor:
         try:
             fm = FaissManager(self.faiss_dir, self.model_loader)
             if not self.load_existing_index:
-                paths = save_uploaded_files(uploaded_files, self.temp_dir)
+                # content-hash check against the index manifest happens before any parsing
+                uploaded_names: Dict[str, str] = {}
+                ingested = fm.ingested_hashes(enable_ocr=enable_ocr)
+                paths = save_uploaded_files(uploaded_files, self.temp_dir,
+                                            skip_hashes=ingested, uploaded_names=uploaded_names)
+                if not paths and ingested:
+                    log.info("All uploaded files already indexed", index=str(self.faiss_dir))
+                    vs = fm.load_or_create()
+                    return vs.as_retriever(search_type="similarity", search_kwargs={"k": k})
+
                 docs = load_documents(paths, self.ocr_extractor, enable_ocr=enable_ocr)
+                partial = {Path(str(d.metadata.get("source"))).stem for d in docs if d.metadata.get("partial")}
                 if not docs:
                     raise ValueError("No valid documents loaded")
                 
@@ -176,7 +216,10 @@ class ChatIngestor:
                     raise ValueError('Failed to create index')
                     
                 added = fm.add_documents(chunks)
-                log.info("FAISS index updated", added=added, index=str(self.faiss_dir))
+                fm.record_files({p.stem: {"name": uploaded_names.get(p.stem), "saved_as": str(p),
+                                          "enable_ocr": enable_ocr, "partial": p.stem in partial} for p in paths})
+                fm.save_metadata_index()
+                log.info("FAISS index updated", added=added, files=len(paths), index=str(self.faiss_dir))
             else:
                 vs = fm.load_or_create()
             return vs.as_retriever(search_type="similarity", search_kwargs={"k": k})
@@ -8,7 +8,7 @@ from src.document_ingestion.data_ingestion import ChatIngestor
 import os
 import json
 import tempfile
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 from io import BytesIO
 
 # Import your modules
@@ -133,7 +133,7 @@ def test_analyze_endpoint(mock_doc_handler, mock_analyzer, mock_read_pdf, mock_a
 
     # Mock analyzer
     mock_analyzer_instance = Mock()
-    mock_analyzer_instance.analyze_document.return_value = {
+    mock_analyzer_instance.aanalyze_document = AsyncMock(return_value={
         "Author": ["Unknown"],
         "DateCreated": "Unknown",
         "Language": "Unknown",
@@ -143,7 +143,7 @@ def test_analyze_endpoint(mock_doc_handler, mock_analyzer, mock_read_pdf, mock_a
         "Keywords": [],
         "References": [],
         "Citations": []
-    }
+    })
     mock_analyzer.return_value = mock_analyzer_instance
 
     response = client.post(
@@ -167,7 +167,7 @@ def test_analyze_endpoint(mock_doc_handler, mock_analyzer, mock_read_pdf, mock_a
     mock_handler_instance.save_pdf.assert_called_once()
     mock_read_pdf.assert_called_once_with(mock_handler_instance, "data/document_analysis/test_session/test.pdf")
     mock_analyzer.assert_called_once()
-    mock_analyzer_instance.analyze_document.assert_called_once_with("PDF content")
+    mock_analyzer_instance.aanalyze_document.assert_awaited_once_with("PDF content")
 
 @patch('api.main.FastAPIFileAdapter')
 @patch('api.main.DocumentComparatorLLM')
@@ -194,7 +194,7 @@ def test_compare_endpoint(mock_doc_comparator, mock_comparator_llm, mock_adapter
     mock_llm_instance = Mock()
     mock_df = Mock()
     mock_df.to_dict.return_value = [{"difference": "Test difference"}]
-    mock_llm_instance.compare_documents.return_value = mock_df
+    mock_llm_instance.acompare_documents = AsyncMock(return_value=mock_df)
     mock_comparator_llm.return_value = mock_llm_instance
 
     response = client.post(
@@ -214,4 +214,4 @@ def test_compare_endpoint(mock_doc_comparator, mock_comparator_llm, mock_adapter
     mock_comparator_instance.save_uploaded_files.assert_called_once()
     mock_comparator_instance.combine_documents.assert_called_once()
     mock_comparator_llm.assert_called_once()
-    mock_llm_instance.compare_documents.assert_called_once_with("Combined content")
\ No newline at end of file
+    mock_llm_instance.acompare_documents.assert_awaited_once_with("Combined content")
\ No newline at end of file
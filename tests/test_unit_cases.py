@@ -8,7 +8,7 @@ from src.document_ingestion.data_ingestion import ChatIngestor
 import os
 import json
 import tempfile
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 from io import BytesIO
 
 # Import your modules
@@ -120,3 +120,881 @@ def test_faiss_manager_initialization():
             assert fm._meta == {"rows": {}}
             assert not fm._exists()
 
+
+
+def test_embedding_scheduler_packs_batches_and_retries():
+    """EmbeddingScheduler respects batch limits, keeps order and retries failed batches"""
+    from utils.embedding_scheduler import EmbeddingScheduler
+
+    inner = Mock()
+    calls = {"n": 0}
+
+    def embed(batch):
+        calls["n"] += 1
+        if calls["n"] == 1:
+            raise RuntimeError("429 Resource exhausted")
+        return [[float(len(t))] for t in batch]
+
+    inner.embed_documents.side_effect = embed
+    scheduler = EmbeddingScheduler(inner, max_batch_size=2, max_batch_tokens=1000, max_concurrency=1,
+                                   base_delay=0, quota_key="test-scheduler")
+    texts = ["a" * 4, "b" * 8, "c" * 12, "d" * 16, "e" * 20]
+
+    vectors = scheduler.embed_documents(texts)
+
+    assert vectors == [[4.0], [8.0], [12.0], [16.0], [20.0]]
+    assert scheduler.last_stats["batches"] == 3
+    assert scheduler.last_stats["retries"] == 1
+    assert scheduler.last_stats["chunks_per_sec"] > 0
+
+
+def test_embedding_scheduler_fails_fast_on_permanent_errors():
+    """Only 429/5xx/transport errors are retried; a permanent failure cancels the queued batches"""
+    import asyncio
+    from utils.embedding_scheduler import EmbeddingScheduler, is_retryable
+
+    assert is_retryable(RuntimeError("Error embedding content: 503 Service Unavailable"))
+    assert is_retryable(ConnectionError("connection reset"))
+    assert not is_retryable(RuntimeError("400 API key not valid. Please pass a valid API key."))
+    assert not is_retryable(ValueError("unexpected payload"))
+
+    inner = Mock()
+    inner.embed_documents.side_effect = RuntimeError("403 Permission denied")
+    scheduler = EmbeddingScheduler(inner, max_batch_size=1, max_concurrency=1, base_delay=10,
+                                   quota_key="test-scheduler-permanent")
+    with pytest.raises(RuntimeError, match="403"):
+        scheduler.embed_documents(["a", "b", "c", "d"])
+    assert inner.embed_documents.call_count == 1  # no backoff rounds, later batches never sent
+
+    inner.embed_documents.side_effect = lambda batch: [[float(len(t))] for t in batch]
+    assert asyncio.run(scheduler.aembed_documents(["ab", "abc"])) == [[2.0], [3.0]]
+    assert scheduler.last_stats["batches"] == 2
+
+
+def test_deduplicate_documents_drops_exact_and_near_duplicates():
+    """Exact and near-duplicate docs are removed, first occurrence is kept"""
+    from langchain.schema import Document
+    from utils.dedup import deduplicate_documents
+
+    base = " ".join(f"word{i}" for i in range(200))
+    near = base.replace("word100", "w0rd100")  # e.g. one OCR misread
+    docs = [
+        Document(page_content=base, metadata={"type": "text"}),
+        Document(page_content="  " + base.upper() + "  ", metadata={"type": "copy"}),
+        Document(page_content=near, metadata={"type": "pdf_embedded_content"}),
+        Document(page_content="completely different content about invoices", metadata={"type": "other"}),
+    ]
+
+    result = deduplicate_documents(docs, similarity_threshold=0.8)
+
+    assert [d.metadata["type"] for d in result] == ["text", "other"]
+
+
+def test_deduplicate_documents_keeps_same_template_across_files():
+    """Near-duplicate pages from different files (same contract template) are both kept"""
+    from langchain.schema import Document
+    from utils.dedup import deduplicate_documents
+
+    clause = " ".join(f"clause{i}" for i in range(600))
+    def contract(vendor, fee, months):
+        return f"Agreement with {vendor}. {clause} Fee {fee} EUR. Term {months} months."
+    page_a = Document(page_content=contract("Vendor A", "10,000", 12), metadata={"source": "vendor_a.pdf", "type": "pdf_text"})
+    ocr_a = Document(page_content=contract("Vendor A", "10,000", 12).replace("clause5 ", "c1ause5 "),
+                     metadata={"source": "vendor_a.pdf", "type": "pdf_embedded_content"})
+    page_b = Document(page_content=contract("Vendor B", "95,000", 36), metadata={"source": "vendor_b.pdf", "type": "pdf_text"})
+    copy_b = Document(page_content=page_b.page_content, metadata={"source": "vendor_b_copy.pdf", "type": "pdf_text"})
+
+    result = deduplicate_documents([page_a, ocr_a, page_b, copy_b], similarity_threshold=0.9)
+
+    assert result == [page_a, page_b]  # OCR copy of the same page and the exact copy dropped
+
+
+def test_extract_pdf_single_pass(tmp_path):
+    """extract_pdf returns page texts and flags the bordered-table page as a candidate"""
+    import fitz
+    from utils.pdf_extractor import extract_pdf
+
+    pdf_path = tmp_path / "two_pages.pdf"
+    doc = fitz.open()
+    doc.new_page().insert_text((50, 72), "Plain text page")
+    table_page = doc.new_page()
+    table_page.insert_text((50, 72), "Quarterly figures")
+    for r in range(3):
+        for c in range(3):
+            table_page.draw_rect(fitz.Rect(50 + c * 100, 100 + r * 20, 150 + c * 100, 120 + r * 20))
+    doc.save(pdf_path)
+    doc.close()
+
+    with patch.object(fitz.Page, "get_textpage", autospec=True, side_effect=fitz.Page.get_textpage) as get_textpage:
+        extraction = extract_pdf(str(pdf_path))
+    text_docs = extraction.text_documents()
+
+    assert get_textpage.call_count == 2  # one text layout per page for both text and word boxes
+    assert extraction.page_count == 2
+    assert extraction.table_candidate_pages == [2]
+    assert [d.metadata["page"] for d in text_docs] == [1, 2]
+    assert "Plain text page" in text_docs[0].page_content
+
+
+def test_save_uploaded_files_skips_known_content(tmp_path):
+    """Uploads are content-addressed and already-ingested or repeated content is skipped"""
+    from utils.file_io import save_uploaded_files, content_hash
+
+    def upload(name, data):
+        f = BytesIO(data)
+        f.name = name
+        return f
+
+    known = content_hash(b"already indexed")
+    names = {}
+    paths = save_uploaded_files(
+        [upload("a.txt", b"new content"), upload("copy_of_a.txt", b"new content"), upload("b.txt", b"already indexed")],
+        tmp_path,
+        skip_hashes={known},
+        uploaded_names=names,
+    )
+
+    assert len(paths) == 1
+    assert paths[0].stem == content_hash(b"new content")
+    assert names == {paths[0].stem: "a.txt"}
+
+
+def test_ingested_hashes_skip_only_complete_files_with_matching_options(tmp_path):
+    """Partial or OCR-less manifest entries don't block a re-upload that could add the missing content"""
+    with patch('src.document_ingestion.data_ingestion.ModelLoader'):
+        fm = FaissManager(tmp_path)
+    (tmp_path / "index.faiss").touch()
+    (tmp_path / "index.pkl").touch()
+    fm.record_files({
+        "full_ocr": {"name": "a.pdf", "enable_ocr": True, "partial": False},
+        "text_only": {"name": "b.pdf", "enable_ocr": False, "partial": False},
+        "cut_short": {"name": "c.pdf", "enable_ocr": True, "partial": True},
+        "legacy": {"name": "d.pdf"},
+    })
+
+    assert fm.ingested_hashes() == {"full_ocr", "text_only", "legacy"}
+    assert fm.ingested_hashes(enable_ocr=True) == {"full_ocr"}
+
+
+def test_triage_page_decides_ocr_scope():
+    """Only pages without a usable text layer are OCR'd in full; figures get region OCR"""
+    from utils.ocr_content_extractor import triage_page, DEFAULT_TRIAGE, OCR_SKIP, OCR_REGIONS, OCR_FULL
+
+    assert triage_page(3000, 0.0, 0, DEFAULT_TRIAGE) == OCR_SKIP       # born-digital text page
+    assert triage_page(3000, 0.3, 0, DEFAULT_TRIAGE) == OCR_REGIONS    # text + figure
+    assert triage_page(0, 0.98, 0, DEFAULT_TRIAGE) == OCR_FULL         # scan
+    assert triage_page(2500, 0.98, 0, DEFAULT_TRIAGE) == OCR_SKIP      # scan with hidden OCR layer
+    assert triage_page(0, 0.0, 500, DEFAULT_TRIAGE) == OCR_FULL        # outlined text
+    assert triage_page(0, 0.0, 0, DEFAULT_TRIAGE) == OCR_SKIP          # blank page
+
+
+@patch('utils.ocr_content_extractor.get_ocr_reader')
+def test_process_embedded_image_ocr_in_memory(mock_get_reader):
+    """Encoded images are decoded to pixel arrays and handed to EasyOCR without temp files"""
+    import fitz
+    import numpy as np
+    from utils.ocr_content_extractor import EmbeddedContentExtractor
+
+    mock_get_reader.return_value.readtext.return_value = ["INVOICE", "42"]
+    png = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 80, 40), False).tobytes("png")
+
+    extractor = EmbeddedContentExtractor()
+    extractor.cache = None
+    with patch('tempfile.NamedTemporaryFile') as mock_tmp:
+        doc = extractor.process_embedded_image(png, {"source": "x.png"})
+        mock_tmp.assert_not_called()
+
+    image_arg = mock_get_reader.return_value.readtext.call_args[0][0]
+    assert isinstance(image_arg, np.ndarray) and image_arg.shape == (40, 80)
+    assert doc.page_content == "INVOICE\n42"
+
+
+@patch('utils.ocr_content_extractor.get_ocr_reader')
+def test_ocr_images_batches_similar_sizes(mock_get_reader):
+    """Similar-size images share one padded readtext_batched call; outliers are OCR'd alone"""
+    import numpy as np
+    from utils.ocr_content_extractor import EmbeddedContentExtractor
+
+    reader = mock_get_reader.return_value
+    reader.readtext_batched.side_effect = lambda imgs, **kw: [[f"text{i}"] for i in range(len(imgs))]
+    reader.readtext.return_value = ["big"]
+    extractor = EmbeddedContentExtractor()
+    extractor.cache = None
+    images = [np.zeros((100, 200, 3), np.uint8), np.zeros((98, 190), np.uint8), np.zeros((2000, 1500), np.uint8)]
+
+    texts = extractor.ocr_images(images)
+
+    batched = reader.readtext_batched.call_args[0][0]
+    assert len(batched) == 2 and all(img.shape == (100, 200) for img in batched)
+    assert reader.readtext.call_count == 1
+    assert texts == ["text1", "text0", "big"]
+
+
+def test_ocr_reader_is_lazy_process_wide_singleton():
+    """Constructing extractors loads no OCR model; the reader is created once and shared"""
+    import utils.ocr_content_extractor as oce
+
+    with patch.dict(oce._READERS, clear=True), patch('easyocr.Reader') as mock_reader_cls:
+        first, second = oce.EmbeddedContentExtractor(), oce.EmbeddedContentExtractor()
+        mock_reader_cls.assert_not_called()
+
+        assert first.reader is second.reader
+        mock_reader_cls.assert_called_once_with(["en"], gpu=False)
+
+
+@patch('utils.ocr_content_extractor.get_ocr_reader')
+def test_ocr_cache_hits_and_lru_eviction(mock_get_reader, tmp_path):
+    """Repeated images hit the cache, same-template pages with different text don't; LRU eviction"""
+    import cv2
+    import numpy as np
+    from utils.ocr_cache import OcrCache, image_hash
+    from utils.ocr_content_extractor import EmbeddedContentExtractor
+
+    def invoice(fee):
+        page = np.full((1100, 850), 255, np.uint8)
+        cv2.putText(page, "ACME Corp - Service Agreement", (60, 100), cv2.FONT_HERSHEY_SIMPLEX, 1.2, 0, 2)
+        for y in range(200, 900, 40):
+            cv2.line(page, (60, y), (790, y), 0, 1)
+        cv2.putText(page, f"Total fee: {fee} EUR", (60, 960), cv2.FONT_HERSHEY_SIMPLEX, 0.8, 0, 2)
+        return page
+
+    page_a, page_b = invoice("10,000"), invoice("95,000")
+    reader = mock_get_reader.return_value
+    reader.readtext.side_effect = lambda img, **kw: ["fee 10,000"] if img is page_a else ["fee 95,000"]
+    reader.readtext_batched.side_effect = lambda imgs, **kw: [["fee 10,000"], ["fee 95,000"]]
+    extractor = EmbeddedContentExtractor()
+    extractor.cache = OcrCache(tmp_path / "pages.db")
+    assert extractor.ocr_images([page_a]) == ["fee 10,000"]
+    assert extractor.ocr_images([page_b]) == ["fee 95,000"]       # same layout, different fee: a miss
+    assert extractor.ocr_images([page_a.copy()]) == ["fee 10,000"]  # identical pixels from another file: a hit
+    assert extractor.cache.stats() == {"hits": 1, "misses": 2, "hit_rate": 0.333}
+    assert reader.readtext.call_count == 2
+
+    logo = np.full((120, 300), 255, np.uint8)
+    cv2.putText(logo, "ACME Corp", (10, 80), cv2.FONT_HERSHEY_SIMPLEX, 2, 0, 4)
+    other = np.full((120, 300), 255, np.uint8)
+    cv2.putText(other, "Invoice 42", (10, 80), cv2.FONT_HERSHEY_SIMPLEX, 2, 0, 4)
+
+    cache = OcrCache(tmp_path / "ocr.db", max_entries=2)
+    cache.put(image_hash(logo), "ACME Corp")
+    assert cache.get(image_hash(logo.copy())) == "ACME Corp"
+    assert cache.get(image_hash(other)) is None
+
+    cache.put("b", "second")
+    cache.put("c", "third")  # over max_entries -> oldest ("ACME Corp") goes first
+    assert cache.get(image_hash(logo)) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+    # hits only buffer their access time until the next write
+    cache.get("c")
+    stored = dict(cache._db().execute("SELECT key, last_access FROM ocr_cache"))
+    assert cache._touched.keys() == {"c"} and stored["c"] < cache._touched["c"]
+    cache.flush()
+    assert not cache._touched and dict(cache._db().execute("SELECT key, last_access FROM ocr_cache"))["c"] > stored["c"]
+    cache.close()
+
+    lazy = OcrCache(tmp_path / "unused" / "ocr.db")
+    assert not (tmp_path / "unused").exists()  # nothing is created until the cache is used
+
+
+@patch('utils.ocr_content_extractor.camelot.read_pdf')
+def test_extract_tables_from_pdf_prescreens_pages(mock_read_pdf):
+    """Camelot only sees candidate pages, with lattice/stream picked per page"""
+    import pandas as pd
+    from utils.ocr_content_extractor import EmbeddedContentExtractor
+    from utils.pdf_extractor import PdfExtraction, PdfPage
+
+    def fake_read_pdf(path, flavor, pages):
+        if flavor == "lattice":
+            return []  # forces the per-page stream retry
+        return [Mock(page=p, df=pd.DataFrame([["a", "b"]]), parsing_report={}) for p in pages.split(",")]
+    mock_read_pdf.side_effect = fake_read_pdf
+
+    extraction = PdfExtraction(source="x.pdf", page_count=4, metadata={}, pages=[
+        PdfPage(number=1, text="prose", width=600, height=800),
+        PdfPage(number=2, text="grid", width=600, height=800, ruling_lines=12),
+        PdfPage(number=3, text="prose", width=600, height=800),
+        PdfPage(number=4, text="cols", width=600, height=800, aligned_rows=5),
+    ])
+    extractor = EmbeddedContentExtractor()
+    extractor.tables_config.update(backend="camelot", max_workers=1)
+    docs = extractor.extract_tables_from_pdf("x.pdf", extraction=extraction)
+
+    calls = [(c.kwargs["flavor"], c.kwargs["pages"]) for c in mock_read_pdf.call_args_list]
+    assert calls == [("lattice", "2"), ("stream", "2"), ("stream", "4")]
+    assert [d.metadata["page"] for d in docs] == [2, 4]
+
+
+@patch('utils.ocr_content_extractor.camelot.read_pdf', return_value=[])
+def test_pymupdf_table_engine_falls_back_to_camelot(mock_read_pdf, tmp_path):
+    """Ruled tables come from PyMuPDF find_tables; pages it can't resolve go to camelot"""
+    import fitz
+    from utils.ocr_content_extractor import EmbeddedContentExtractor
+    from utils.pdf_extractor import extract_pdf
+
+    pdf_path = tmp_path / "tables.pdf"
+    doc = fitz.open()
+    ruled = doc.new_page()
+    for r in range(4):
+        for c in range(3):
+            rect = fitz.Rect(72 + c * 100, 100 + r * 20, 172 + c * 100, 120 + r * 20)
+            ruled.draw_rect(rect, width=0.5)
+            ruled.insert_text((rect.x0 + 4, rect.y0 + 14), f"r{r}c{c}", fontsize=9)
+    borderless = doc.new_page()
+    for r in range(5):
+        for c in range(3):
+            borderless.insert_text((72 + c * 120, 100 + r * 16), f"item{r}-{c}", fontsize=9)
+    doc.save(pdf_path)
+    doc.close()
+
+    extractor = EmbeddedContentExtractor()
+    extractor.tables_config.update(backend="pymupdf", camelot_fallback=True, max_workers=1)
+    docs = extractor.extract_tables_from_pdf(str(pdf_path), extraction=extract_pdf(str(pdf_path)))
+
+    assert [(d.metadata["page"], d.metadata["engine"]) for d in docs] == [(1, "pymupdf")]
+    assert docs[0].page_content.splitlines()[0] == "r0c0,r0c1,r0c2"
+    assert [(c.kwargs["flavor"], c.kwargs["pages"]) for c in mock_read_pdf.call_args_list] == [("stream", "2")]
+
+    # a camelot group that fails doesn't discard the tables PyMuPDF already found
+    mock_read_pdf.side_effect = RuntimeError("ghostscript missing")
+    docs = extractor.extract_tables_from_pdf(str(pdf_path), extraction=extract_pdf(str(pdf_path)))
+    assert [(d.metadata["page"], d.metadata["engine"]) for d in docs] == [(1, "pymupdf")]
+
+
+def test_camelot_worker_pool_matches_inline_and_falls_back(tmp_path):
+    """max_workers>1 parses page groups on a reused spawn pool; groups the pool can't run go inline"""
+    import fitz
+    import utils.ocr_content_extractor as oce
+    from utils.pdf_extractor import extract_pdf
+
+    pdf_path = tmp_path / "columns.pdf"
+    doc = fitz.open()
+    for page_no in range(4):
+        page = doc.new_page()
+        for r in range(5):
+            for c in range(3):
+                page.insert_text((72 + c * 120, 100 + r * 16), f"p{page_no}r{r}c{c}", fontsize=9)
+    doc.save(pdf_path)
+    doc.close()
+    pages = extract_pdf(str(pdf_path)).pages
+
+    extractor = oce.EmbeddedContentExtractor()
+    extractor.tables_config.update(max_workers=1, pages_per_group=1)
+    inline = extractor._camelot_tables(str(pdf_path), pages)
+    assert sorted(page for page, _, _ in inline) == [1, 2, 3, 4]
+
+    extractor.tables_config.update(max_workers=2, parallel_min_pages=0)
+    try:
+        with patch('utils.ocr_content_extractor.os.cpu_count', return_value=2):
+            parallel = extractor._camelot_tables(str(pdf_path), pages)
+            pool = oce.get_table_pool(2)
+            assert extractor._camelot_tables(str(pdf_path), pages) == parallel and oce.get_table_pool(2) is pool
+            # a worker function that can't be pickled fails every pooled group -> all rerun inline
+            with patch('utils.ocr_content_extractor._camelot_group_worker', lambda *args: ([], None)):
+                fallback = extractor._camelot_tables(str(pdf_path), pages)
+    finally:
+        if oce._TABLE_POOL is not None:
+            oce.discard_table_pool(oce._TABLE_POOL[1])
+    assert [(page, csv) for page, csv, _ in parallel] == [(page, csv) for page, csv, _ in inline]
+    assert [(page, csv) for page, csv, _ in fallback] == [(page, csv) for page, csv, _ in inline]
+
+
+def test_load_documents_pptx_single_pass(tmp_path):
+    """A .pptx is opened once: slide text, notes, tables and pictures without unstructured"""
+    import io
+    import cv2
+    import numpy as np
+    from pptx import Presentation
+    from pptx.util import Inches
+    from utils.document_ops import load_documents
+    from utils.ocr_content_extractor import EmbeddedContentExtractor
+
+    deck = tmp_path / "deck.pptx"
+    prs = Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[5])
+    slide.shapes.title.text = "Quarterly results"
+    table = slide.shapes.add_table(2, 2, Inches(1), Inches(2), Inches(4), Inches(1)).table
+    for r, row in enumerate([["region", "revenue"], ["EMEA", "1,200"]]):
+        for c, value in enumerate(row):
+            table.cell(r, c).text = value
+    png = cv2.imencode(".png", np.full((40, 120, 3), 255, np.uint8))[1].tobytes()
+    slide.shapes.add_picture(io.BytesIO(png), Inches(5), Inches(1))
+    slide.notes_slide.notes_text_frame.text = "Mention the EMEA growth"
+    prs.save(deck)
+
+    extractor = Mock()
+    extractor.extract_images_from_pptx.return_value = []
+    extractor.extract_tables_from_pptx.side_effect = lambda path, extraction: \
+        EmbeddedContentExtractor.extract_tables_from_pptx(Mock(), path, extraction=extraction)
+    with patch('utils.document_ops.UnstructuredPowerPointLoader') as mock_unstructured, \
+         patch('utils.document_ops.load_config', return_value={}):
+        docs = load_documents([deck], extractor, enable_ocr=True)
+
+    mock_unstructured.assert_not_called()
+    extraction = extractor.extract_images_from_pptx.call_args.kwargs["extraction"]
+    assert len(extraction.slides[0].pictures) == 1
+    assert docs[0].metadata["type"] == "pptx_text"
+    assert docs[0].page_content == "Quarterly results\n\nMention the EMEA growth"
+    assert docs[1].page_content == 'region,revenue\nEMEA,"1,200"\n'
+
+
+def test_extract_docx_single_parse(tmp_path):
+    """Body text, tables (CSV) and image parts come from one python-docx parse"""
+    import io
+    import cv2
+    import numpy as np
+    from docx import Document as DocxDocument
+    from utils.docx_extractor import extract_docx
+    from utils.ocr_content_extractor import EmbeddedContentExtractor
+
+    path = tmp_path / "report.docx"
+    doc = DocxDocument()
+    doc.add_paragraph("Introduction")
+    table = doc.add_table(rows=2, cols=3)
+    table.cell(0, 0).merge(table.cell(0, 1)).text = "Region"
+    table.cell(0, 2).text = "Revenue"
+    table.cell(1, 0).text = "EMEA"
+    table.cell(1, 1).text = "note"
+    table.cell(1, 2).text = "1,200"
+    doc.add_paragraph("Conclusion")
+    doc.add_picture(io.BytesIO(cv2.imencode(".png", np.zeros((20, 20, 3), np.uint8))[1].tobytes()))
+    doc.save(path)
+
+    extraction = extract_docx(str(path))
+    assert extraction.text_documents()[0].page_content == "Introduction\nConclusion"
+    assert extraction.tables == [[["Region", "Revenue"], ["EMEA", "note", "1,200"]]]
+    assert len(extraction.images) == 1
+
+    with patch('utils.ocr_content_extractor.extract_docx') as mock_extract:
+        docs = EmbeddedContentExtractor.extract_tables_from_docx(Mock(), str(path), extraction=extraction)
+    mock_extract.assert_not_called()
+    assert docs[0].page_content == 'Region,Revenue\nEMEA,note,"1,200"\n'
+
+
+def test_extract_docx_keeps_header_footer_and_text_box_text(tmp_path):
+    """Headers, footers and text boxes are indexed like Docx2txtLoader did"""
+    import docx2txt
+    from docx import Document as DocxDocument
+    from docx.oxml import parse_xml
+    from utils.docx_extractor import extract_docx
+
+    path = tmp_path / "contract.docx"
+    doc = DocxDocument()
+    doc.sections[0].header.paragraphs[0].text = "CONFIDENTIAL HEADER ACME"
+    doc.sections[0].footer.paragraphs[0].text = "Footer page text"
+    doc.add_paragraph("Body paragraph one")
+    text_box = parse_xml(
+        '<w:p xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+        'xmlns:v="urn:schemas-microsoft-com:vml"><w:r><w:pict><v:shape style="width:100pt;height:40pt">'
+        '<v:textbox><w:txbxContent><w:p><w:r><w:t>Callout in text box</w:t></w:r></w:p></w:txbxContent>'
+        '</v:textbox></v:shape></w:pict></w:r></w:p>'
+    )
+    doc.element.body.insert(len(doc.element.body) - 1, text_box)  # before sectPr
+    doc.save(path)
+
+    text = extract_docx(str(path)).text_documents()[0].page_content
+    assert text.split("\n") == ["CONFIDENTIAL HEADER ACME", "Body paragraph one", "Callout in text box", "Footer page text"]
+    assert sorted(text.split()) == sorted(docx2txt.process(str(path)).split())
+
+
+def test_ocr_preprocessing_adapts_resolution():
+    """Tiny images are skipped, huge ones downsampled, render zoom follows glyph / native size"""
+    import fitz
+    import numpy as np
+    from utils.ocr_content_extractor import EmbeddedContentExtractor
+
+    extractor = EmbeddedContentExtractor()
+    extractor.preprocess_config.update(target_glyph_px=32, min_zoom=1.0, max_zoom=4.0, max_side=4000, min_side=24)
+
+    assert extractor.preprocess_image(np.zeros((16, 200, 3), np.uint8)) is None
+    photo = extractor.preprocess_image(np.zeros((3000, 4000, 3), np.uint8))
+    assert photo.shape == (3000, 4000)
+    assert extractor.preprocess_image(np.zeros((6000, 8000), np.uint8)).shape == (3000, 4000)
+
+    letter = fitz.Rect(0, 0, 612, 792)
+    assert extractor.render_zoom(letter, glyph_height=16) == 2.0   # large type needs less zoom
+    assert extractor.render_zoom(letter, glyph_height=4) == 4.0    # fine print hits max_zoom
+    assert extractor.render_zoom(letter, native_scale=1.5, glyph_height=4) == 1.5  # don't upsample a scan
+    assert extractor.render_zoom(fitz.Rect(0, 0, 2000, 2000), glyph_height=4) == 2.0  # capped by max_side
+
+
+def test_stage_budgets_keep_partial_results(tmp_path):
+    """An over-budget stage stops early and its documents are flagged partial"""
+    import fitz
+    import numpy as np
+    from langchain.schema import Document
+    from utils.deadline import Deadline
+    from utils.document_ops import load_documents
+    from utils.ocr_content_extractor import EmbeddedContentExtractor
+
+    # OCR stops pulling jobs once the deadline reports expiry; queued images are dropped, not OCR'd
+    extractor = EmbeddedContentExtractor()
+    extractor.cache = None
+    extractor.batch_config.update(batch_size=1)  # OCR window of 4 jobs
+    calls = {"n": 0}
+
+    def expires_after(n):
+        def expired():
+            calls["n"] += 1
+            return calls["n"] > n
+        return expired
+
+    deadline = Mock(spec=Deadline)
+    deadline.expired.side_effect = expires_after(5)
+    jobs = [(i, np.zeros((40, 80), np.uint8), {"page": i}) for i in range(10)]
+    ocr = lambda images, deadline=None: ["text"] * len(images)
+    with patch.object(EmbeddedContentExtractor, 'ocr_images', side_effect=ocr) as mock_ocr:
+        docs = extractor._run_ocr_jobs(iter(jobs), deadline)
+    assert [d.metadata["page"] for d in docs] == [0, 1, 2, 3]  # first window only; job 4 is dropped
+    assert mock_ocr.call_count == 1
+
+    # ... and inside a window, batches after the expiry are skipped
+    reader = Mock()
+    reader.readtext_batched.side_effect = lambda imgs, **kw: [["text"]] * len(imgs)
+    calls["n"] = 0
+    deadline.expired.side_effect = expires_after(1)
+    extractor.batch_config.update(batch_size=2)
+    with patch('utils.ocr_content_extractor.get_ocr_reader', return_value=reader):
+        texts = extractor.ocr_images([np.zeros((40, 80), np.uint8)] * 4, deadline=deadline)
+    assert texts == ["text", "text", "", ""] and reader.readtext_batched.call_count == 1
+
+    # load_documents flags the stage that ran out of time, not the others
+    pdf_path = tmp_path / "report.pdf"
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Annual report text layer")
+    doc.save(pdf_path)
+    ocr_extractor = Mock()
+    ocr_extractor.extract_images_from_pdf.side_effect = lambda path, extraction, deadline: (
+        [Document(page_content="scanned text", metadata={"source": path})] if deadline.expired() else []
+    )
+    ocr_extractor.extract_tables_from_pdf.return_value = []
+    config = {"ingestion": {"dedup": {"enabled": False}, "budgets": {"ocr_seconds": 0}}}
+    with patch('utils.document_ops.load_config', return_value=config):
+        docs = load_documents([pdf_path], ocr_extractor, enable_ocr=True)
+
+    assert "partial" not in docs[0].metadata
+    assert docs[1].metadata["partial"] is True and docs[1].metadata["budget_exceeded"] == "ocr"
+
+
+@patch('src.document_chat.retrieval.ModelLoader')
+def test_rag_rewrites_question_only_when_needed(mock_model_loader):
+    """First-turn and self-contained questions skip the contextualize LLM call"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langchain_core.runnables import RunnableLambda
+    from langchain.schema import Document
+    from src.document_chat.retrieval import needs_rewrite
+
+    history = [HumanMessage(content="Summarize the 2023 annual report"), AIMessage(content="Revenue grew 12%.")]
+    assert not needs_rewrite("What was revenue in 2023?", [], "heuristic")
+    assert not needs_rewrite("What was the revenue of ACME Corp in 2023?", history, "heuristic")
+    assert needs_rewrite("How did it change in 2024?", history, "heuristic")
+    assert needs_rewrite("And margins?", history, "heuristic")
+    assert needs_rewrite("What was revenue in 2023?", history, "when_history")
+    assert not needs_rewrite("How did it change?", history, "never")
+
+    llm = FakeListChatModel(responses=["Revenue was $5M."])
+    mock_model_loader.return_value.load_llm.return_value = llm
+    queries = []
+    retriever = RunnableLambda(lambda q: queries.append(q) or [Document(page_content="Revenue: $5M")])
+    rag = ConversationalRAG(session_id="s1", retriever=retriever, rewrite_policy="heuristic")
+
+    assert rag.invoke("What was revenue in 2023?", chat_history=[]) == "Revenue was $5M."
+    assert queries == ["What was revenue in 2023?"]  # one LLM call: the answer, no rewrite
+
+    llm.responses, llm.i = ["What was ACME revenue in 2024?", "Revenue was $6M."], 0
+    assert rag.invoke("And in 2024?", chat_history=history) == "Revenue was $6M."
+    assert queries[-1] == "What was ACME revenue in 2024?"
+
+
+@patch('src.document_chat.retrieval.ModelLoader')
+def test_semantic_answer_cache(mock_model_loader):
+    """Paraphrased first-turn questions reuse the cached answer until the index changes"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from langchain_core.runnables import RunnableLambda
+    from src.document_chat.answer_cache import SemanticAnswerCache
+
+    cache = SemanticAnswerCache(similarity_threshold=0.9, ttl_seconds=60, max_entries=2)
+    cache.put([1.0, 0.0, 0.0], "v1", "answer A")
+    assert cache.get([0.98, 0.05, 0.0], "v1") == "answer A"   # paraphrase
+    assert cache.get([0.98, 0.05, 0.0], "v2") is None         # index rebuilt
+    assert cache.get([0.0, 1.0, 0.0], "v1") is None           # different question
+    cache.put([0.0, 1.0, 0.0], "v1", "answer B")
+    cache.put([0.0, 0.0, 1.0], "v1", "answer C")              # evicts least recently used (A)
+    assert cache.get([1.0, 0.0, 0.0], "v1") is None
+    assert cache.get([0.0, 1.0, 0.0], "v1") == "answer B"
+    assert cache.stats()["hits"] == 2 and cache.stats()["entries"] == 2
+    cache.ttl_seconds = -1
+    assert cache.get([0.0, 1.0, 0.0], "v1") is None and cache.stats()["entries"] == 0
+
+    llm = FakeListChatModel(responses=["Revenue was $5M.", "unexpected second call"], cache=False)
+    mock_model_loader.return_value.load_llm.return_value = llm
+    rag = ConversationalRAG(session_id="cache-test", retriever=RunnableLambda(lambda q: []))
+    rag.answer_cache = SemanticAnswerCache(similarity_threshold=0.9)
+    rag.index_version = "v1"
+    vectors = {"What was revenue?": [1.0, 0.1], "what was the revenue": [1.0, 0.12]}
+    rag.embeddings = Mock()
+    rag.embeddings.embed_query.side_effect = vectors.__getitem__
+
+    assert rag.invoke("What was revenue?") == "Revenue was $5M."
+    assert rag.invoke("what was the revenue") == "Revenue was $5M."  # served from cache
+    assert llm.i == 1
+
+
+def test_retrieval_result_and_query_embedding_caches():
+    """Repeated queries skip embedding and vector search; a new index version invalidates results"""
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from src.document_chat.retrieval_cache import CachedQueryEmbeddings, CachedVectorStoreRetriever, LRUCache
+
+    base = Mock(wraps=DeterministicFakeEmbedding(size=16))
+    embeddings = CachedQueryEmbeddings(base, LRUCache(max_entries=8))
+    store = FAISS.from_texts(["revenue grew", "costs fell", "headcount flat"], embeddings)
+    results = LRUCache(max_entries=8)
+    results.ensure_version("v1")
+    retriever = CachedVectorStoreRetriever(vectorstore=store, search_kwargs={"k": 2},
+                                           index_version="v1", result_cache=results)
+
+    first = retriever.invoke("What was revenue?")
+    with patch.object(FAISS, "similarity_search_by_vector", side_effect=AssertionError("searched again")):
+        again = retriever.invoke("  what was REVENUE? ")   # same normalized question
+    assert [d.page_content for d in again] == [d.page_content for d in first]
+    assert base.embed_query.call_count == 1
+    assert results.stats()["hits"] == 1
+
+    results.ensure_version("v2")                          # index rebuilt
+    assert results.stats()["entries"] == 0
+    retriever.index_version = "v2"
+    assert len(retriever.invoke("What was revenue?")) == 2
+
+
+def test_context_packing_dedups_trims_and_budgets():
+    """Overlapping chunks are dropped, long tables keep header + relevant rows, budget is respected"""
+    from langchain_core.documents import Document
+    from src.document_chat.context_packer import pack_context
+
+    prose = "Revenue grew to five million dollars in 2023 driven by subscriptions. " * 3
+    overlap = prose + "Minor footnote."
+    rows = ["region,year,revenue"] + [f"r{i},2022,{i}" for i in range(300)] + ["north,2023,5000000"]
+    table = Document(page_content="\n".join(rows), metadata={"type": "pdf_table"})
+    docs = [Document(page_content=prose), Document(page_content=overlap), table]
+
+    context, stats = pack_context(docs, "What was 2023 revenue?", max_context_tokens=200,
+                                  max_chunk_tokens=120, min_chunk_tokens=10)
+    assert stats["duplicates"] == 1 and stats["trimmed"] == 1 and stats["chunks_kept"] == 2
+    assert "region,year,revenue" in context and "north,2023,5000000" in context
+    assert "Minor footnote" not in context
+    assert stats["tokens_out"] <= 200
+    assert stats["tokens_saved"] == stats["tokens_in"] - stats["tokens_out"] > 0
+
+
+@patch('src.document_chat.retrieval.ModelLoader')
+def test_async_rag_invoke_and_stream(mock_model_loader):
+    """ainvoke/astream answer on the event loop through the cached FAISS retriever"""
+    import asyncio
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from src.document_chat.retrieval_cache import CachedVectorStoreRetriever, LRUCache
+
+    mock_model_loader.return_value.load_llm.return_value = FakeListChatModel(responses=["Revenue was $5M."], cache=False)
+    store = FAISS.from_texts(["revenue was five million", "costs fell"], DeterministicFakeEmbedding(size=16))
+    results = LRUCache(max_entries=8)
+    retriever = CachedVectorStoreRetriever(vectorstore=store, search_kwargs={"k": 1},
+                                           index_version="v1", result_cache=results)
+    rag = ConversationalRAG(session_id=None, retriever=retriever)
+
+    async def run():
+        answers = await asyncio.gather(*(rag.ainvoke("What was revenue?") for _ in range(20)))
+        chunks = [chunk async for chunk in rag.astream("What was revenue?")]
+        return answers, chunks
+
+    answers, chunks = asyncio.run(run())
+    assert answers == ["Revenue was $5M."] * 20
+    assert "".join(chunks) == "Revenue was $5M." and len(chunks) > 1
+    assert results.stats()["hits"] == 20   # first lookup misses, the rest reuse the ranked ids
+
+
+def test_local_reranker_diversity_lexical_and_type_priors():
+    """Over-fetched candidates are reranked: duplicates are skipped, tables beat OCR at equal similarity"""
+    import numpy as np
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from src.document_chat.reranker import LocalReranker, stored_vectors
+    from src.document_chat.retrieval_cache import CachedVectorStoreRetriever
+
+    reranker = LocalReranker(mmr_lambda=0.5, lexical_weight=0.2,
+                             type_priors={"pdf_table": 0.05, "pdf_embedded_content": -0.05})
+    docs = [
+        Document(page_content="revenue 2023 summary", metadata={"type": "pdf_text"}),
+        Document(page_content="revenue 2023 summary copy", metadata={"type": "pdf_text"}),
+        Document(page_content="region,revenue,2023", metadata={"type": "pdf_table"}),
+        Document(page_content="scanned revenue 2023", metadata={"type": "pdf_embedded_content"}),
+    ]
+    vectors = np.array([[1.0, 0.0, 0.0], [1.0, 0.01, 0.0], [0.8, 0.6, 0.0], [0.8, 0.0, 0.6]], dtype=np.float32)
+    picked = reranker.rerank("2023 revenue", [1.0, 0.0, 0.0], docs, vectors, k=2)
+    assert [d.metadata["type"] for d in picked] == ["pdf_text", "pdf_table"]  # near-duplicate skipped
+    scores = reranker.scores("2023 revenue", [1.0, 0.0, 0.0], docs, vectors)
+    assert scores[2] - scores[3] == pytest.approx(0.1)                       # same cosine and terms
+    assert reranker.fetch_k(3) == 20 and reranker.fetch_k(10) == 40
+
+    embeddings = DeterministicFakeEmbedding(size=8)
+    store = FAISS.from_texts([f"chunk {i}" for i in range(30)], embeddings)
+    candidates = store.similarity_search("chunk 3", k=5)
+    assert np.allclose(stored_vectors(store, candidates)[0], embeddings.embed_query(candidates[0].page_content))
+    from src.document_chat.reranker import _docstore_rows
+    rows = _docstore_rows(store, store.index_to_docstore_id)
+    assert _docstore_rows(store, store.index_to_docstore_id) is rows           # built once per store
+    store.add_texts(["chunk 30"])
+    assert len(_docstore_rows(store, store.index_to_docstore_id)) == 31       # rebuilt after adds
+    retriever = CachedVectorStoreRetriever(vectorstore=store, search_kwargs={"k": 3}, reranker=reranker)
+    assert len(retriever.invoke("chunk 3")) == 3
+
+
+@patch('src.document_chat.retrieval.ModelLoader')
+def test_multi_index_fan_out_query(mock_model_loader):
+    """One question searches several session indexes and merges candidates by score"""
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    embeddings = DeterministicFakeEmbedding(size=16)
+    mock_model_loader.return_value.load_embeddings.return_value = embeddings
+    mock_model_loader.return_value.load_llm.return_value = FakeListChatModel(responses=["Both vendors renew yearly."], cache=False)
+    with tempfile.TemporaryDirectory() as base:
+        paths = []
+        for session, texts in {"vendor_a": ["renewal term", "payment terms a"], "vendor_b": ["renewal clause", "liability b"]}.items():
+            path = os.path.join(base, session)
+            FAISS.from_texts(texts, embeddings).save_local(path)
+            paths.append(path)
+
+        rag = ConversationalRAG(session_id=None)
+        retriever = rag.load_retriever_from_faiss_indexes(paths, k=3)
+        docs = retriever.invoke("renewal term")
+        assert len(docs) == 3
+        assert docs[0].page_content == "renewal term" and docs[0].metadata["index"] == "vendor_a"
+        assert {d.metadata["index"] for d in docs} == {"vendor_a", "vendor_b"}
+        assert rag.invoke("When do the contracts renew?") == "Both vendors renew yearly."
+
+
+def test_metadata_index_prefilters_faiss_search():
+    """Metadata filters resolve to FAISS row ids that restrict the search before scoring"""
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from utils.metadata_index import MetadataIndex
+    from src.document_chat.retrieval_cache import CachedVectorStoreRetriever
+
+    texts, metas = [], []
+    for page in range(1, 31):
+        texts.append(f"revenue discussion page {page}")
+        metas.append({"source": "data/s1/ab12.pdf", "page": page, "type": "pdf_text"})
+    texts.append("quarter,revenue")
+    metas.append({"source": "data/s1/ab12.pdf", "page": 12, "type": "pdf_table"})
+    texts.append("other file")
+    metas.append({"source": "data/s1/cd34.docx", "type": "docx_table"})
+    store = FAISS.from_texts(texts, DeterministicFakeEmbedding(size=16), metadatas=metas)
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        MetadataIndex.build(store, {"data/s1/ab12.pdf": "Annual Report.pdf"}).save(index_dir)
+        index = MetadataIndex.load_or_build(index_dir, store)
+    assert index.select({"type": "tables"}).tolist() == [30, 31]
+    assert index.select({"file": "annual report.pdf", "page": {"gte": 10, "lte": 20}}).size == 12
+    assert index.select({"file": "missing.pdf"}).size == 0
+
+    retriever = CachedVectorStoreRetriever(
+        vectorstore=store, metadata_index=index,
+        search_kwargs={"k": 5, "metadata_filter": {"file": "Annual Report.pdf", "page": {"gte": 10, "lte": 20}}},
+    )
+    docs = retriever.invoke("revenue")
+    assert len(docs) == 5 and all(10 <= d.metadata["page"] <= 20 for d in docs)
+    retriever.search_kwargs = {"k": 5, "metadata_filter": {"type": "tables"}}
+    assert {d.metadata["type"] for d in retriever.invoke("revenue")} == {"pdf_table", "docx_table"}
+
+
+@pytest.mark.parametrize("filters, reason", [
+    ('{"author": "me"}', "Unsupported metadata filter field"),
+    ('{"page": {"gte": "ten"}}', "must be a number"),
+    ('{"page": {"from": 1}}', "Range filter"),
+    ('["tables"]', "filter must be an object"),
+    ("not json", "Invalid filters"),
+])
+def test_chat_query_rejects_invalid_filters(filters, reason):
+    """Bad metadata filters are a client error, reported before any index is loaded"""
+    response = client.post("/chat/query", data={
+        "question": "q", "session_id": "s1", "use_session_dirs": "false", "filters": filters,
+    })
+    assert response.status_code == 400
+    assert reason in response.json()["detail"]
+
+
+@patch('src.document_chat.retrieval.ModelLoader')
+def test_speculative_retrieval_alongside_rewrite(mock_model_loader):
+    """Raw-question retrieval overlaps the rewrite and is reused unless the rewrite drifts"""
+    import asyncio
+    from langchain_core.documents import Document
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langchain_core.runnables import RunnableLambda
+
+    searched = []
+    retriever = RunnableLambda(lambda q: searched.append(q) or [Document(page_content=f"about {q}")])
+    history = [HumanMessage(content="Tell me about ACME"), AIMessage(content="ACME sells anvils.")]
+
+    def run(rewrite, embeddings=None, use_async=False):
+        searched.clear()
+        mock_model_loader.return_value.load_llm.return_value = FakeListChatModel(
+            responses=[rewrite, "answer"], cache=False)
+        rag = ConversationalRAG(session_id=None, retriever=retriever, rewrite_policy="always")
+        rag.embeddings = embeddings
+        call = rag.ainvoke("What does it sell?", chat_history=history) if use_async \
+            else rag.invoke("What does it sell?", chat_history=history)
+        answer = asyncio.run(call) if use_async else call
+        assert answer == "answer"
+        return list(searched)
+
+    assert run("what does it sell?") == ["What does it sell?"]                    # same question
+    assert run("What does ACME sell?") == ["What does it sell?", "What does ACME sell?"]
+
+    close = Mock()
+    close.embed_query.side_effect = lambda q: [1.0, 0.05] if "ACME" in q else [1.0, 0.0]
+    assert run("What does ACME sell?", embeddings=close) == ["What does it sell?"]  # close enough
+    far = Mock()
+    far.aembed_query = AsyncMock(side_effect=lambda q: [0.0, 1.0] if "ACME" in q else [1.0, 0.0])
+    assert run("What does ACME sell?", embeddings=far, use_async=True) == ["What does it sell?", "What does ACME sell?"]
+
+
+@patch('src.document_analyzer.data_analysis.ModelLoader')
+def test_map_reduce_analysis_for_large_documents(mock_model_loader):
+    """Large documents are split into page groups, condensed concurrently, then reduced to Metadata"""
+    import asyncio
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from src.document_analyzer.data_analysis import split_page_groups
+
+    text = "\n".join(f"\n--- Page {n} ---\n" + "word " * 200 for n in range(1, 26))
+    groups = split_page_groups(text, pages_per_group=10, max_group_tokens=100000)
+    assert [label for label, _ in groups] == ["pages 1-10", "pages 11-20", "pages 21-25"]
+    assert [label for label, _ in split_page_groups(text, 10, 600)][:2] == ["pages 1-2", "pages 3-4"]
+
+    metadata = json.dumps({"Summary": ["Long report"], "Title": "Report", "Author": ["Jane"],
+                           "DateCreated": "2024", "LastModifiedDate": "2024", "Publisher": "ACME",
+                           "Language": "English", "PageCount": 25, "SentimentTone": "neutral"})
+    for use_async in (False, True):
+        llm = FakeListChatModel(responses=["notes"] * 3 + [metadata], cache=False)
+        mock_model_loader.return_value.load_llm.return_value = llm
+        analyzer = DocumentAnalyzer()
+        analyzer.settings.update(map_reduce_threshold_tokens=1000, pages_per_group=10, max_group_tokens=100000)
+        result = asyncio.run(analyzer.aanalyze_document(text)) if use_async else analyzer.analyze_document(text)
+        assert result["Title"] == "Report" and result["PageCount"] == 25
+        assert llm.i == 0  # three map calls + one reduce call, cycled back to the start
+
+    # notes over the reduce budget are condensed again (one more map call) before the reduce
+    llm = FakeListChatModel(responses=["notes " * 50] * 3 + ["condensed", metadata], cache=False)
+    mock_model_loader.return_value.load_llm.return_value = llm
+    analyzer = DocumentAnalyzer()
+    analyzer.settings.update(map_reduce_threshold_tokens=1000, pages_per_group=10, max_group_tokens=100000,
+                             max_reduce_tokens=100)
+    assert analyzer.analyze_document(text)["Title"] == "Report"
+    assert llm.i == 0  # three map calls, one condensing call, one reduce call
+    collapsed = analyzer._collapse_inputs([{"page_range": f"pages {n}-{n + 9}"} for n in (1, 11, 21)], ["notes " * 50] * 3)
+    assert [i["page_range"] for i in collapsed] == ["pages 1-30"]  # lone trailing note joins the last group
@@ -0,0 +1,36 @@
+from __future__ import annotations
+import time
+from typing import Optional
+
+
+class Deadline:
+    """
+    Cooperative time budget. Long loops call `expired()` between units of work and stop
+    early when it returns True; `hit` then records that the work was cut short, so callers
+    can flag what was produced as partial. `seconds=None` means no limit.
+    A child deadline never outlives its parent (e.g. a stage budget inside a per-file budget).
+    """
+
+    def __init__(self, seconds: Optional[float] = None, parent: Optional["Deadline"] = None):
+        now = time.monotonic()
+        own = now + seconds if seconds is not None else None
+        inherited = parent.expires_at if parent is not None else None
+        candidates = [t for t in (own, inherited) if t is not None]
+        self.expires_at: Optional[float] = min(candidates) if candidates else None
+        self.seconds = seconds
+        self.hit = False
+
+    def child(self, seconds: Optional[float]) -> "Deadline":
+        return Deadline(seconds, parent=self)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (never negative), or None when unbounded."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        if self.expires_at is not None and time.monotonic() >= self.expires_at:
+            self.hit = True
+            return True
+        return False
@@ -0,0 +1,141 @@
+from __future__ import annotations
+import re
+import zlib
+from hashlib import md5
+from typing import Any, Dict, List, Sequence
+import numpy as np
+from langchain.schema import Document
+from logger import GLOBAL_LOGGER as log
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _shingles(text: str, size: int) -> np.ndarray:
+    """Hash word n-grams of `text` into a uint64 array (32-bit values)."""
+    tokens = _TOKEN_RE.findall(text.lower())
+    if not tokens:
+        return np.empty(0, dtype=np.uint64)
+    if len(tokens) <= size:
+        grams = [" ".join(tokens)]
+    else:
+        grams = [" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+class MinHasher:
+    """
+    Vectorized MinHash: one (n_shingles x num_perm) numpy op per document,
+    LSH banding to find candidate pairs, signature agreement as Jaccard estimate.
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        sigs = np.full((len(texts), self.num_perm), _MAX_HASH, dtype=np.uint64)
+        for i, text in enumerate(texts):
+            hv = _shingles(text, self.shingle_size)
+            if hv.size:
+                # uint64 overflow wraps, which is fine for hashing purposes
+                phv = ((hv[:, None] * self._a + self._b) % _MERSENNE_PRIME) & _MAX_HASH
+                sigs[i] = phv.min(axis=0)
+        return sigs
+
+    @staticmethod
+    def _bands_for(threshold: float, num_perm: int) -> int:
+        """Pick the band count whose LSH S-curve midpoint (1/b)^(1/r) is closest to `threshold`."""
+        best, best_err = 1, float("inf")
+        for b in range(1, num_perm + 1):
+            if num_perm % b:
+                continue
+            r = num_perm // b
+            err = abs((1.0 / b) ** (1.0 / r) - threshold)
+            if err < best_err:
+                best, best_err = b, err
+        return best
+
+    def duplicates(self, texts: Sequence[str], threshold: float) -> np.ndarray:
+        """Return a boolean mask marking texts that near-duplicate an earlier text."""
+        n = len(texts)
+        drop = np.zeros(n, dtype=bool)
+        if n < 2:
+            return drop
+        sigs = self.signatures(texts)
+        bands = self._bands_for(threshold, self.num_perm)
+        rows = self.num_perm // bands
+
+        candidates: dict = {}
+        for band in range(bands):
+            # texts sharing every value of a band land in the same bucket
+            _, inverse = np.unique(sigs[:, band * rows:(band + 1) * rows], axis=0, return_inverse=True)
+            inverse = inverse.ravel()
+            order = np.argsort(inverse, kind="stable")
+            for members in np.split(order, np.flatnonzero(np.diff(inverse[order])) + 1):
+                for pos in range(1, len(members)):
+                    candidates.setdefault(int(members[pos]), set()).update(members[:pos].tolist())
+
+        for j in sorted(candidates):
+            earlier = np.fromiter((i for i in candidates[j] if not drop[i]), dtype=np.int64)
+            if earlier.size == 0:
+                continue
+            similarity = (sigs[earlier] == sigs[j]).mean(axis=1)
+            if similarity.max() >= threshold:
+                drop[j] = True
+        return drop
+
+
+def deduplicate_documents(
+    docs: List[Document],
+    *,
+    near_duplicates: bool = True,
+    similarity_threshold: float = 0.9,
+    num_perm: int = 128,
+    shingle_size: int = 5,
+) -> List[Document]:
+    """
+    Drop exact duplicates (normalized md5) and near-duplicates (MinHash Jaccard >= threshold).
+    The first occurrence wins, so text-layer docs loaded before OCR/table docs are kept.
+    Near-duplicates are only matched within one `source`: documents from the same template
+    (contracts differing in a fee or a term) are different facts, and only an exact copy
+    is dropped across files.
+    """
+    seen_hashes = set()
+    unique_docs: List[Document] = []
+    for d in docs:
+        text = _normalize(d.page_content)
+        if not text:
+            continue
+        text_hash = md5(text.encode("utf-8")).hexdigest()
+        if text_hash in seen_hashes:
+            continue
+        seen_hashes.add(text_hash)
+        unique_docs.append(d)
+    exact_dropped = len(docs) - len(unique_docs)
+
+    near_dropped = 0
+    if near_duplicates and len(unique_docs) > 1:
+        hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+        by_source: Dict[Any, List[int]] = {}
+        for i, d in enumerate(unique_docs):
+            by_source.setdefault(d.metadata.get("source") or d.metadata.get("file_path"), []).append(i)
+        drop = np.zeros(len(unique_docs), dtype=bool)
+        for positions in by_source.values():
+            if len(positions) > 1:
+                mask = hasher.duplicates([unique_docs[i].page_content for i in positions], similarity_threshold)
+                drop[np.asarray(positions)[mask]] = True
+        near_dropped = int(drop.sum())
+        unique_docs = [d for d, dup in zip(unique_docs, drop) if not dup]
+
+    log.info("Documents deduplicated", before=len(docs), after=len(unique_docs),
+             exact_dropped=exact_dropped, near_dropped=near_dropped, threshold=similarity_threshold)
+    return unique_docs
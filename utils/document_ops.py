@@ -1,92 +1,133 @@
 from __future__ import annotations
 from pathlib import Path
-from typing import Iterable, List
+from typing import Iterable, List, Optional
 from fastapi import UploadFile
 from langchain.schema import Document
 from logger import GLOBAL_LOGGER as log
 from exception.custom_exception import DocumentPortalException
 from langchain_community.document_loaders import (
   UnstructuredMarkdownLoader,
-  PyPDFLoader,
-  Docx2txtLoader,
   TextLoader,
   UnstructuredPowerPointLoader, 
   UnstructuredExcelLoader,
   CSVLoader,
 )
-from hashlib import md5
 from utils.ocr_content_extractor import EmbeddedContentExtractor
+from utils.config_loader import load_config
+from utils.deadline import Deadline
+from utils.dedup import deduplicate_documents
+from utils.docx_extractor import extract_docx
+from utils.pdf_extractor import extract_pdf
+from utils.pptx_extractor import extract_pptx
+def _flag_partial(stage_docs: List[Document], deadline: Deadline, stage: str, path: Path) -> List[Document]:
+    """Mark docs of a stage that was cut short by its time budget."""
+    if deadline.hit:
+        log.warning("Ingestion stage over budget, keeping partial results", path=str(path), stage=stage,
+                    budget_seconds=deadline.seconds, docs=len(stage_docs))
+        for d in stage_docs:
+            d.metadata.update(partial=True, budget_exceeded=stage)
+    return stage_docs
+
+
 def load_documents(paths: Iterable[Path], ocr_extractor: "EmbeddedContentExtractor", enable_ocr: bool = False) -> List[Document]:
-    """Load text + OCR docs, ensuring no duplicates."""
+    """
+    Load text + OCR docs, dropping exact and near duplicates (see `ingestion.dedup` in config).
+    Each file and each stage (text, OCR, tables) runs under a time budget (`ingestion.budgets`);
+    a stage that overruns stops early and its docs carry `partial=True`.
+    """
     docs: List[Document] = []
-    seen_hashes = set()
+    ingestion_config = load_config().get("ingestion") or {}
+    dedup_config = dict(ingestion_config.get("dedup") or {})
+    budgets = ingestion_config.get("budgets") or {}
+
+    def budget(name: str) -> Optional[float]:
+        return budgets.get(f"{name}_seconds") if budgets.get("enabled", True) else None
 
     for p in paths:
         ext = p.suffix.lower()
+        file_deadline = Deadline(budget("file"))
 
         # ---------- normal loaders ----------
+        pdf = pptx = docx = None
         if ext == ".pdf":
-            loader = PyPDFLoader(str(p))
+            loader = None  # single-pass PyMuPDF extraction below
         elif ext == ".docx":
-            loader = Docx2txtLoader(str(p))
+            loader = None  # single-pass python-docx extraction below
         elif ext == ".txt":
             loader = TextLoader(str(p), encoding="utf-8")
         elif ext == ".md":
             loader = UnstructuredMarkdownLoader(str(p))
-        elif ext in (".ppt", ".pptx"):
-            loader = UnstructuredPowerPointLoader(str(p))
+        elif ext == ".pptx":
+            loader = None  # single-pass python-pptx extraction below
+        elif ext == ".ppt":
+            loader = UnstructuredPowerPointLoader(str(p))  # legacy binary format
         elif ext in (".xlsx", ".xls"):
             loader = UnstructuredExcelLoader(str(p))
         elif ext == ".csv":
             loader = CSVLoader(str(p))
+        elif ext in (".png", ".jpg", ".jpeg"):
+            loader = None  # no text layer, OCR only
         else:
             log.warning("Unsupported extension skipped", path=str(p))
             continue
 
+        deadline = file_deadline.child(budget("text"))
         try:
-            docs.extend(loader.load())
+            if ext == ".pdf":
+                pdf = extract_pdf(str(p), deadline=deadline)
+                stage_docs = pdf.text_documents()
+            elif ext == ".docx":
+                docx = extract_docx(str(p), deadline=deadline)
+                stage_docs = docx.text_documents()
+            elif ext == ".pptx":
+                pptx = extract_pptx(str(p), deadline=deadline)
+                stage_docs = pptx.text_documents()
+            else:
+                stage_docs = loader.load() if loader is not None else []  # third-party loaders can't be interrupted
+            docs.extend(_flag_partial(stage_docs, deadline, "text", p))
             log.info(f"Text extraction was successful for {p}")
         except Exception as e:
             log.error(f"Failed text extraction from {p}: {e}")
             raise DocumentPortalException("Error loading documents", e) from e
         if enable_ocr:
             # ---------- OCR for embedded images ----------
+            deadline = file_deadline.child(budget("ocr"))
             try:
                 if ext == ".pdf":
-                    docs.extend(ocr_extractor.extract_images_from_pdf(str(p)))
+                    stage_docs = ocr_extractor.extract_images_from_pdf(str(p), extraction=pdf, deadline=deadline)
+                    docs.extend(_flag_partial(stage_docs, deadline, "ocr", p))
                 elif ext == ".docx":
-                    docs.extend(ocr_extractor.extract_images_from_docx(str(p)))
+                    stage_docs = ocr_extractor.extract_images_from_docx(str(p), extraction=docx, deadline=deadline)
+                    docs.extend(_flag_partial(stage_docs, deadline, "ocr", p))
                 elif ext in (".ppt", ".pptx"):
-                    docs.extend(ocr_extractor.extract_images_from_pptx(str(p)))
+                    stage_docs = ocr_extractor.extract_images_from_pptx(str(p), extraction=pptx, deadline=deadline)
+                    docs.extend(_flag_partial(stage_docs, deadline, "ocr", p))
                 elif ext in (".png", ".jpg", ".jpeg"):
-                    img_doc = ocr_extractor._process_embedded_image(
+                    img_doc = ocr_extractor.process_embedded_image(
                     p.read_bytes(),
                     {"source": str(p), "type": "image_file"},
                     )
                     if img_doc:
-                        docs.extend(img_doc)   
+                        docs.append(img_doc)
                 log.info(f"Image extraction was successful for {p}")
             except Exception as e:
                 log.error(f"OCR extraction failed for {p}: {e}")
         # ---------- Table extraction ----------
+        deadline = file_deadline.child(budget("tables"))
         try:
             if ext == ".pdf":
-                docs.extend(ocr_extractor.extract_tables_from_pdf(str(p)))
+                stage_docs = ocr_extractor.extract_tables_from_pdf(str(p), extraction=pdf, deadline=deadline)
+                docs.extend(_flag_partial(stage_docs, deadline, "tables", p))
             elif ext == ".docx":
-                docs.extend(ocr_extractor.extract_tables_from_docx(str(p)))
+                docs.extend(ocr_extractor.extract_tables_from_docx(str(p), extraction=docx))
             elif ext in (".ppt", ".pptx"):
-                docs.extend(ocr_extractor.extract_tables_from_pptx(str(p)))
+                docs.extend(ocr_extractor.extract_tables_from_pptx(str(p), extraction=pptx))
             log.info(f"Table extraction was successful for {p}")
         except Exception as e:
             log.error(f"OCR extraction failed for {p}: {e}")
     # ---------- Deduplicate ----------
-    unique_docs = []
-    for d in docs:
-        text_hash = md5(d.page_content.strip().encode("utf-8")).hexdigest()
-        if text_hash not in seen_hashes:
-            unique_docs.append(d)
-            seen_hashes.add(text_hash)
-
+    if dedup_config.pop("enabled", True):
+        return deduplicate_documents(docs, **dedup_config)
     return docs
 
 def concat_for_analysis(docs: List[Document]) -> str:
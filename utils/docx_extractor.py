@@ -0,0 +1,118 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from docx import Document as DocxDocument
+from docx.oxml.ns import qn
+from docx.table import Table
+from langchain.schema import Document
+from logger import GLOBAL_LOGGER as log
+from exception.custom_exception import DocumentPortalException
+from utils.deadline import Deadline
+
+
+@dataclass
+class DocxExtraction:
+    """Body text, tables and image parts of one DOCX, collected from a single parse."""
+    source: str
+    metadata: Dict[str, Any]
+    headers: List[str] = field(default_factory=list)     # section header paragraphs
+    paragraphs: List[str] = field(default_factory=list)  # body, text boxes and content controls included
+    footers: List[str] = field(default_factory=list)
+    tables: List[List[List[str]]] = field(default_factory=list)       # rows of cell text, document order
+    images: List[Tuple[str, str, bytes]] = field(default_factory=list)  # (rel id, part name, blob)
+
+    def text_documents(self) -> List[Document]:
+        """Header, body and footer text as one Document (tables are emitted separately as CSV)."""
+        text = "\n".join(self.headers + self.paragraphs + self.footers).strip()
+        if not text:
+            return []
+        return [Document(page_content=text, metadata={"source": self.source, "type": "docx_text"})]
+
+
+_W_P, _W_T, _W_TAB, _W_BR = qn("w:p"), qn("w:t"), qn("w:tab"), qn("w:br")
+_W_TBL, _W_SECT_PR = qn("w:tbl"), qn("w:sectPr")
+# Text boxes are stored twice (DrawingML choice + VML fallback); only the choice is read
+_MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+
+def _paragraph_texts(elements) -> List[str]:
+    """
+    Text of every <w:p> under `elements`, including paragraphs nested in text boxes
+    (w:txbxContent) and content controls (w:sdtContent), which python-docx's paragraph
+    API skips. A nested paragraph is its own entry, after the one that anchors it.
+    """
+    texts: List[str] = []
+
+    def walk(nodes, buffer: List[str]) -> None:
+        for node in nodes:
+            tag = node.tag
+            if tag == _W_T:
+                buffer.append(node.text or "")
+            elif tag == _W_TAB:
+                buffer.append("\t")
+            elif tag == _W_BR:
+                buffer.append("\n")
+            elif tag == _W_P:
+                slot = len(texts)
+                texts.append("")
+                own: List[str] = []
+                walk(node, own)
+                texts[slot] = "".join(own)
+            elif tag != _MC_FALLBACK:
+                walk(node, buffer)
+
+    walk(elements, [])
+    return [text for text in texts if text.strip()]
+
+
+def _cell_text(tc) -> str:
+    """Text of a <w:tc> from its run elements (python-docx's `.text` runs an xpath per run)."""
+    paragraphs = []
+    for p in tc.iterchildren(_W_P):
+        paragraphs.append("".join(
+            (el.text or "") if el.tag == _W_T else "\t" if el.tag == _W_TAB else "\n"
+            for el in p.iter(_W_T, _W_TAB, _W_BR)
+        ))
+    return "\n".join(paragraphs).strip()
+
+
+def _table_rows(table: Table) -> List[List[str]]:
+    """
+    Cell text straight from the table XML: one entry per <w:tc>, so a horizontally merged
+    cell appears once. Much cheaper than `row.cells`, which rebuilds the layout grid per row.
+    """
+    return [[_cell_text(tc) for tc in tr.tc_lst] for tr in table._tbl.tr_lst]
+
+
+def extract_docx(docx_path: str, deadline: Optional[Deadline] = None) -> DocxExtraction:
+    """
+    Unzip and parse a DOCX once, streaming body paragraphs and tables in document order
+    and collecting embedded image parts (for OCR) from the same python-docx object.
+    """
+    try:
+        doc = DocxDocument(docx_path)
+        props = doc.core_properties
+        metadata = {k: v for k, v in {"title": props.title, "author": props.author, "subject": props.subject}.items() if v}
+        extraction = DocxExtraction(source=docx_path, metadata=metadata)
+        for block in doc.element.body.iterchildren():
+            if deadline is not None and deadline.expired():
+                log.warning("DOCX extraction over budget, keeping extracted content", docx_path=docx_path)
+                break
+            if block.tag == _W_TBL:
+                extraction.tables.append(_table_rows(Table(block, doc._body)))
+            elif block.tag != _W_SECT_PR:
+                extraction.paragraphs.extend(_paragraph_texts([block]))
+        # Headers/footers that just repeat the previous section's are linked, not redefined
+        for section in doc.sections:
+            for part, target in ((section.header, extraction.headers), (section.footer, extraction.footers)):
+                if not part.is_linked_to_previous:
+                    target.extend(_paragraph_texts(part._element.iterchildren()))
+        for rel in doc.part.rels.values():
+            if "image" in rel.reltype and not rel.is_external:
+                extraction.images.append((rel.rId, rel.target_ref, rel.target_part.blob))
+        log.info("DOCX extracted in single pass", docx_path=docx_path, paragraphs=len(extraction.paragraphs),
+                 tables=len(extraction.tables), images=len(extraction.images))
+        return extraction
+    except Exception as e:
+        log.error("Failed to extract DOCX", error=str(e), docx_path=docx_path)
+        raise DocumentPortalException(f"Could not extract DOCX: {docx_path}", e) from e
@@ -0,0 +1,258 @@
+from __future__ import annotations
+import re
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import FIRST_EXCEPTION, CancelledError, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from logger import GLOBAL_LOGGER as log
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 chars per token), good enough for quota accounting."""
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `capacity` tokens refill evenly over `period` seconds.
+    A capacity of 0/None disables the limit.
+    """
+
+    def __init__(self, capacity: Optional[float], period: float = 60.0):
+        self.capacity = float(capacity or 0)
+        self.rate = self.capacity / period if self.capacity else 0.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """Take `amount` tokens (may go into debt) and return seconds to wait before using them."""
+        if not self.capacity:
+            return 0.0
+        amount = min(amount, self.capacity)  # a single oversized request must still be allowed through
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, amount: float = 1.0) -> None:
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, amount: float = 1.0) -> None:
+        wait = self.reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+_RETRYABLE_STATUS = re.compile(r"\b(429|5\d\d)\b")
+_RETRYABLE_MESSAGE = re.compile(
+    r"rate.?limit|resource.?exhausted|quota|unavailable|deadline exceeded|timed? ?out|temporar|connection", re.I
+)
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    for value in (getattr(error, "status_code", None), getattr(error, "code", None),
+                  getattr(getattr(error, "response", None), "status_code", None)):
+        value = value() if callable(value) else value
+        if isinstance(value, int) and 100 <= value < 600:
+            return value
+    return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    True for throttling (429), server (5xx) and transport errors, also when wrapped by a client
+    library (checks the cause chain and the message). Invalid requests and auth errors are final.
+    """
+    while error is not None:
+        status = _status_code(error)
+        if status is not None:
+            return status == 429 or status >= 500
+        if isinstance(error, (ConnectionError, TimeoutError)) or type(error).__name__ in (
+            "TransportError", "ConnectError", "ReadTimeout", "ConnectTimeout", "RemoteProtocolError",
+        ):
+            return True
+        message = str(error)
+        match = _RETRYABLE_STATUS.search(message)
+        if match or re.search(r"\b4\d\d\b", message):
+            return bool(match)
+        if _RETRYABLE_MESSAGE.search(message):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+# Quotas are per provider model, not per client object -> share buckets across the process
+_BUCKETS: Dict[str, tuple[TokenBucket, TokenBucket]] = {}
+_BUCKETS_LOCK = threading.Lock()
+
+
+def _shared_buckets(key: str, rpm: Optional[int], tpm: Optional[int]) -> tuple[TokenBucket, TokenBucket]:
+    with _BUCKETS_LOCK:
+        if key not in _BUCKETS:
+            _BUCKETS[key] = (TokenBucket(rpm), TokenBucket(tpm))
+        return _BUCKETS[key]
+
+
+class EmbeddingScheduler(Embeddings):
+    """
+    Rate-limit-aware wrapper around an embeddings client.
+
+    - packs texts into requests bounded by `max_batch_size` items and `max_batch_tokens`
+    - runs up to `max_concurrency` requests in parallel
+    - respects provider RPM/TPM quotas via shared token buckets
+    - retries throttled (429), server (5xx) and transport failures with exponential backoff +
+      full jitter; other errors fail at once and cancel the remaining batches
+    - logs achieved chunks/sec for every `embed_documents` call
+
+    Usage:
+        emb = EmbeddingScheduler(GoogleGenerativeAIEmbeddings(...), rpm=1500, tpm=1_000_000)
+        vectors = emb.embed_documents(texts)
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        *,
+        max_batch_size: int = 100,
+        max_batch_tokens: int = 20000,
+        max_concurrency: int = 4,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        quota_key: Optional[str] = None,
+    ):
+        self.embeddings = embeddings
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_batch_tokens = max(1, int(max_batch_tokens))
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_retries = max(0, int(max_retries))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        key = quota_key or getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.request_bucket, self.token_bucket = _shared_buckets(str(key), rpm, tpm)
+        self.last_stats: Dict[str, Any] = {}
+
+    # ---------- Batching ----------
+
+    def _pack(self, texts: List[str]) -> List[List[int]]:
+        """Greedy packing of text indices into batches bounded by item count and estimated tokens."""
+        batches: List[List[int]] = []
+        current: List[int] = []
+        current_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if current and (len(current) >= self.max_batch_size or current_tokens + tokens > self.max_batch_tokens):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _embed_batch(self, batch: List[str], abort: threading.Event) -> tuple[List[List[float]], int]:
+        tokens = sum(estimate_tokens(t) for t in batch)
+        attempt = 0
+        while True:
+            if abort.is_set():  # another batch failed for good: don't spend quota on this one
+                raise CancelledError()
+            self.request_bucket.acquire(1)
+            self.token_bucket.acquire(tokens)
+            try:
+                return self.embeddings.embed_documents(batch), attempt
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e) or abort.is_set():
+                    log.error("Embedding batch failed", size=len(batch), attempts=attempt + 1, error=str(e))
+                    abort.set()
+                    raise
+                delay = self._backoff(attempt)
+                log.warning("Embedding batch failed, retrying", size=len(batch), attempt=attempt + 1,
+                            delay=round(delay, 2), error=str(e))
+                if abort.wait(delay):  # another batch failed for good meanwhile
+                    raise
+                attempt += 1
+
+    # ---------- Embeddings API ----------
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        start = time.perf_counter()
+        batches = self._pack(texts)
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        retries = 0
+
+        abort = threading.Event()
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+            futures = [(idx, pool.submit(self._embed_batch, [texts[i] for i in idx], abort)) for idx in batches]
+            wait([fut for _, fut in futures], return_when=FIRST_EXCEPTION)
+            if abort.is_set():
+                # a batch failed for good: drop queued batches, running ones stop at their next retry
+                for _, fut in futures:
+                    fut.cancel()
+                wait([fut for _, fut in futures])
+                raise next(fut.exception() for _, fut in futures if not fut.cancelled()
+                           and fut.exception() is not None and not isinstance(fut.exception(), CancelledError))
+            for idx, fut in futures:
+                batch_vectors, attempts = fut.result()
+                retries += attempts
+                for i, vec in zip(idx, batch_vectors):
+                    vectors[i] = vec
+
+        elapsed = time.perf_counter() - start
+        self.last_stats = {
+            "chunks": len(texts),
+            "batches": len(batches),
+            "retries": retries,
+            "seconds": round(elapsed, 3),
+            "chunks_per_sec": round(len(texts) / elapsed, 2) if elapsed > 0 else None,
+        }
+        log.info("Embedding batch run complete", **self.last_stats)
+        return vectors  # type: ignore[return-value]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        # same packing, concurrency and quotas as the sync path, off the event loop
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        attempt = 0
+        while True:
+            self.request_bucket.acquire(1)
+            self.token_bucket.acquire(estimate_tokens(text))
+            try:
+                return self.embeddings.embed_query(text)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self._backoff(attempt)
+                log.warning("Query embedding failed, retrying", attempt=attempt + 1, delay=round(delay, 2), error=str(e))
+                time.sleep(delay)
+                attempt += 1
+
+    async def aembed_query(self, text: str) -> List[float]:
+        attempt = 0
+        while True:
+            await self.request_bucket.aacquire(1)
+            await self.token_bucket.aacquire(estimate_tokens(text))
+            try:
+                return await self.embeddings.aembed_query(text)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self._backoff(attempt)
+                log.warning("Query embedding failed, retrying", attempt=attempt + 1, delay=round(delay, 2), error=str(e))
+                await asyncio.sleep(delay)
+                attempt += 1
@@ -1,11 +1,10 @@
 from __future__ import annotations
-import re
 import uuid
 from pathlib import Path
 from datetime import datetime
 from zoneinfo import ZoneInfo
-import uuid
-from typing import Iterable, List
+import hashlib
+from typing import Container, Dict, Iterable, List, Optional
 from logger import GLOBAL_LOGGER as log
 from exception.custom_exception import DocumentPortalException
 from utils.supported_extensions import SUPPORTED_EXTENSIONS
@@ -18,27 +17,40 @@ def generate_session_id(prefix: str = "session") -> str:
     cet = ZoneInfo("Europe/Berlin")
     return f"{prefix}_{datetime.now(cet).strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
 
-def save_uploaded_files(uploaded_files: Iterable, target_dir: Path) -> List[Path]:
-    """Save uploaded files (Streamlit-like) and return local paths."""
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def save_uploaded_files(uploaded_files: Iterable, target_dir: Path,
+                        skip_hashes: Optional[Container[str]] = None,
+                        uploaded_names: Optional[Dict[str, str]] = None) -> List[Path]:
+    """
+    Save uploaded files (Streamlit-like) and return local paths.
+    Files are content-addressed: saved as `<sha256><ext>`, so `path.stem` is the content hash.
+    Uploads whose hash is in `skip_hashes` (already indexed) or repeated within the batch are skipped.
+    If given, `uploaded_names` is filled with sha256 -> original file name for every saved file.
+    """
     try:
         target_dir.mkdir(parents=True, exist_ok=True)
+        skip_hashes = skip_hashes or ()
         saved: List[Path] = []
+        seen = set()
         for uf in uploaded_files:
             name = getattr(uf, "name", "file")
             ext = Path(name).suffix.lower()
             if ext not in SUPPORTED_EXTENSIONS:
                 log.warning("Unsupported file skipped", filename=name)
                 continue
-            # Clean file name (only alphanum, dash, underscore)
-            safe_name = re.sub(r'[^a-zA-Z0-9_\-]', '_', Path(name).stem).lower()
-            fname = f"{safe_name}_{uuid.uuid4().hex[:6]}{ext}"
-            fname = f"{uuid.uuid4().hex[:8]}{ext}"
-            out = target_dir / fname
+            data = uf.read() if hasattr(uf, "read") else uf.getbuffer()  # fallback
+            digest = content_hash(bytes(data))
+            if digest in skip_hashes or digest in seen:
+                log.info("File already ingested, skipped", uploaded=name, sha256=digest)
+                continue
+            seen.add(digest)
+            if uploaded_names is not None:
+                uploaded_names[digest] = name
+            out = target_dir / f"{digest}{ext}"
             with open(out, "wb") as f:
-                if hasattr(uf, "read"):
-                    f.write(uf.read())
-                else:
-                    f.write(uf.getbuffer())  # fallback
+                f.write(data)
             saved.append(out)
             log.info("File saved for ingestion", uploaded=name, saved_as=str(out))
         return saved
@@ -0,0 +1,160 @@
+from __future__ import annotations
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from logger import GLOBAL_LOGGER as log
+
+METADATA_INDEX_FILE = "metadata_index.json"
+INDEXED_FIELDS = ("source", "file", "type", "page", "slide")
+
+# Shorthands accepted for `type` filters ("only tables")
+TYPE_GROUPS = {
+    "tables": ("pdf_table", "docx_table", "pptx_table"),
+    "ocr": ("pdf_embedded_content", "docx_embedded_image", "pptx_embedded_image", "image_file"),
+    "text": ("pdf_text", "docx_text", "pptx_text"),
+}
+
+FilterValue = Union[str, int, float, List[Any], Dict[str, Any]]
+
+
+def manifest_file_names(index_dir: Union[str, Path]) -> Dict[str, str]:
+    """Saved upload path -> original file name, from the ingestion manifest next to the index."""
+    try:
+        meta = json.loads((Path(index_dir) / "ingested_meta.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return {info["saved_as"]: info["name"] for info in (meta.get("files") or {}).values()
+            if info.get("saved_as") and info.get("name")}
+
+
+_RANGE_KEYS = ("gte", "lte")
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_filter(spec: Any) -> Dict[str, FilterValue]:
+    """Check a metadata filter spec (see MetadataIndex); raises ValueError naming the problem."""
+    if not isinstance(spec, dict):
+        raise ValueError("filter must be an object of field -> value")
+    for name, value in spec.items():
+        if name not in INDEXED_FIELDS:
+            raise ValueError(f"Unsupported metadata filter field {name!r}, expected one of {INDEXED_FIELDS}")
+        if isinstance(value, dict):
+            unknown = set(value) - set(_RANGE_KEYS)
+            if unknown or not value:
+                raise ValueError(f"Range filter on {name!r} takes only {_RANGE_KEYS}, got {sorted(value)}")
+            for bound, limit in value.items():
+                if not _is_number(limit):
+                    raise ValueError(f"Range bound {name}.{bound} must be a number, got {limit!r}")
+        else:
+            values = value if isinstance(value, list) else [value]
+            if not values or not all(isinstance(v, str) or _is_number(v) for v in values):
+                raise ValueError(f"Filter on {name!r} takes a string/number, a list of them or a range")
+    return spec
+
+
+class MetadataIndex:
+    """
+    Inverted index over chunk metadata: field -> value -> sorted FAISS row ids. Filters
+    resolve to an id set before the vector search, so FAISS only scores matching rows
+    (IDSelectorBatch) instead of over-fetching and post-filtering.
+
+    Filter spec: {field: value | [values] | {"gte": lo, "lte": hi}}; fields are ANDed, list
+    values ORed. `file` matches the original upload name (or the source basename).
+    """
+
+    def __init__(self, fields: Dict[str, Dict[str, List[int]]], ntotal: int):
+        self.ntotal = ntotal
+        self.fields = {name: {value: np.asarray(ids, dtype=np.int64) for value, ids in values.items()}
+                       for name, values in fields.items()}
+
+    @classmethod
+    def build(cls, vectorstore: Any, file_names: Optional[Dict[str, str]] = None) -> "MetadataIndex":
+        file_names = file_names or {}
+        fields: Dict[str, Dict[str, List[int]]] = {name: {} for name in INDEXED_FIELDS}
+        for row, doc_id in vectorstore.index_to_docstore_id.items():
+            doc = vectorstore.docstore.search(doc_id)
+            if not isinstance(doc, Document):
+                continue
+            metadata = dict(doc.metadata)
+            source = metadata.get("source")
+            if source is not None:
+                metadata["file"] = file_names.get(str(source)) or os.path.basename(str(source))
+            for name in INDEXED_FIELDS:
+                if metadata.get(name) is not None:
+                    fields[name].setdefault(str(metadata[name]).casefold(), []).append(int(row))
+        return cls(fields, ntotal=int(vectorstore.index.ntotal))
+
+    def save(self, index_dir: Union[str, Path]) -> None:
+        payload = {"ntotal": self.ntotal,
+                   "fields": {name: {value: ids.tolist() for value, ids in values.items()}
+                              for name, values in self.fields.items()}}
+        (Path(index_dir) / METADATA_INDEX_FILE).write_text(json.dumps(payload), encoding="utf-8")
+
+    @classmethod
+    def load_or_build(cls, index_dir: Union[str, Path], vectorstore: Any) -> "MetadataIndex":
+        """The saved index if it matches the vector store's row count, else a fresh in-memory build."""
+        path = Path(index_dir) / METADATA_INDEX_FILE
+        try:
+            payload = json.loads(path.read_text(encoding="utf-8"))
+            if payload.get("ntotal") == vectorstore.index.ntotal:
+                return cls(payload["fields"], payload["ntotal"])
+            log.warning("Metadata index is stale, rebuilding", index_dir=str(index_dir))
+        except (OSError, ValueError, KeyError):
+            log.info("No metadata index found, building in memory", index_dir=str(index_dir))
+        return cls.build(vectorstore, manifest_file_names(index_dir))
+
+    def _ids_for(self, name: str, value: FilterValue) -> np.ndarray:
+        values = self.fields.get(name, {})
+        if isinstance(value, dict):  # numeric range, e.g. pages 10-20
+            lo, hi = float(value.get("gte", -np.inf)), float(value.get("lte", np.inf))
+            keys = [key for key in values if _as_number(key) is not None and lo <= _as_number(key) <= hi]
+        else:
+            wanted: Iterable[Any] = value if isinstance(value, (list, tuple, set)) else [value]
+            if name == "type":
+                wanted = [t for v in wanted for t in TYPE_GROUPS.get(str(v).casefold(), (v,))]
+            keys = [str(v).casefold() for v in wanted]
+        arrays = [values[key] for key in keys if key in values]
+        return np.unique(np.concatenate(arrays)) if arrays else np.empty(0, dtype=np.int64)
+
+    def select(self, spec: Dict[str, FilterValue]) -> np.ndarray:
+        """FAISS row ids matching every field of `spec`."""
+        ids: Optional[np.ndarray] = None
+        for name, value in validate_filter(spec).items():
+            matched = self._ids_for(name, value)
+            ids = matched if ids is None else np.intersect1d(ids, matched, assume_unique=True)
+            if not ids.size:
+                break
+        return np.arange(self.ntotal, dtype=np.int64) if ids is None else ids
+
+
+def _as_number(key: str) -> Optional[float]:
+    try:
+        return float(key)
+    except ValueError:
+        return None
+
+
+def search_rows(vectorstore: Any, vector: List[float], rows: np.ndarray, k: int) -> List[Tuple[Document, float]]:
+    """Similarity search restricted to FAISS `rows`; returns (doc, distance) like the FAISS store."""
+    if not rows.size:
+        return []
+    query = np.array([vector], dtype=np.float32)
+    if getattr(vectorstore, "_normalize_L2", False):
+        faiss.normalize_L2(query)
+    params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(rows))
+    distances, indices = vectorstore.index.search(query, min(k, int(rows.size)), params=params)
+    hits = []
+    for distance, row in zip(distances[0], indices[0]):
+        if row == -1:
+            continue
+        doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(row)])
+        if isinstance(doc, Document):
+            hits.append((doc, float(distance)))
+    return hits
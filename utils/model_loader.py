@@ -3,6 +3,7 @@ import sys
 import json
 from dotenv import load_dotenv
 from utils.config_loader import load_config
+from utils.embedding_scheduler import EmbeddingScheduler
 from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
 from langchain_groq import ChatGroq
 from logger import GLOBAL_LOGGER as log
@@ -74,12 +75,19 @@ class ModelLoader:
     def load_embeddings(self):
         """
         Load and return embedding model from Google Generative AI.
+        Wrapped in an EmbeddingScheduler (batching, concurrency, RPM/TPM limits)
+        unless `embedding_model.scheduler.enabled` is false.
         """
         try:
-            model_name = self.config["embedding_model"]["model_name"]
+            emb_config = self.config["embedding_model"]
+            model_name = emb_config["model_name"]
             log.info("Loading embedding model", model=model_name)
-            return GoogleGenerativeAIEmbeddings(model=model_name,
+            embeddings = GoogleGenerativeAIEmbeddings(model=model_name,
                                                 google_api_key=self.api_key_mgr.get("GOOGLE_API_KEY")) #type: ignore
+            scheduler_config = dict(emb_config.get("scheduler") or {})
+            if not scheduler_config.pop("enabled", False):
+                return embeddings
+            return EmbeddingScheduler(embeddings, quota_key=model_name, **scheduler_config)
         except Exception as e:
             log.error("Error loading embedding model", error=str(e))
             raise DocumentPortalException("Failed to load embedding model", sys)
@@ -0,0 +1,161 @@
+from __future__ import annotations
+import atexit
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+import numpy as np
+from logger import GLOBAL_LOGGER as log
+from utils.config_loader import _project_root
+
+
+def image_hash(image: np.ndarray) -> str:
+    """
+    Cache key for an image: digest of its exact pixels and shape. The same logo, stamp or
+    slide template embedded in different files decodes to the same pixels and hits; pages
+    that share a layout but differ in a few glyphs (invoice amounts, contract fees) never
+    collide, so a hit can't return another document's text.
+    """
+    image = np.ascontiguousarray(image)
+    digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+    digest.update(f"{image.shape}:{image.dtype}".encode("ascii"))
+    return digest.hexdigest()
+
+
+class OcrCache:
+    """
+    Persistent OCR result cache (SQLite) keyed by exact image hash, with LRU eviction
+    bounded by entry count and total stored text size. Thread-safe; hit rate is tracked
+    per process and logged via `log_stats()`.
+
+    Hits don't write: their access times are buffered and written with the next `put`,
+    `flush()`/`close()` or once `touch_batch` of them pile up. The database file is only
+    created on first use.
+    """
+
+    def __init__(self, path: str | Path, max_entries: int = 50000, max_bytes: int = 64 * 1024 * 1024,
+                 touch_batch: int = 256):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._touched: Dict[str, float] = {}  # key -> last access not yet written
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_cache ("
+                " key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ocr_cache_lru ON ocr_cache(last_access)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db().execute("SELECT text FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= self.touch_batch:
+                self._write_touched()
+                self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, text: str) -> None:
+        size = len(text.encode("utf-8"))
+        with self._lock:
+            self._touched.pop(key, None)
+            self._write_touched()  # eviction must see current access times
+            self._db().execute(
+                "INSERT OR REPLACE INTO ocr_cache (key, text, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, text, size, time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def flush(self) -> None:
+        """Write buffered access times."""
+        with self._lock:
+            if self._touched:
+                self._write_touched()
+                self._conn.commit()
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _write_touched(self) -> None:
+        if self._touched:
+            self._db().executemany("UPDATE ocr_cache SET last_access = ? WHERE key = ?",
+                                   [(ts, key) for key, ts in self._touched.items()])
+            self._touched.clear()
+
+    def _evict(self) -> None:
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # drop least recently used rows down to 90% of both limits, so eviction doesn't run on every put
+        target_entries, target_bytes = int(self.max_entries * 0.9), int(self.max_bytes * 0.9)
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM ocr_cache ORDER BY last_access ASC"):
+            if count <= target_entries and total <= target_bytes:
+                break
+            victims.append((key,))
+            count, total = count - 1, total - size
+        self._conn.executemany("DELETE FROM ocr_cache WHERE key = ?", victims)
+        log.info("OCR cache evicted entries", evicted=len(victims), entries=count, bytes=total)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def log_stats(self, **context) -> None:
+        log.info("OCR cache stats", **self.stats(), **context)
+
+
+# One cache per database file per process
+_CACHES: Dict[str, OcrCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_ocr_cache(path: str | Path, max_entries: int = 50000, max_bytes: int = 64 * 1024 * 1024) -> OcrCache:
+    """Shared cache for `path`; relative paths are resolved against the project root, not the CWD."""
+    path = Path(path)
+    if not path.is_absolute():
+        path = _project_root() / path
+    key = str(path.resolve())
+    with _CACHES_LOCK:
+        if key not in _CACHES:
+            _CACHES[key] = OcrCache(key, max_entries=max_entries, max_bytes=max_bytes)
+        return _CACHES[key]
+
+
+@atexit.register
+def _close_ocr_caches() -> None:
+    with _CACHES_LOCK:
+        for cache in _CACHES.values():
+            cache.close()
+
+
+def ocr_cache_stats() -> Dict[str, Dict[str, float]]:
+    """Hit/miss counters of every OCR cache opened in this process, keyed by database path."""
+    with _CACHES_LOCK:
+        return {path: cache.stats() for path, cache in _CACHES.items()}
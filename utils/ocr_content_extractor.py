@@ -1,135 +1,655 @@
-from pathlib import Path
-from typing import Iterable, List, Optional
-import tempfile
+import atexit
+import csv
+import io
+import multiprocessing as mp
 import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+import cv2
+import numpy as np
 import fitz  # PyMuPDF
-from docx import Document as DocxDocument
-from pptx import Presentation
 import camelot
-import easyocr
 from langchain.schema import Document
 from logger import GLOBAL_LOGGER as log
+from utils.config_loader import load_config
+from utils.deadline import Deadline
+from utils.pdf_extractor import MIN_RULING_LINES, PdfExtraction, PdfPage, extract_pdf, page_image_coverage
+from utils.ocr_cache import get_ocr_cache, image_hash
+from utils.docx_extractor import DocxExtraction, extract_docx
+from utils.pptx_extractor import PptxExtraction, extract_pptx
+
+# Page triage outcomes
+OCR_SKIP = "skip"        # text layer is complete, nothing worth rasterizing
+OCR_REGIONS = "regions"  # text layer + figures: OCR only the image areas
+OCR_FULL = "full"        # scanned / outlined-text page: OCR the whole page
+
+DEFAULT_TRIAGE = {
+    "enabled": True,
+    "min_text_chars": 200,          # a page with at least this much text has a usable text layer
+    "scanned_image_coverage": 0.85,  # images covering this much of the page => scanned page
+    "min_image_coverage": 0.02,     # ignore icons, bullets, rules
+    "min_vector_paths": 50,         # many paths + no text => text drawn as outlines
+}
+
+DEFAULT_BATCH = {
+    "batch_size": 8,                # images per EasyOCR detection forward pass
+    "recognizer_batch_size": 16,    # text crops per recognition forward pass
+    "max_pad_ratio": 1.5,           # start a new batch rather than pad an image to > 1.5x its area
+}
+
+DEFAULT_CACHE = {
+    "enabled": True,
+    "path": "data/ocr_cache.db",
+    "max_entries": 50000,
+    "max_bytes": 64 * 1024 * 1024,
+}
+
+DEFAULT_PREPROCESS = {
+    "target_glyph_px": 32,          # rendered text-line height EasyOCR reads reliably
+    "default_glyph_pt": 10.0,       # assumed line height when the page has no text layer or images
+    "min_zoom": 1.0,
+    "max_zoom": 4.0,                # ~288 DPI
+    "max_side": 2560,               # longest side of a rendered page / embedded image, in pixels
+    "min_side": 24,                 # smaller images (icons, bullets, spacers) are not OCR'd
+}
+
+# Table engines
+TABLE_BACKEND_PYMUPDF = "pymupdf"  # fitz Page.find_tables: in-process, no Ghostscript/OpenCV
+TABLE_BACKEND_CAMELOT = "camelot"
+
+DEFAULT_TABLES = {
+    "backend": TABLE_BACKEND_PYMUPDF,
+    "camelot_fallback": True,       # re-parse pages the PyMuPDF engine misses or is unsure about
+    "min_confidence": 0.6,          # below this, a PyMuPDF page goes to camelot
+    "prescreen": True,              # only send pages with ruling lines / aligned columns to camelot
+    "max_workers": 4,               # camelot processes for page groups (1 = run inline)
+    "pages_per_group": 4,           # candidate pages parsed per camelot call
+    "parallel_min_pages": 16,       # fewer camelot pages run inline: the pool only pays off on long PDFs
+}
+
+# (group key, pixels, metadata): OCR texts sharing a group key are merged into one Document
+OcrJob = Tuple[Any, np.ndarray, dict]
+
+
+def triage_page(text_chars: int, image_coverage: float, vector_paths: int, config: dict) -> str:
+    """Decide how much of a PDF page needs OCR from cheap text-layer/image signals."""
+    if not config.get("enabled", True):
+        return OCR_FULL
+    has_text_layer = text_chars >= config["min_text_chars"]
+    if image_coverage >= config["scanned_image_coverage"]:
+        # a scan with a hidden OCR text layer is already searchable
+        return OCR_SKIP if has_text_layer else OCR_FULL
+    if image_coverage >= config["min_image_coverage"]:
+        return OCR_REGIONS
+    if not has_text_layer and vector_paths >= config["min_vector_paths"]:
+        return OCR_FULL
+    return OCR_SKIP
+
+
+# EasyOCR models are loaded lazily, once per process and language, and shared by all extractors
+_READERS: Dict[str, Any] = {}
+_READER_LOCK = threading.Lock()
+
+
+def get_ocr_reader(lang: str = "en"):
+    """Return the process-wide EasyOCR reader for `lang`, loading it on first use (thread-safe)."""
+    reader = _READERS.get(lang)
+    if reader is None:
+        with _READER_LOCK:
+            reader = _READERS.get(lang)
+            if reader is None:
+                import easyocr  # heavy (torch) import deferred until OCR is actually needed
+                log.info("Loading EasyOCR models", lang=lang)
+                reader = easyocr.Reader([lang], gpu=False)
+                _READERS[lang] = reader
+    return reader
+
+
+def _rows_to_csv(rows: List[List[Optional[str]]]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(
+        [[(cell or "").strip() for cell in row] for row in rows]
+    )
+    return buffer.getvalue()
+
+
+def table_confidence(rows: List[List[Optional[str]]]) -> float:
+    """Heuristic confidence for a PyMuPDF table: share of filled cells, zero for degenerate grids."""
+    if len(rows) < 2 or max((len(r) for r in rows), default=0) < 2:
+        return 0.0
+    cells = [cell for row in rows for cell in row]
+    return sum(1 for cell in cells if cell and cell.strip()) / len(cells)
+
+
+def _camelot_page_group(pdf_path: str, pages: List[int], flavor: str) -> List[Tuple[int, str, dict]]:
+    """
+    Run camelot on a group of pages with one flavor; lattice pages that yield nothing are
+    retried with stream. Returns picklable (page, csv, parsing_report) tuples so groups can
+    run in worker processes.
+    """
+    found: List[Tuple[int, str, dict]] = []
+    for table in camelot.read_pdf(pdf_path, flavor=flavor, pages=",".join(map(str, pages))):
+        if not table.df.empty:
+            found.append((int(table.page), table.df.to_csv(index=False), table.parsing_report))
+    if flavor == "lattice":
+        missing = sorted(set(pages) - {page for page, _, _ in found})
+        if missing:
+            found.extend(_camelot_page_group(pdf_path, missing, "stream"))
+    return found
+
+
+def _camelot_group_worker(pdf_path: str, pages: List[int], flavor: str) -> Tuple[List[Tuple[int, str, dict]], Optional[str]]:
+    """Pool entry point: camelot errors come back as values, so a raising `get()` means the pool itself failed."""
+    try:
+        return _camelot_page_group(pdf_path, pages, flavor), None
+    except Exception as e:
+        return [], str(e)
+
+
+# Camelot worker pool, started on first parallel use and kept for the life of the process: each
+# spawned worker re-imports camelot/cv2 (seconds), which a per-PDF pool would pay on every upload
+_TABLE_POOL: Optional[Tuple[int, Any]] = None  # (workers, multiprocessing.pool.Pool)
+_TABLE_POOL_LOCK = threading.Lock()
+_POOL_POLL_SECONDS = 1.0
+
+
+def get_table_pool(workers: int):
+    global _TABLE_POOL
+    with _TABLE_POOL_LOCK:
+        if _TABLE_POOL is None or _TABLE_POOL[0] != workers:
+            if _TABLE_POOL is not None:
+                _TABLE_POOL[1].terminate()
+            log.info("Starting camelot worker pool", workers=workers)
+            _TABLE_POOL = (workers, mp.get_context("spawn").Pool(workers))
+        return _TABLE_POOL[1]
+
+
+def _table_pool_alive(pool) -> bool:
+    return _TABLE_POOL is not None and _TABLE_POOL[1] is pool
+
+
+def discard_table_pool(pool) -> None:
+    """Terminate `pool`, killing the groups it is running; the next parallel call starts a fresh one."""
+    global _TABLE_POOL
+    with _TABLE_POOL_LOCK:
+        if _table_pool_alive(pool):
+            _TABLE_POOL = None
+    pool.terminate()
+
+
+@atexit.register
+def _close_table_pool() -> None:
+    if _TABLE_POOL is not None:
+        discard_table_pool(_TABLE_POOL[1])
+
+
+def _wait_for_groups(pool, pending: List[Any], deadline: Optional[Deadline]) -> bool:
+    """Wait for every pooled group; False once `deadline` expires or the pool is torn down meanwhile."""
+    for result in pending:
+        while not result.ready():
+            if (deadline is not None and deadline.expired()) or not _table_pool_alive(pool):
+                return False
+            remaining = deadline.remaining() if deadline is not None else None
+            result.wait(_POOL_POLL_SECONDS if remaining is None else min(_POOL_POLL_SECONDS, remaining))
+    return True
+
+
+def _inline_group(pdf_path: str, pages: List[int], flavor: str) -> List[Tuple[int, str, dict]]:
+    """Tables of one camelot page group run in-process; a group that fails is logged and skipped."""
+    try:
+        return _camelot_page_group(pdf_path, pages, flavor)
+    except Exception as e:
+        log.warning("Camelot failed on page group, skipped", pdf_path=pdf_path, pages=pages, flavor=flavor,
+                    error=str(e))
+        return []
+
+
+def warm_up_ocr(lang: str = "en") -> None:
+    """Load the reader and run one tiny inference so the first real OCR request is fast."""
+    try:
+        get_ocr_reader(lang).readtext(np.full((32, 128), 255, dtype=np.uint8), detail=0)
+        log.info("EasyOCR warm-up complete", lang=lang)
+    except Exception as e:
+        log.error("EasyOCR warm-up failed", lang=lang, error=str(e))
 
 
 class EmbeddedContentExtractor:
     """Information extractor using EasyOCR to grab text from embedded images."""
 
     def __init__(self, lang: str = "en"):
-        # Initialize EasyOCR once for efficiency
-        self.reader = easyocr.Reader([lang], gpu=False)
+        # Cheap to construct: the EasyOCR reader is created on first OCR use and shared process-wide
+        self.lang = lang
+        ocr_config = load_config().get("ocr") or {}
+        self.triage_config = {**DEFAULT_TRIAGE, **(ocr_config.get("triage") or {})}
+        self.batch_config = {**DEFAULT_BATCH, **(ocr_config.get("batch") or {})}
+        cache_config = {**DEFAULT_CACHE, **(ocr_config.get("cache") or {})}
+        self.cache = get_ocr_cache(cache_config["path"], max_entries=cache_config["max_entries"],
+                                   max_bytes=cache_config["max_bytes"]) if cache_config["enabled"] else None
+        self.preprocess_config = {**DEFAULT_PREPROCESS, **(ocr_config.get("preprocess") or {})}
+        self.tables_config = {**DEFAULT_TABLES, **(load_config().get("tables") or {})}
+
+    @property
+    def reader(self):
+        return get_ocr_reader(self.lang)
 
     # --------------------------
     # Helpers
     # --------------------------
-    def _write_temp_file(self, data: bytes, suffix: str = ".png") -> str:
-        tmp = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    @staticmethod
+    def _pixmap_to_array(pix: "fitz.Pixmap") -> np.ndarray:
+        """Pixmap samples as an (h, w, n) uint8 array (alpha dropped) - no PNG encoding involved."""
+        if pix.colorspace and pix.colorspace.n not in (1, 3):  # e.g. CMYK
+            pix = fitz.Pixmap(fitz.csRGB, pix)
+        if pix.alpha:
+            pix = fitz.Pixmap(pix, 0)
+        arr = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        return arr[:, :, 0] if pix.n == 1 else arr
+
+    @staticmethod
+    def _decode_image(image_data: bytes) -> Optional[np.ndarray]:
+        """Decode encoded image bytes (PNG/JPEG/...) to pixels in memory (MuPDF first, OpenCV as fallback)."""
         try:
-            tmp.write(data)
-            return tmp.name
-        finally:
-            tmp.close()
+            return EmbeddedContentExtractor._pixmap_to_array(fitz.Pixmap(image_data))
+        except Exception:
+            return cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+
+    @staticmethod
+    def _to_gray(image: np.ndarray) -> np.ndarray:
+        if image.ndim == 2:
+            return image
+        return cv2.cvtColor(np.ascontiguousarray(image[:, :, :3]), cv2.COLOR_RGB2GRAY)
+
+    def preprocess_image(self, image: np.ndarray) -> Optional[np.ndarray]:
+        """Grayscale, drop images too small to hold text, downsample oversized ones (config `ocr.preprocess`)."""
+        gray = self._to_gray(image)
+        h, w = gray.shape[:2]
+        if min(h, w) < self.preprocess_config["min_side"]:
+            return None
+        scale = self.preprocess_config["max_side"] / max(h, w)
+        if scale < 1.0:
+            gray = cv2.resize(gray, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+        return gray
 
-    def _extract_text_from_image(self, image_path: str) -> str:
-        """Run EasyOCR on an image and return extracted text."""
+    def render_zoom(self, area: "fitz.Rect", native_scale: float = 0.0, glyph_height: float = 0.0) -> float:
+        """
+        Rasterization zoom for a page area. Embedded images render at their own resolution
+        (more pixels than the source adds nothing); otherwise the zoom brings the text-line
+        height to `target_glyph_px`. Clamped to [min_zoom, max_zoom] and to `max_side` pixels.
+        """
+        cfg = self.preprocess_config
+        zoom = native_scale or cfg["target_glyph_px"] / (glyph_height or cfg["default_glyph_pt"])
+        zoom = min(max(zoom, cfg["min_zoom"]), cfg["max_zoom"])
+        return min(zoom, cfg["max_side"] / max(area.width, area.height, 1.0))
+
+    def _extract_text_from_image(self, image: np.ndarray) -> str:
+        """Run EasyOCR on a single in-memory image and return extracted text."""
         try:
-            results = self.reader.readtext(image_path, detail=0)
+            results = self.reader.readtext(image, detail=0, batch_size=self.batch_config["recognizer_batch_size"])
             return "\n".join(results).strip()
         except Exception as e:
-            log.error(f"OCR failed for {image_path}: {e}")
+            log.error("OCR failed", error=str(e))
             return ""
 
-    def process_embedded_image(self, image_data: bytes, metadata: dict) -> Optional[Document]:
-        tmp_path = self._write_temp_file(image_data)
-        try:
-            content = self._extract_text_from_image(tmp_path)
-            if content:
-                return Document(page_content=content, metadata=metadata)
-        finally:
-            os.unlink(tmp_path)
+    def _batches(self, images: Sequence[np.ndarray]) -> List[List[int]]:
+        """Group image indices by size so each batch can be padded to a common shape cheaply."""
+        max_items = self.batch_config["batch_size"]
+        max_ratio = self.batch_config["max_pad_ratio"]
+        batches: List[List[int]] = []
+        current: List[int] = []
+        max_h = max_w = 0
+        min_area = float("inf")
+        for i in sorted(range(len(images)), key=lambda i: images[i].shape[:2]):
+            h, w = images[i].shape[:2]
+            if current and (len(current) >= max_items
+                            or max(max_h, h) * max(max_w, w) > max_ratio * min(min_area, h * w)):
+                batches.append(current)
+                current, max_h, max_w, min_area = [], 0, 0, float("inf")
+            current.append(i)
+            max_h, max_w, min_area = max(max_h, h), max(max_w, w), min(min_area, h * w)
+        if current:
+            batches.append(current)
+        return batches
+
+    def ocr_images(self, images: Sequence[np.ndarray], deadline: Optional[Deadline] = None) -> List[str]:
+        """
+        OCR many images through EasyOCR's batched API; returns one text per input image.
+        Images are converted to grayscale, bucketed by size and white-padded to a common
+        shape per batch, so detection runs one forward pass per batch instead of per image.
+        Once `deadline` expires the remaining batches are skipped and their texts left empty.
+        """
+        grays = [self._to_gray(img) for img in images]
+        texts = [""] * len(grays)
+        recognizer_batch = self.batch_config["recognizer_batch_size"]
+
+        # repeated logos/stamps/templates come straight from the OCR cache
+        keys: List[Optional[str]] = [None] * len(grays)
+        todo = list(range(len(grays)))
+        if self.cache is not None:
+            todo = []
+            for i, gray in enumerate(grays):
+                keys[i] = f"{self.lang}:{image_hash(gray)}"  # same image reads differently per language
+                cached = self.cache.get(keys[i])
+                if cached is None:
+                    todo.append(i)
+                else:
+                    texts[i] = cached
+
+        done: List[int] = []
+        for sub_batch in self._batches([grays[i] for i in todo]):
+            if deadline is not None and deadline.expired():
+                log.warning("OCR over budget, skipping remaining batches", skipped=len(todo) - len(done))
+                break
+            batch = [todo[j] for j in sub_batch]
+            done.extend(batch)
+            if len(batch) == 1:
+                texts[batch[0]] = self._extract_text_from_image(grays[batch[0]])
+                continue
+            h = max(grays[i].shape[0] for i in batch)
+            w = max(grays[i].shape[1] for i in batch)
+            padded = []
+            for i in batch:
+                canvas = np.full((h, w), 255, dtype=np.uint8)
+                canvas[:grays[i].shape[0], :grays[i].shape[1]] = grays[i]
+                padded.append(canvas)
+            try:
+                results = self.reader.readtext_batched(padded, detail=0, batch_size=recognizer_batch)
+                for i, lines in zip(batch, results):
+                    texts[i] = "\n".join(lines).strip()
+            except Exception as e:
+                log.warning("Batched OCR failed, falling back to per-image OCR", size=len(batch), error=str(e))
+                for i in batch:
+                    texts[i] = self._extract_text_from_image(grays[i])
+
+        if self.cache is not None:
+            for i in done:
+                self.cache.put(keys[i], texts[i])  # empty results too: text-free photos repeat as well
+        return texts
+
+    def _run_ocr_jobs(self, jobs: Iterable[OcrJob], deadline: Optional[Deadline] = None) -> List[Document]:
+        """
+        Stream OCR jobs through `ocr_images` a window at a time (bounded memory for long scans).
+        Texts of jobs sharing a group key (e.g. image regions of one page) become one Document.
+        Once `deadline` expires no further jobs are pulled or OCR'd; finished batches are kept.
+        """
+        window = self.batch_config["batch_size"] * 4
+        groups: Dict[Any, Tuple[List[str], dict]] = {}
+        pending: List[OcrJob] = []
+
+        def flush():
+            texts = self.ocr_images([img for _, img, _ in pending], deadline=deadline)
+            for (key, _, metadata), text in zip(pending, texts):
+                entry = groups.setdefault(key, ([], metadata))
+                if text:
+                    entry[0].append(text)
+            pending.clear()
+
+        for key, image, metadata in jobs:
+            if deadline is not None and deadline.expired():
+                log.warning("OCR over budget, keeping results so far", ocr_groups=len(groups), pending=len(pending))
+                break
+            image = self.preprocess_image(image)
+            if image is None:
+                continue
+            pending.append((key, image, metadata))
+            if len(pending) >= window:
+                flush()
+        if pending and deadline is not None and deadline.expired():
+            log.warning("OCR over budget, dropping queued images", dropped=len(pending))
+        elif pending:
+            flush()
+        return [Document(page_content="\n".join(texts), metadata=md) for texts, md in groups.values() if texts]
+
+    def _flush_cache(self, source: str) -> None:
+        if self.cache is not None:
+            self.cache.flush()
+            self.cache.log_stats(source=source)
+
+    def process_embedded_image(self, image_data: Union[bytes, np.ndarray], metadata: dict) -> Optional[Document]:
+        """OCR an image without touching the filesystem; accepts encoded bytes or a decoded pixel array."""
+        image = self._decode_image(image_data) if isinstance(image_data, (bytes, bytearray)) else image_data
+        image = self.preprocess_image(image) if image is not None else None
+        if image is None:
+            return None
+        content = self.ocr_images([image])[0]
+        if content:
+            return Document(page_content=content, metadata=metadata)
         return None
 
     # --------------------------
     # Extractors
     # --------------------------
-    def extract_images_from_pdf(self, pdf_path: str) -> List[Document]:
-        """Extract embedded images from PDF pages and OCR them."""
+    def _image_regions(self, page, native_widths: Dict[int, int]) -> List[Tuple["fitz.Rect", float]]:
+        """
+        Page-clipped rectangles of images large enough to be worth OCR, each with the zoom
+        that renders it at its native resolution (source pixels per point).
+        """
+        min_area = abs(page.rect) * self.triage_config["min_image_coverage"]
+        regions: List[Tuple["fitz.Rect", float]] = []
+        for xref, width_px in native_widths.items():
+            for rect in page.get_image_rects(xref):
+                clipped = rect & page.rect
+                if abs(clipped) >= min_area and not any(clipped in r for r, _ in regions):
+                    regions.append((clipped, width_px / rect.width if rect.width else 0.0))
+        return regions
+
+    def extract_images_from_pdf(self, pdf_path: str, extraction: Optional[PdfExtraction] = None,
+                                deadline: Optional[Deadline] = None) -> List[Document]:
+        """
+        OCR the parts of PDF pages that the text layer does not cover.
+        Each page is triaged first: complete text layers are skipped, mixed pages only
+        get their image regions rasterized, scanned pages are OCR'd in full.
+        `extraction` (from utils.pdf_extractor) lets triage reuse the already collected page signals.
+        """
         docs = []
+        modes = {OCR_SKIP: 0, OCR_REGIONS: 0, OCR_FULL: 0}
         try:
-            pdf_doc = fitz.open(pdf_path)
-            for page_num, page in enumerate(pdf_doc, start=1):
-                pix = page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0))
-                img_data = pix.tobytes("png")
-                doc_obj = self.process_embedded_image(
-                    img_data,
-                    {"source": pdf_path, "page": page_num, "type": "pdf_embedded_content"},
-                )
-                if doc_obj:
-                    docs.append(doc_obj)
-            pdf_doc.close()
+            with fitz.open(pdf_path) as pdf_doc:
+                docs = self._run_ocr_jobs(self._pdf_ocr_jobs(pdf_doc, pdf_path, extraction, modes), deadline)
+            log.info("PDF OCR triage", pdf_path=pdf_path, skipped=modes[OCR_SKIP],
+                     regions=modes[OCR_REGIONS], full=modes[OCR_FULL], docs=len(docs))
+            self._flush_cache(pdf_path)
         except Exception as e:
             log.error(f"Failed to extract from PDF {pdf_path}: {e}")
         return docs
+
+    def _pdf_ocr_jobs(self, pdf_doc, pdf_path: str, extraction: Optional[PdfExtraction],
+                      modes: Dict[str, int]) -> Iterator[OcrJob]:
+        for page_num, page in enumerate(pdf_doc, start=1):
+            # a budget-truncated extraction only covers the first pages
+            info = extraction.pages[page_num - 1] if extraction and page_num <= len(extraction.pages) else None
+            xrefs = info.image_xrefs if info else [img[0] for img in page.get_images(full=True)]
+            text_chars = len((info.text if info else page.get_text()).strip())  # type: ignore
+            coverage = info.image_coverage if info else page_image_coverage(page, xrefs)
+            vector_paths = len(page.get_cdrawings()) if text_chars < self.triage_config["min_text_chars"] else 0
+
+            mode = triage_page(text_chars, coverage, vector_paths, self.triage_config)
+            modes[mode] += 1
+            if mode == OCR_SKIP:
+                continue
+            metadata = {"source": pdf_path, "page": page_num, "type": "pdf_embedded_content", "ocr_mode": mode}
+            regions = self._image_regions(page, {img[0]: img[2] for img in page.get_images(full=True)})
+            if mode == OCR_FULL:
+                # scanned page: the scan's own resolution; outlined text: estimated glyph size
+                scan = max(regions, key=lambda region: abs(region[0]), default=None)
+                regions = [(page.rect, scan[1] if scan else 0.0)]
+            for clip, native_scale in regions:
+                zoom = self.render_zoom(clip, native_scale, info.glyph_height if info else 0.0)
+                pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, colorspace=fitz.csGRAY)
+                yield page_num, self._pixmap_to_array(pix), metadata
     
-    def extract_tables_from_pdf(self, pdf_path: str) -> List[Document]:
-        """Extract tables from a PDF using Camelot and return as Documents."""
+    def _table_page_groups(self, pages: List[PdfPage]) -> List[Tuple[List[int], str]]:
+        """
+        Pick a camelot flavor per page: lattice where ruling lines outline cells, stream
+        for borderless (aligned-column) tables. Consecutive pages with the same flavor are
+        grouped so each camelot call amortizes its setup.
+        """
+        group_size = max(1, self.tables_config["pages_per_group"])
+        groups: List[Tuple[List[int], str]] = []
+        for page in pages:
+            flavor = "lattice" if page.ruling_lines >= MIN_RULING_LINES else "stream"
+            if groups and groups[-1][1] == flavor and len(groups[-1][0]) < group_size:
+                groups[-1][0].append(page.number)
+            else:
+                groups.append(([page.number], flavor))
+        return groups
+
+    def _camelot_tables(self, pdf_path: str, pages: List[PdfPage],
+                        deadline: Optional[Deadline] = None) -> List[Tuple[int, str, dict]]:
+        """
+        Run camelot over `pages` in page groups: on the shared worker pool (processes; camelot
+        is CPU-bound) for PDFs with at least `parallel_min_pages` candidate pages, inline
+        otherwise. When `deadline` expires, groups that already finished are kept and the pool
+        is terminated, killing the groups still running. Groups the pool fails to run
+        (start-up, pickling or torn-down pool) are retried inline.
+        """
+        groups = self._table_page_groups(pages)
+        workers = min(self.tables_config["max_workers"], os.cpu_count() or 1)
+        results: List[Tuple[int, str, dict]] = []
+        inline = groups
+        if workers > 1 and len(groups) > 1 and len(pages) >= self.tables_config["parallel_min_pages"]:
+            try:
+                pool = get_table_pool(workers)
+                pending = [pool.apply_async(_camelot_group_worker, (pdf_path, group, flavor))
+                           for group, flavor in groups]
+            except Exception as e:
+                log.warning("Parallel table extraction unavailable, running inline", pdf_path=pdf_path, error=str(e))
+            else:
+                if not _wait_for_groups(pool, pending, deadline) and deadline is not None and deadline.hit:
+                    log.warning("Table extraction over budget, cancelling remaining page groups", pdf_path=pdf_path,
+                                finished=sum(r.ready() for r in pending), groups=len(groups))
+                    discard_table_pool(pool)  # camelot can't be interrupted otherwise
+                inline = []
+                for (group, flavor), result in zip(groups, pending):
+                    if not result.ready():
+                        inline.append((group, flavor))
+                        continue
+                    try:
+                        tables, error = result.get()
+                    except Exception as e:
+                        log.warning("Camelot pool failed on page group, retrying inline", pdf_path=pdf_path,
+                                    pages=group, error=str(e))
+                        inline.append((group, flavor))
+                        continue
+                    if error is not None:
+                        log.warning("Camelot failed on page group, skipped", pdf_path=pdf_path, pages=group,
+                                    flavor=flavor, error=error)
+                    results.extend(tables)
+        for group, flavor in inline:
+            if deadline is not None and deadline.expired():
+                log.warning("Table extraction over budget, skipping remaining page groups", pdf_path=pdf_path)
+                break
+            results.extend(_inline_group(pdf_path, group, flavor))
+        return results
+
+    def _pymupdf_tables(self, pdf_path: str, pages: List[PdfPage],
+                        deadline: Optional[Deadline] = None) -> Tuple[List[Tuple[int, str, dict]], List[PdfPage]]:
+        """
+        Find ruled tables with PyMuPDF's native table finder. Returns the accepted tables and
+        the pages it found nothing on (or only low-confidence tables), for the camelot fallback.
+        Borderless pages are left to camelot stream: find_tables' text strategy is several
+        times slower and merges surrounding prose into the grid.
+        """
+        min_confidence = self.tables_config["min_confidence"]
+        results: List[Tuple[int, str, dict]] = []
+        unresolved: List[PdfPage] = []
+        with fitz.open(pdf_path) as doc:
+            for page in pages:
+                if deadline is not None and deadline.expired():
+                    log.warning("PyMuPDF table finder over budget", pdf_path=pdf_path, page=page.number)
+                    break
+                if page.ruling_lines < MIN_RULING_LINES:
+                    unresolved.append(page)
+                    continue
+                try:
+                    tables = [t.extract() for t in doc[page.number - 1].find_tables(strategy="lines").tables]
+                except Exception as e:
+                    log.warning("PyMuPDF table finder failed", pdf_path=pdf_path, page=page.number, error=str(e))
+                    tables = []
+                scored = [(rows, table_confidence(rows)) for rows in tables]
+                if not scored or min(conf for _, conf in scored) < min_confidence:
+                    unresolved.append(page)
+                    continue
+                for rows, conf in scored:
+                    report = {"engine": TABLE_BACKEND_PYMUPDF, "confidence": round(conf, 3),
+                              "rows": len(rows), "cols": max(len(r) for r in rows), "page": str(page.number)}
+                    results.append((page.number, _rows_to_csv(rows), report))
+        return results, unresolved
+
+    def extract_tables_from_pdf(self, pdf_path: str, extraction: Optional[PdfExtraction] = None,
+                                deadline: Optional[Deadline] = None) -> List[Document]:
+        """
+        Extract tables from a PDF and return as Documents. Only pages that pass the fitz
+        pre-screen (see `utils.pdf_extractor.PdfPage.is_table_candidate`) are parsed.
+        The PyMuPDF engine runs first (config `tables.backend`); pages it misses or is
+        unsure about go to camelot, in parallel page groups with a per-page flavor.
+        """
         docs = []
         try:
-            # Try lattice first (works best for bordered tables), fallback to stream
-            tables = camelot.read_pdf(pdf_path, flavor="lattice", pages="all")
-            if len(tables) == 0:
-                tables = camelot.read_pdf(pdf_path, flavor="stream", pages="all")
-
-            for i, table in enumerate(tables):
-                df = table.df  # pandas DataFrame
-                if not df.empty:
-                    docs.append(
-                        Document(
-                            page_content=df.to_csv(index=False),
-                            metadata={
-                                "source": pdf_path,
-                                "type": "pdf_table",
-                                "table_index": i,
-                                "parsing_report": table.parsing_report,
-                            },
-                        )
+            extraction = extraction or extract_pdf(pdf_path)
+            pages = [p for p in extraction.pages if p.is_table_candidate or not self.tables_config["prescreen"]]
+
+            results: List[Tuple[int, str, dict]] = []
+            camelot_pages = pages
+            if self.tables_config["backend"] == TABLE_BACKEND_PYMUPDF:
+                results, unresolved = self._pymupdf_tables(pdf_path, pages, deadline)
+                camelot_pages = unresolved if self.tables_config["camelot_fallback"] else []
+            if camelot_pages and not (deadline is not None and deadline.expired()):
+                results.extend(self._camelot_tables(pdf_path, camelot_pages, deadline))
+
+            results.sort(key=lambda r: r[0])  # stable: keeps engine order within a page
+            for i, (page, csv_content, report) in enumerate(results):
+                docs.append(
+                    Document(
+                        page_content=csv_content,
+                        metadata={
+                            "source": pdf_path,
+                            "type": "pdf_table",
+                            "page": page,
+                            "table_index": i,
+                            "engine": report.get("engine", TABLE_BACKEND_CAMELOT),
+                            "parsing_report": report,
+                        },
                     )
+                )
+            log.info("PDF table extraction", pdf_path=pdf_path, pages=extraction.page_count,
+                     backend=self.tables_config["backend"], candidate_pages=len(pages),
+                     camelot_pages=len(camelot_pages), tables=len(docs))
         except Exception as e:
             log.error(f"Table extraction failed for {pdf_path}: {e}")
         return docs
     
-    def extract_images_from_docx(self, docx_path: str) -> List[Document]:
+    def extract_images_from_docx(self, docx_path: str, extraction: Optional[DocxExtraction] = None,
+                                 deadline: Optional[Deadline] = None) -> List[Document]:
         """Extract embedded images from DOCX and OCR them."""
         docs = []
         try:
-            doc = DocxDocument(docx_path)
-            for rel in doc.part.rels.values():
-                if "image" in rel.target_ref:
-                    try:
-                        doc_obj = self.process_embedded_image(
-                            rel.target_part.blob,
-                            {"source": docx_path, "type": "docx_embedded_image", "image_ref": rel.target_ref},
-                        )
-                        if doc_obj:
-                            docs.append(doc_obj)
-                    except Exception as e:
-                        log.error(f"Failed to process image from DOCX: {e}")
+            extraction = extraction or extract_docx(docx_path)
+            jobs = []
+            for rel_id, image_ref, blob in extraction.images:
+                try:
+                    image = self._decode_image(blob)
+                except Exception as e:
+                    image = None
+                    log.error(f"Failed to process image from DOCX: {e}")
+                if image is None:
+                    continue
+                jobs.append((rel_id, image,
+                             {"source": docx_path, "type": "docx_embedded_image", "image_ref": image_ref}))
+            docs = self._run_ocr_jobs(jobs, deadline)
+            self._flush_cache(docx_path)
         except Exception as e:
             log.error(f"Failed to extract from DOCX {docx_path}: {e}")
         return docs
 
-    def extract_tables_from_docx(self, docx_path: str) -> List[Document]:
+    def extract_tables_from_docx(self, docx_path: str, extraction: Optional[DocxExtraction] = None) -> List[Document]:
         docs = []
         try:
-            doc = DocxDocument(docx_path)
-            for table_idx, table in enumerate(doc.tables, start=1):
-                rows = []
-                for row in table.rows:
-                    cells = [cell.text.strip() for cell in row.cells]
-                    rows.append(cells)
-                csv_content = "\n".join([",".join(r) for r in rows])
+            extraction = extraction or extract_docx(docx_path)
+            for table_idx, rows in enumerate(extraction.tables, start=1):
                 docs.append(
                     Document(
-                        page_content=csv_content,
+                        page_content=_rows_to_csv(rows),
                         metadata={
                             "source": docx_path,
                             "type": "docx_table",
@@ -141,50 +661,47 @@ class EmbeddedContentExtractor:
             log.error(f"Failed to extract tables from DOCX {docx_path}: {e}")
         return docs
 
-    def extract_images_from_pptx(self, pptx_path: str) -> List[Document]:
+    def extract_images_from_pptx(self, pptx_path: str, extraction: Optional[PptxExtraction] = None,
+                                 deadline: Optional[Deadline] = None) -> List[Document]:
         """Extract embedded images from PPTX and OCR them."""
         docs = []
         try:
-            prs = Presentation(pptx_path)
-            for slide_num, slide in enumerate(prs.slides, start=1):
-                for shape in slide.shapes:
-                    if shape.shape_type == 13:  # Picture type
-                        try:
-                            doc_obj = self.process_embedded_image(
-                                shape.image.blob,
-                                {"source": pptx_path, "slide": slide_num, "type": "pptx_embedded_image"},
-                            )
-                            if doc_obj:
-                                docs.append(doc_obj)
-                        except Exception as e:
-                            log.error(f"Failed to process image from slide {slide_num}: {e}")
+            extraction = extraction or extract_pptx(pptx_path)
+            jobs = []
+            for slide in extraction.slides:
+                for shape_num, blob in slide.pictures:
+                    try:
+                        image = self._decode_image(blob)
+                    except Exception as e:
+                        image = None
+                        log.error(f"Failed to process image from slide {slide.number}: {e}")
+                    if image is None:
+                        continue
+                    jobs.append(((slide.number, shape_num), image,
+                                 {"source": pptx_path, "slide": slide.number, "type": "pptx_embedded_image"}))
+            docs = self._run_ocr_jobs(jobs, deadline)
+            self._flush_cache(pptx_path)
         except Exception as e:
             log.error(f"Failed to extract from PPTX {pptx_path}: {e}")
         return docs
     
-    def extract_tables_from_pptx(self, pptx_path: str) -> List[Document]:
+    def extract_tables_from_pptx(self, pptx_path: str, extraction: Optional[PptxExtraction] = None) -> List[Document]:
         docs = []
         try:
-            prs = Presentation(pptx_path)
-            for slide_num, slide in enumerate(prs.slides, start=1):
-                for shape_num, shape in enumerate(slide.shapes, start=1):
-                    if shape.has_table:
-                        table = shape.table
-                        rows = []
-                        for row in table.rows:
-                            rows.append([cell.text.strip() for cell in row.cells])
-                        csv_content = "\n".join([",".join(r) for r in rows])
-                        docs.append(
-                            Document(
-                                page_content=csv_content,
-                                metadata={
-                                    "source": pptx_path,
-                                    "slide": slide_num,
-                                    "type": "pptx_table",
-                                    "table_index": shape_num,
-                                },
-                            )
+            extraction = extraction or extract_pptx(pptx_path)
+            for slide in extraction.slides:
+                for shape_num, rows in slide.tables:
+                    docs.append(
+                        Document(
+                            page_content=_rows_to_csv(rows),
+                            metadata={
+                                "source": pptx_path,
+                                "slide": slide.number,
+                                "type": "pptx_table",
+                                "table_index": shape_num,
+                            },
                         )
+                    )
         except Exception as e:
             log.error(f"Failed to extract tables from PPTX {pptx_path}: {e}")
         return docs
\ No newline at end of file
@@ -0,0 +1,152 @@
+from __future__ import annotations
+import statistics
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import fitz  # PyMuPDF
+from langchain.schema import Document
+from logger import GLOBAL_LOGGER as log
+from exception.custom_exception import DocumentPortalException
+from utils.deadline import Deadline
+
+# Table pre-screen thresholds (points / counts)
+MIN_RULING_LENGTH = 15.0   # shorter strokes are glyph decoration, not cell borders
+MIN_RULING_LINES = 4       # a bordered table needs a few horizontal + vertical rules
+MIN_ALIGNED_ROWS = 3       # borderless table: rows sharing column starts
+COLUMN_GAP = 12.0          # horizontal gap between words that starts a new column
+COLUMN_BIN = 4.0           # x-position tolerance for column alignment
+ROW_TOLERANCE = 3.0        # baseline (y) tolerance for words on the same visual row
+
+
+@dataclass
+class PdfPage:
+    """Everything ingestion needs from one page, collected in a single visit."""
+    number: int                      # 1-based
+    text: str
+    width: float
+    height: float
+    image_xrefs: List[int] = field(default_factory=list)
+    image_coverage: float = 0.0      # fraction of the page area covered by images
+    ruling_lines: int = 0            # horizontal/vertical vector strokes (cell borders)
+    aligned_rows: int = 0            # text rows with >= 2 aligned column gaps
+    glyph_height: float = 0.0        # median word box height in points (0 = no text layer)
+
+    @property
+    def is_table_candidate(self) -> bool:
+        return self.ruling_lines >= MIN_RULING_LINES or self.aligned_rows >= MIN_ALIGNED_ROWS
+
+
+@dataclass
+class PdfExtraction:
+    source: str
+    page_count: int
+    metadata: Dict[str, Any]
+    pages: List[PdfPage]
+
+    @property
+    def table_candidate_pages(self) -> List[int]:
+        return [p.number for p in self.pages if p.is_table_candidate]
+
+    def text_documents(self) -> List[Document]:
+        """One Document per non-empty page (1-based `page`, like the OCR and table docs)."""
+        return [
+            Document(
+                page_content=p.text,
+                metadata={"source": self.source, "page": p.number, "total_pages": self.page_count, "type": "pdf_text"},
+            )
+            for p in self.pages
+            if p.text.strip()
+        ]
+
+
+def _count_ruling_lines(page: "fitz.Page") -> int:
+    count = 0
+    for path in page.get_drawings():
+        for item in path.get("items", ()):
+            if item[0] == "l":
+                p1, p2 = item[1], item[2]
+                dx, dy = abs(p1.x - p2.x), abs(p1.y - p2.y)
+                if (dy < 1.0 and dx >= MIN_RULING_LENGTH) or (dx < 1.0 and dy >= MIN_RULING_LENGTH):
+                    count += 1
+            elif item[0] == "re":
+                r = item[1]
+                if min(r.width, r.height) < 2.0 and max(r.width, r.height) >= MIN_RULING_LENGTH:
+                    count += 1  # thin filled rect used as a rule
+                elif r.width >= MIN_RULING_LENGTH and r.height >= MIN_RULING_LENGTH:
+                    count += 4  # stroked cell rectangle = 4 borders
+    return count
+
+
+def _count_aligned_rows(words: List[tuple]) -> int:
+    """Count text rows whose column starts (words after a wide gap) recur on other rows."""
+    rows: Dict[int, List[tuple]] = {}
+    for w in words:  # (x0, y0, x1, y1, word, block_no, line_no, word_no)
+        # group by baseline, not (block, line): cells are often emitted as separate blocks
+        rows.setdefault(round(w[3] / ROW_TOLERANCE), []).append(w)
+
+    row_columns: List[set] = []
+    for row in rows.values():
+        row.sort(key=lambda w: w[0])
+        starts = {round(nxt[0] / COLUMN_BIN) for prev, nxt in zip(row, row[1:]) if nxt[0] - prev[2] >= COLUMN_GAP}
+        if len(starts) >= 2:
+            row_columns.append(starts)
+    if len(row_columns) < MIN_ALIGNED_ROWS:
+        return 0
+
+    bins = Counter(b for starts in row_columns for b in starts)
+    shared = {b for b, n in bins.items() if n >= MIN_ALIGNED_ROWS}
+    return sum(1 for starts in row_columns if len(starts & shared) >= 2)
+
+
+def page_image_coverage(page: "fitz.Page", xrefs: List[int]) -> float:
+    page_area = abs(page.rect) or 1.0
+    covered = 0.0
+    for xref in xrefs:
+        for rect in page.get_image_rects(xref):
+            covered += abs(rect & page.rect)
+    return min(1.0, covered / page_area)
+
+
+def extract_pdf(pdf_path: str, deadline: Optional[Deadline] = None) -> PdfExtraction:
+    """
+    Open a PDF once and collect, per page: text, size, embedded image refs + coverage,
+    and table-candidate signals (ruling lines, aligned text columns).
+    Stops after the current page once `deadline` expires (`pages` then covers a prefix).
+    """
+    try:
+        pages: List[PdfPage] = []
+        with fitz.open(pdf_path) as doc:
+            if doc.is_encrypted:
+                raise ValueError(f"PDF is encrypted: {pdf_path}")
+            metadata = {k: v for k, v in (doc.metadata or {}).items() if v}
+            for page in doc:
+                if deadline is not None and deadline.expired():
+                    log.warning("PDF extraction over budget, keeping extracted pages", pdf_path=pdf_path,
+                                extracted=len(pages), pages=doc.page_count)
+                    break
+                xrefs = [img[0] for img in page.get_images(full=True)]
+                # one text layout per page, shared by the plain text and the word boxes
+                textpage = page.get_textpage(flags=fitz.TEXTFLAGS_TEXT)
+                words = page.get_text("words", textpage=textpage)  # type: ignore
+                pages.append(
+                    PdfPage(
+                        number=page.number + 1,
+                        text=page.get_text(textpage=textpage),  # type: ignore
+                        width=page.rect.width,
+                        height=page.rect.height,
+                        image_xrefs=xrefs,
+                        image_coverage=page_image_coverage(page, xrefs) if xrefs else 0.0,
+                        ruling_lines=_count_ruling_lines(page),
+                        aligned_rows=_count_aligned_rows(words),
+                        glyph_height=statistics.median(w[3] - w[1] for w in words) if words else 0.0,
+                    )
+                )
+            page_count = doc.page_count
+        extraction = PdfExtraction(source=pdf_path, page_count=page_count, metadata=metadata, pages=pages)
+        log.info("PDF extracted in single pass", pdf_path=pdf_path, pages=page_count,
+                 table_candidates=len(extraction.table_candidate_pages),
+                 pages_with_images=sum(1 for p in pages if p.image_xrefs))
+        return extraction
+    except Exception as e:
+        log.error("Failed to extract PDF", error=str(e), pdf_path=pdf_path)
+        raise DocumentPortalException(f"Could not extract PDF: {pdf_path}", e) from e
@@ -0,0 +1,90 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+from pptx.shapes.picture import Picture
+from langchain.schema import Document
+from logger import GLOBAL_LOGGER as log
+from exception.custom_exception import DocumentPortalException
+from utils.deadline import Deadline
+
+
+@dataclass
+class PptxSlide:
+    """Everything ingestion needs from one slide, collected in a single walk of its shapes."""
+    number: int                                                          # 1-based
+    text: str
+    notes: str = ""
+    tables: List[Tuple[int, List[List[str]]]] = field(default_factory=list)  # (shape index, rows)
+    pictures: List[Tuple[int, bytes]] = field(default_factory=list)          # (shape index, image blob)
+
+
+@dataclass
+class PptxExtraction:
+    source: str
+    metadata: Dict[str, Any]
+    slides: List[PptxSlide]
+
+    def text_documents(self) -> List[Document]:
+        """One Document per slide with text (speaker notes appended)."""
+        docs = []
+        for s in self.slides:
+            content = "\n\n".join(part for part in (s.text, s.notes) if part.strip())
+            if content:
+                docs.append(Document(
+                    page_content=content,
+                    metadata={"source": self.source, "slide": s.number, "total_slides": len(self.slides),
+                              "type": "pptx_text"},
+                ))
+        return docs
+
+
+def _walk_shapes(shapes) -> Iterator[Any]:
+    """Yield shapes depth-first, descending into groups."""
+    for shape in shapes:
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            yield from _walk_shapes(shape.shapes)
+        else:
+            yield shape
+
+
+def extract_pptx(pptx_path: str, deadline: Optional[Deadline] = None) -> PptxExtraction:
+    """
+    Open a deck once and collect, per slide: text frames, speaker notes, table cells
+    and picture blobs (for OCR), replacing separate text/image/table passes.
+    """
+    try:
+        prs = Presentation(pptx_path)
+        props = prs.core_properties
+        metadata = {k: v for k, v in {"title": props.title, "author": props.author, "subject": props.subject}.items() if v}
+        slides: List[PptxSlide] = []
+        for slide_num, slide in enumerate(prs.slides, start=1):
+            if deadline is not None and deadline.expired():
+                log.warning("PPTX extraction over budget, keeping extracted slides", pptx_path=pptx_path,
+                            extracted=len(slides), slides=len(prs.slides))
+                break
+            texts: List[str] = []
+            tables: List[Tuple[int, List[List[str]]]] = []
+            pictures: List[Tuple[int, bytes]] = []
+            for shape_num, shape in enumerate(_walk_shapes(slide.shapes), start=1):
+                if shape.has_text_frame and shape.text_frame.text.strip():
+                    texts.append(shape.text_frame.text.strip())
+                elif shape.has_table:
+                    tables.append((shape_num, [[cell.text.strip() for cell in row.cells] for row in shape.table.rows]))
+                elif isinstance(shape, Picture):
+                    try:
+                        pictures.append((shape_num, shape.image.blob))
+                    except Exception as e:  # linked (not embedded) pictures have no blob
+                        log.warning("Skipping picture without embedded image", slide=slide_num, error=str(e))
+            notes = ""
+            if slide.has_notes_slide and slide.notes_slide.notes_text_frame is not None:
+                notes = slide.notes_slide.notes_text_frame.text.strip()
+            slides.append(PptxSlide(number=slide_num, text="\n".join(texts), notes=notes, tables=tables, pictures=pictures))
+        extraction = PptxExtraction(source=pptx_path, metadata=metadata, slides=slides)
+        log.info("PPTX extracted in single pass", pptx_path=pptx_path, slides=len(slides),
+                 tables=sum(len(s.tables) for s in slides), pictures=sum(len(s.pictures) for s in slides))
+        return extraction
+    except Exception as e:
+        log.error("Failed to extract PPTX", error=str(e), pptx_path=pptx_path)
+        raise DocumentPortalException(f"Could not extract PPTX: {pptx_path}", e) from e
@@ -1 +1 @@
-SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt", ".ppt", ".md", ".xlsx", ".csv", ".jpeg", ".jpg", ".png"}
\ No newline at end of file
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt", ".ppt", ".pptx", ".md", ".xlsx", ".csv", ".jpeg", ".jpg", ".png"}
\ No newline at end of file